@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for pl_curve.py using seeded synthetic abundance tables.
+
+Each table has log-normal or power law (Pareto) abundances with a chosen
+fraction of zeros, normalised so every sample sums to 1. The time of each
+stage (calculate_gini, remove_zeros, sort_bins, process_samples) and of the
+whole run() is measured for every table size in the chosen scale.
+
+Results can be saved as a baseline and later runs compared against it, any
+stage which is slower than the baseline by more than the threshold is
+reported as a regression and the exit status is 1.
+
+Usage:
+    python benchmarks/benchmark.py                   # quick, small tables
+    python benchmarks/benchmark.py --scale large     # up to 10^6 bins
+    python benchmarks/benchmark.py --save-baseline   # store the results
+    python benchmarks/benchmark.py --threshold 0.5   # allow 50% slower
+"""
+
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+import pl_curve  # noqa: E402
+
+
+# (bins, samples) for each scale, tables bigger than --max-cells are skipped
+SCALES = {
+    'small': [(100, 1), (100, 10), (1000, 10), (10000, 10)],
+    'medium': [(100, 1000), (1000, 100), (10000, 100), (100000, 10)],
+    'large': [(100, 10000), (10000, 1000), (100000, 100), (1000000, 1),
+              (1000000, 10)],
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'baseline.json')
+
+
+def generate_abundances(bins, samples, distribution='lognormal',
+                        sparsity=0.0, seed=0):
+    '''
+    Makes a synthetic table of relative abundances
+
+    Parameters
+    ----------
+    bins
+        Number of bins (rows)
+    samples
+        Number of samples (columns)
+    distribution
+        'lognormal' or 'powerlaw' (Pareto with shape 1.5)
+    sparsity
+        Fraction of the values to set to zero
+    seed
+        Seed for the random number generator, the same seed always gives
+        the same table
+
+    Returns
+    -------
+    numpy.ndarray
+        A bins x samples array where each column sums to 1
+    '''
+    rng = np.random.default_rng(seed)
+    if distribution == 'lognormal':
+        values = rng.lognormal(mean=0.0, sigma=2.0, size=(bins, samples))
+    elif distribution == 'powerlaw':
+        values = rng.pareto(1.5, size=(bins, samples)) + 1e-12
+    else:
+        raise ValueError("Unknown distribution: " + str(distribution))
+
+    if sparsity > 0:
+        values[rng.random((bins, samples)) < sparsity] = 0
+        # every sample needs something in it
+        values[0, values.sum(axis=0) == 0] = 1.0
+
+    return values / values.sum(axis=0)
+
+
+def generate_dataframe(bins, samples, distribution='lognormal', sparsity=0.0,
+                       seed=0):
+    '''
+    Makes a synthetic table as a dataframe laid out like an input file
+    '''
+    values = generate_abundances(bins, samples, distribution, sparsity, seed)
+    return pl_curve.pd.DataFrame(
+        values, index=pl_curve.pd.Index(np.arange(bins), name='Bin'),
+        columns=['Sample ' + str(i) for i in range(samples)])
+
+
+def best_time(function, repeats):
+    '''the quickest of several runs of function, in seconds'''
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_table(bins, samples, distribution, sparsity, repeats,
+                    directory):
+    '''
+    Times each stage on one synthetic table
+
+    Returns
+    -------
+    dict
+        Stage name to the best time in seconds
+    '''
+    dataframe = generate_dataframe(bins, samples, distribution, sparsity)
+    cleaned = pl_curve.remove_zeros(dataframe)
+    first = cleaned.iloc[:, 0]
+
+    results = {
+        'calculate_gini': best_time(
+            lambda: pl_curve.calculate_gini(first), repeats),
+        'remove_zeros': best_time(
+            lambda: pl_curve.remove_zeros(dataframe), repeats),
+        'sort_bins': best_time(lambda: pl_curve.sort_bins(cleaned), repeats),
+        'process_samples': best_time(
+            lambda: pl_curve.process_samples(cleaned), repeats),
+    }
+
+    input_file = os.path.join(directory, 'input.tsv')
+    dataframe.to_csv(input_file, sep='\t')
+    output_file = os.path.join(directory, 'output.tsv')
+    # the graph is left out as its cost depends on matplotlib not pl_curve
+    results['run'] = best_time(
+        lambda: pl_curve.run(input_file, None, output_file), repeats)
+    return results
+
+
+def run_benchmarks(scale, distributions, sparsities, repeats, max_cells):
+    '''
+    Times every stage for every table size, distribution and sparsity
+
+    Returns
+    -------
+    dict
+        Benchmark name ("stage/bins x samples/distribution/sparsity") to the
+        best time in seconds
+    '''
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for bins, samples in SCALES[scale]:
+            if bins * samples > max_cells:
+                print("skipping", bins, "x", samples, "as it is over",
+                      max_cells, "cells")
+                continue
+            for distribution in distributions:
+                for sparsity in sparsities:
+                    name = "{}x{}/{}/{}".format(bins, samples, distribution,
+                                                sparsity)
+                    # stop pl_curve printing its results for every run
+                    stdout = sys.stdout
+                    sys.stdout = open(os.devnull, 'w')
+                    try:
+                        times = benchmark_table(bins, samples, distribution,
+                                                sparsity, repeats, directory)
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                    for stage, seconds in times.items():
+                        results[stage + '/' + name] = seconds
+                        print("{:<50} {:10.6f}s".format(stage + '/' + name,
+                                                        seconds))
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+    Finds the benchmarks which are slower than the baseline by more than
+    threshold (a fraction, e.g. 0.25 for 25%)
+
+    Returns
+    -------
+    list
+        (name, baseline seconds, new seconds) for each regression
+    '''
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        if name in baseline and seconds > baseline[name] * (1 + threshold):
+            regressions.append((name, baseline[name], seconds))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--distribution', action='append',
+                        choices=['lognormal', 'powerlaw'],
+                        help='can be given more than once, default both')
+    parser.add_argument('--sparsity', action='append', type=float,
+                        help='fraction of zeros, can be given more than '
+                        'once, default 0 and 0.95')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='the best of this many runs is kept')
+    parser.add_argument('--max-cells', type=float, default=1e8,
+                        help='skip tables with more bins x samples than this')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='baseline results file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='save the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fraction slower than the baseline which '
+                        'counts as a regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scale,
+                             args.distribution or ['lognormal', 'powerlaw'],
+                             args.sparsity or [0.0, 0.95], args.repeats,
+                             args.max_cells)
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print("Saved baseline to", args.baseline)
+    elif baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print("REGRESSION {}: {:.6f}s -> {:.6f}s ({:+.0%})".format(
+                name, old, new, new / old - 1))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
@@ -26,27 +26,68 @@ in Frontiers in Microbiology 21 June 2016
 """
 
 
+import os
 import sys
+import csv
+import json
+import shutil
+import hashlib
+import glob
+import time
 import argparse
 import math
-import pandas as pd
+import random
+import re
+import zlib
+import tempfile
+import importlib
+import tracemalloc
+import io
+import base64
+import signal
+import urllib.parse
+from http import HTTPStatus
+from contextlib import contextmanager
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-# note matplotlib.use('Agg') has to be done before any other matplotlib related
-# stuff including importing pyplot. This sets the backend to make a PNG file.
 
 
-def calculate_gini(data):
+class _LazyModule:
+    '''
+    Stands in for a module and only imports it when one of its attributes is
+    first used. Importing pandas takes a large part of the start up time and
+    runs which don't need it shouldn't pay for it.
+    '''
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+pd = _LazyModule('pandas')
+asyncio = _LazyModule('asyncio')
+
+
+def calculate_gini(data, method='sort'):
     '''calculates the gini coefficient.
-    This code is based on:
+    The default method sorts the data and uses the closed form of the mean
+    absolute difference on the ranked values, which is O(n log n) in time and
+    O(n) in memory. The 'outer' method is the original reference
+    implementation and is based on:
     stackoverflow.com/questions/39512260/calculating-gini-coefficient-in-python-numpy/39513799
 
     Parameters
     ----------
     data
         the list of data to calculate the gini coefficient on
+    method
+        'sort' (the default) or 'outer' for the O(n**2) reference version
 
     Returns
     -------
@@ -54,16 +95,61 @@ def calculate_gini(data):
         The gini coefficient for this data
 
     '''
-    # (Warning: This is a concise implementation, but it is O(n**2)
-    # in time and memory, where n = len(x).  *Don't* pass in huge
-    # samples!)
+    data = np.asarray(data, dtype=np.float64)
 
     # don't attempt to compute an empty list, just return NaN instead
     if data.size == 0:
         return math.nan
 
+    if method == 'sort':
+        return gini_from_sorted(np.sort(data)[::-1])
+    elif method == 'outer':
+        return _calculate_gini_outer(data)
+    else:
+        raise ValueError("Unknown gini method: " + str(method))
+
+
+def gini_from_sorted(data):
+    '''calculates the gini coefficient of data already sorted in descending
+    order, as produced by sort_bins.
+
+    For descending values x_1 >= x_2 >= ... >= x_n the mean absolute
+    difference reduces to a weighted sum of the ranked values, giving
+    G = sum((n + 1 - 2i) * x_i) / (n * sum(x))
+
+    Parameters
+    ----------
+    data
+        the values to calculate the gini coefficient on, largest first
+
+    Returns
+    -------
+    float64
+        The gini coefficient for this data
+    '''
+    data = np.asarray(data, dtype=np.float64)
+    n = data.size
+    if n == 0:
+        return math.nan
+
+    total = data.sum()
+    if total == 0:
+        return math.nan
+
+    weights = n + 1 - 2 * np.arange(1, n + 1, dtype=np.float64)
+    return float(np.dot(weights, data) / (n * total))
+
+
+def _calculate_gini_outer(data):
+    '''
+    The original O(n**2) gini calculation, kept as a reference to check the
+    sort based version against.
+    (Warning: This is a concise implementation, but it is O(n**2)
+    in time and memory, where n = len(x).  *Don't* pass in huge
+    samples!)
+    '''
     # Mean absolute difference
-    mad = np.abs(np.subtract.outer(np.array(data), np.array(data))).mean()
+    mad = np.abs(np.subtract.outer(data, data)).mean()
     # Relative mean absolute difference
     rmad = mad / np.mean(data)
     # Gini coefficient
@@ -71,9 +157,410 @@ def calculate_gini(data):
     return gini
 
 
+class _TreapNode:
+    '''
+    A node of the treap used by IncrementalGini. Each node holds one distinct
+    abundance and how many bins have it, along with the number of bins and
+    total abundance of its whole subtree.
+    '''
+    __slots__ = ('value', 'count', 'priority', 'left', 'right', 'size',
+                 'total')
+
+    def __init__(self, value):
+        self.value = value
+        self.count = 1
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.size = 1
+        self.total = value
+
+
+def _treap_update(node):
+    '''recalculates the size and total of a node from its children'''
+    node.size = node.count
+    node.total = node.value * node.count
+    for child in (node.left, node.right):
+        if child is not None:
+            node.size += child.size
+            node.total += child.total
+
+
+def _treap_insert(node, value):
+    '''adds one copy of value to the treap, returns the new root'''
+    if node is None:
+        return _TreapNode(value)
+    if value == node.value:
+        node.count += 1
+    elif value < node.value:
+        node.left = _treap_insert(node.left, value)
+        if node.left.priority > node.priority:
+            # rotate right
+            child = node.left
+            node.left = child.right
+            child.right = node
+            _treap_update(node)
+            node = child
+    else:
+        node.right = _treap_insert(node.right, value)
+        if node.right.priority > node.priority:
+            # rotate left
+            child = node.right
+            node.right = child.left
+            child.left = node
+            _treap_update(node)
+            node = child
+    _treap_update(node)
+    return node
+
+
+def _treap_merge(left, right):
+    '''joins two treaps where everything in left is smaller than right'''
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _treap_merge(left.right, right)
+        _treap_update(left)
+        return left
+    right.left = _treap_merge(left, right.left)
+    _treap_update(right)
+    return right
+
+
+def _treap_remove(node, value):
+    '''removes one copy of value from the treap, returns the new root'''
+    if value == node.value:
+        node.count -= 1
+        if node.count == 0:
+            return _treap_merge(node.left, node.right)
+    elif value < node.value:
+        node.left = _treap_remove(node.left, value)
+    else:
+        node.right = _treap_remove(node.right, value)
+    _treap_update(node)
+    return node
+
+
+def _treap_rank(node, value):
+    '''the number and total of the values less than or equal to value'''
+    count = 0
+    total = 0.0
+    while node is not None:
+        if value < node.value:
+            node = node.left
+        else:
+            count += node.count
+            total += node.value * node.count
+            if node.left is not None:
+                count += node.left.size
+                total += node.left.total
+            if value == node.value:
+                break
+            node = node.right
+    return count, total
+
+
+class IncrementalGini:
+    '''
+    Keeps the gini coefficient of a sample up to date as the abundance of
+    its bins change, without recalculating it from scratch.
+
+    The abundances are kept in a treap (a randomised balanced binary search
+    tree) which also tracks the number and total abundance of each subtree.
+    That gives the rank of any abundance in O(log n), which is all that is
+    needed to update the rank weighted sum that gini_from_sorted uses. So
+    inserting, updating and removing a bin takes O(log n) and the gini
+    coefficient is available in O(1).
+    '''
+
+    def __init__(self, abundances=None):
+        '''
+        Parameters
+        ----------
+        abundances
+            Optional dictionary of bin name to abundance to start with
+        '''
+        self._root = None
+        self._bins = {}
+        self._total = 0.0
+        # sum of each abundance multiplied by its rank, smallest first
+        self._ranked = 0.0
+        if abundances is not None:
+            for name, abundance in abundances.items():
+                self.insert(name, abundance)
+
+    def __len__(self):
+        return len(self._bins)
+
+    def __contains__(self, name):
+        return name in self._bins
+
+    def __getitem__(self, name):
+        return self._bins[name]
+
+    def _add(self, value):
+        '''adds an abundance, the new copy goes after any equal ones'''
+        count, total = _treap_rank(self._root, value)
+        # everything bigger than value moves up one rank
+        self._ranked += (count + 1) * value + (self._total - total)
+        self._total += value
+        self._root = _treap_insert(self._root, value)
+
+    def _subtract(self, value):
+        '''removes an abundance, taking the last of any equal copies'''
+        count, total = _treap_rank(self._root, value)
+        self._ranked -= count * value + (self._total - total)
+        self._total -= value
+        self._root = _treap_remove(self._root, value)
+
+    def insert(self, name, abundance):
+        '''
+        Adds a new bin
+
+        Parameters
+        ----------
+        name
+            The name of the bin, it mustn't already be in the sample
+        abundance
+            The abundance of the bin
+        '''
+        if name in self._bins:
+            raise ValueError("Bin " + str(name) + " is already in the sample")
+        abundance = float(abundance)
+        self._add(abundance)
+        self._bins[name] = abundance
+
+    def update(self, name, abundance):
+        '''
+        Changes the abundance of a bin already in the sample
+
+        Parameters
+        ----------
+        name
+            The name of the bin
+        abundance
+            The new abundance of the bin
+        '''
+        old = self._bins[name]
+        abundance = float(abundance)
+        self._subtract(old)
+        self._add(abundance)
+        self._bins[name] = abundance
+
+    def remove(self, name):
+        '''
+        Removes a bin from the sample
+
+        Parameters
+        ----------
+        name
+            The name of the bin
+        '''
+        self._subtract(self._bins.pop(name))
+        if not self._bins:
+            # start again from exact zeros so rounding errors don't build up
+            self._total = 0.0
+            self._ranked = 0.0
+
+    @property
+    def n(self):
+        '''the number of bins'''
+        return len(self._bins)
+
+    @property
+    def gini(self):
+        '''the gini coefficient, the same as calculate_gini would give'''
+        n = len(self._bins)
+        if n == 0 or self._total == 0:
+            return math.nan
+        return (2 * self._ranked - (n + 1) * self._total) / (n * self._total)
+
+    @property
+    def corrected_gini(self):
+        '''the gini coefficient corrected for the number of bins'''
+        n = len(self._bins)
+        if n < 2:
+            return math.nan
+        return self.gini * (n / (n - 1))
+
+    def lorenz(self):
+        '''
+        Makes the Pareto-Lorenz curve of the sample, this takes O(n)
+
+        Returns
+        -------
+        tuple
+            The cumulative proportion of bins and the cumulative relative
+            abundance, largest bin first
+        '''
+        # walk the treap largest value first
+        values = []
+        counts = []
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.right
+            else:
+                node = stack.pop()
+                values.append(node.value)
+                counts.append(node.count)
+                node = node.left
+
+        values = np.repeat(np.array(values, dtype=np.float64), counts)
+        n = len(values)
+        return np.arange(1, n + 1) / n, np.cumsum(values) / self._total
+
+
+# how far a column's total can be from 1, floating point representation
+# means relative abundances rarely add up to exactly 1
+TOTAL_TOLERANCE = 0.0001
+
+# what column_report finds out about every column of a table
+ColumnReport = namedtuple('ColumnReport',
+                          ['samples', 'totals', 'nans', 'negatives'])
+
+
+def column_report(samples, values):
+    '''
+    Finds the total, number of missing values and number of negative values
+    of every column of a table in one go
+
+    Parameters
+    ----------
+    samples
+        The name of each column
+    values
+        2D numpy array with one row per bin and one column per sample
+
+    Returns
+    -------
+    ColumnReport
+        The sample names and the total, missing and negative count of each,
+        totals leave out missing values
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    return ColumnReport(list(samples), np.nansum(values, axis=0),
+                        np.isnan(values).sum(axis=0),
+                        (values < 0).sum(axis=0))
+
+
+def invalid_columns(report):
+    '''
+    Finds the columns which don't sum to 1 or have missing or negative values
+
+    Parameters
+    ----------
+    report
+        The ColumnReport to check
+
+    Returns
+    -------
+    numpy.ndarray
+        Boolean array marking the invalid columns
+    '''
+    totals = np.asarray(report.totals, dtype=np.float64)
+    return ((np.abs(totals - 1) > TOTAL_TOLERANCE) |
+            (np.asarray(report.nans) > 0) | (np.asarray(report.negatives) > 0))
+
+
+def format_column_report(report, only_invalid=False):
+    '''
+    Describes each column of a ColumnReport, one line per column
+
+    Parameters
+    ----------
+    report
+        The ColumnReport to describe
+    only_invalid
+        Only describe the columns which are invalid
+
+    Returns
+    -------
+    list
+        A line for each column
+    '''
+    invalid = invalid_columns(report)
+    lines = []
+    for i, title in enumerate(report.samples):
+        if only_invalid and not invalid[i]:
+            continue
+        total = report.totals[i]
+        lines.append("{}: total {:f} ({:+f}), {} missing, {} negative{}"
+                     .format(title, total, total - 1, report.nans[i],
+                             report.negatives[i],
+                             ", invalid" if invalid[i] else ""))
+    return lines
+
+
+def check_report(report):
+    '''
+    Checks every column in a ColumnReport is valid
+
+    Parameters
+    ----------
+    report
+        The ColumnReport to check
+
+    Raises
+    ------
+    ValueError
+        Listing every invalid column, if there are any
+    '''
+    if invalid_columns(report).any():
+        raise ValueError("\n".join(["columns don't sum to 1"] +
+                                   format_column_report(report, True)))
+
+
+def normalise_columns(values, totals=None):
+    '''
+    Divides every column by its total, turning read counts into relative
+    abundances
+
+    Parameters
+    ----------
+    values
+        2D numpy array or data frame with one column per sample
+    totals
+        The total of each column, calculated if not given
+
+    Returns
+    -------
+    numpy.ndarray or pandas.core.frame.DataFrame
+        The values divided by their column totals, empty columns become NaN
+    '''
+    if totals is None:
+        totals = np.nansum(np.asarray(values, dtype=np.float64), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return values / np.asarray(totals, dtype=np.float64)
+
+
+def normalised_report(report):
+    '''
+    Works out the ColumnReport of a table after normalise_columns, without
+    going through the table again
+
+    Parameters
+    ----------
+    report
+        The ColumnReport of the table before it was normalised
+
+    Returns
+    -------
+    ColumnReport
+        The same report with every non-empty column totalling 1
+    '''
+    totals = np.asarray(report.totals, dtype=np.float64)
+    return report._replace(totals=(totals != 0).astype(np.float64))
+
+
 def check_columns(dataframe):
     '''
-    Checks all columns in the data frame sum to 1
+    Checks all columns in the data frame sum to 1 and have no missing or
+    negative values
 
     Parameters
     ----------
@@ -85,13 +572,9 @@ def check_columns(dataframe):
     Bool
         False if a column doesn't sum to 1, True if they all do
     '''
-    for col in dataframe.columns:
-        total = sum(dataframe.loc[:, col])
-        # print(col, "total=", total)
-        if total < 0.9999 or total > 1.0001:
-            # print("Error column ", col, "doesn't sum to 1.0")
-            return False
-    return True
+    report = column_report(dataframe.columns,
+                           dataframe.to_numpy(dtype=np.float64))
+    return not invalid_columns(report).any()
 
 
 def remove_zeros(dataframe):
@@ -109,13 +592,324 @@ def remove_zeros(dataframe):
        The dataframe with all zero rows removed
     '''
 
-    for row_index in dataframe.index:
-        total = sum(dataframe.loc[row_index])
-        if total == 0:
-            # print("removing bin", row_index, "as its empty")
-            dataframe = dataframe.drop(row_index)
+    # skipna=False keeps rows with missing values, as the built in sum would
+    return dataframe[dataframe.sum(axis=1, skipna=False).to_numpy() != 0]
 
-    return dataframe
+
+# cumulative relative abundances above this are treated as having reached 1,
+# floating point representation means it might not be exactly 1
+CUMULATIVE_THRESHOLD = 0.999999
+
+
+def sort_matrix(values):
+    '''
+    Sorts every column of a bins x samples matrix in descending order
+
+    Parameters
+    ----------
+    values
+        2D numpy array with one row per bin and one column per sample
+
+    Returns
+    -------
+    tuple
+        The sorted matrix and the matrix of row indices that sorts each column
+    '''
+    order = np.argsort(-values, axis=0, kind='stable')
+    return np.take_along_axis(values, order, axis=0), order
+
+
+def cumulative_matrix(sorted_values):
+    '''
+    Calculates the cumulative relative abundance down each column
+
+    Parameters
+    ----------
+    sorted_values
+        2D numpy array of sorted abundances, one column per sample
+
+    Returns
+    -------
+    numpy.ndarray
+        The cumulative sum of each column
+    '''
+    return np.cumsum(sorted_values, axis=0)
+
+
+def cutoff_lengths(cumulative):
+    '''
+    Finds how many rows of each column to keep, this is everything up to and
+    including the first row where the cumulative abundance reaches 1
+
+    Parameters
+    ----------
+    cumulative
+        1D or 2D numpy array of cumulative abundances, one column per sample
+
+    Returns
+    -------
+    numpy.ndarray
+        The number of rows to keep for each column
+    '''
+    over = cumulative > CUMULATIVE_THRESHOLD
+    # argmax finds the first True, columns that never reach 1 are kept whole
+    return np.where(over.any(axis=0), over.argmax(axis=0) + 1,
+                    cumulative.shape[0])
+
+
+def process_matrix(values, jobs=1):
+    '''
+    Runs the sort, cumulative sum and cut off stages on a whole bins x samples
+    matrix at once
+
+    Parameters
+    ----------
+    values
+        2D numpy array with one row per bin and one column per sample
+    jobs
+        Number of processes to spread the samples over
+
+    Returns
+    -------
+    tuple
+        The sorted values, the sort order, the cumulative relative abundance
+        and the number of rows to keep for each sample
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if jobs > 1 and values.shape[1] > 1:
+        return _process_matrix_parallel(values, jobs)
+    sorted_values, order = sort_matrix(values)
+    cumulative = cumulative_matrix(sorted_values)
+    lengths = cutoff_lengths(cumulative)
+    return sorted_values, order, cumulative, lengths
+
+
+# shared memory arrays attached to by each worker process
+_shared_arrays = {}
+
+
+def _attach_shared_arrays(specs):
+    '''
+    Process pool initialiser, maps the shared memory blocks described by specs
+    (name -> (shared memory name, shape, dtype)) into numpy arrays
+    '''
+    from multiprocessing import shared_memory
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        _shared_arrays[key] = (block, np.ndarray(shape, dtype=dtype,
+                                                 buffer=block.buf))
+
+
+def _process_shared_columns(bounds):
+    '''
+    Runs process_matrix on a block of columns of the shared input matrix and
+    writes the results into the shared output matrices
+    '''
+    start, stop = bounds
+    values = _shared_arrays['values'][1][:, start:stop]
+    sorted_values, order, cumulative, lengths = process_matrix(values)
+    _shared_arrays['sorted'][1][:, start:stop] = sorted_values
+    _shared_arrays['order'][1][:, start:stop] = order
+    _shared_arrays['cumulative'][1][:, start:stop] = cumulative
+    return lengths
+
+
+def _process_matrix_parallel(values, jobs):
+    '''
+    process_matrix spread over a pool of processes. The input and output
+    matrices live in shared memory so workers only receive column ranges and
+    only send back the cut off lengths.
+    '''
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        # shared memory needs python 3.8, fall back to a single process
+        return process_matrix(values)
+
+    dtypes = {'values': np.float64, 'sorted': np.float64,
+              'order': np.intp, 'cumulative': np.float64}
+    blocks = {}
+    arrays = {}
+    try:
+        for key, dtype in dtypes.items():
+            size = max(values.size * np.dtype(dtype).itemsize, 1)
+            blocks[key] = shared_memory.SharedMemory(create=True, size=size)
+            arrays[key] = np.ndarray(values.shape, dtype=dtype,
+                                     buffer=blocks[key].buf)
+        arrays['values'][:] = values
+
+        specs = {key: (blocks[key].name, values.shape, dtypes[key])
+                 for key in dtypes}
+        # several column blocks per worker to even out the load
+        columns = np.array_split(np.arange(values.shape[1]), jobs * 4)
+        bounds = [(int(c[0]), int(c[-1]) + 1) for c in columns if c.size]
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_attach_shared_arrays,
+                                 initargs=(specs,)) as pool:
+            # map returns results in the same order as the columns
+            lengths = np.concatenate(list(pool.map(_process_shared_columns,
+                                                   bounds)))
+
+        return (arrays['sorted'].copy(), arrays['order'].copy(),
+                arrays['cumulative'].copy(), lengths)
+    finally:
+        arrays.clear()
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+def matrix_gini(sorted_values, lengths):
+    '''
+    Calculates the gini coefficient of every sample from the output of
+    process_matrix, using the same closed form as gini_from_sorted on the
+    rows kept for each sample
+
+    Parameters
+    ----------
+    sorted_values
+        2D numpy array of abundances sorted largest first, one column per
+        sample
+    lengths
+        The number of rows to keep for each sample
+
+    Returns
+    -------
+    numpy.ndarray
+        The gini coefficient of each sample, NaN for empty samples
+    '''
+    ranks = np.arange(1, sorted_values.shape[0] + 1,
+                      dtype=np.float64)[:, np.newaxis]
+    kept = ranks <= lengths
+    totals = np.where(kept, sorted_values, 0.0).sum(axis=0)
+    ranked = np.where(kept, ranks * sorted_values, 0.0).sum(axis=0)
+    n = np.asarray(lengths, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gini = ((n + 1) * totals - 2 * ranked) / (n * totals)
+    return np.where(totals == 0, np.nan, gini)
+
+
+# the evenness indices matrix_evenness can add to the output and their
+# column names
+EVENNESS_INDICES = {'shannon': 'Shannon', 'simpson': 'Simpson',
+                    'pielou': 'Pielou', 'theil': 'Theil',
+                    'pareto': 'Pareto 80%'}
+# the share of the total abundance the Pareto point is found for
+PARETO_ABUNDANCE = 0.8
+
+
+def parse_evenness_indices(text):
+    '''
+    Turns a comma separated list of index names, or "all", into a list of
+    keys of EVENNESS_INDICES
+
+    Raises
+    ------
+    ValueError
+        If any of the names isn't an index
+    '''
+    if text.strip().lower() == 'all':
+        return list(EVENNESS_INDICES)
+    indices = [name.strip().lower() for name in text.split(',')
+               if name.strip()]
+    unknown = [name for name in indices if name not in EVENNESS_INDICES]
+    if unknown:
+        raise ValueError("unknown evenness indices: " + ", ".join(unknown) +
+                         ", choose from " + ", ".join(EVENNESS_INDICES))
+    return indices
+
+
+def matrix_evenness(sorted_values, cumulative, lengths,
+                    indices=tuple(EVENNESS_INDICES)):
+    '''
+    Calculates evenness indices of every sample from the output of
+    process_matrix, reusing its sorted values and cumulative sums. The
+    abundances kept for each sample are divided by their total first.
+
+    shannon is the Shannon entropy -sum(p ln p), simpson the Gini-Simpson
+    index 1 - sum(p^2), pielou Shannon divided by the log of the number of
+    non-zero bins, theil the Theil T index ln(n) - Shannon over the same n
+    bins as the Gini and pareto the proportion of bins holding
+    PARETO_ABUNDANCE of the abundance, read off the curve by linear
+    interpolation.
+
+    Parameters
+    ----------
+    sorted_values
+        2D numpy array of abundances sorted largest first, one column per
+        sample
+    cumulative
+        The cumulative sum of each column of sorted_values
+    lengths
+        The number of rows to keep for each sample
+    indices
+        Keys of EVENNESS_INDICES to calculate
+
+    Returns
+    -------
+    dict
+        An array with the index of each sample for each column name, in the
+        order of indices. Empty samples give NaN.
+    '''
+    n = np.asarray(lengths, dtype=np.int64)
+    columns = np.arange(sorted_values.shape[1])
+    kept = np.arange(sorted_values.shape[0])[:, np.newaxis] < n
+    totals = np.where(n > 0, cumulative[np.maximum(n - 1, 0), columns], 0.0)
+    empty = totals <= 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = np.where(kept, sorted_values / totals, 0.0)
+        shannon = -np.where(p > 0, p * np.log(p), 0.0).sum(axis=0)
+        richness = (p > 0).sum(axis=0)
+        values = {
+            'shannon': shannon,
+            'simpson': 1 - (p * p).sum(axis=0),
+            'pielou': np.where(richness > 1,
+                               shannon / np.log(richness), np.nan),
+            'theil': np.log(n) - shannon}
+
+        if 'pareto' in indices:
+            # the first row reaching the target and the cumulative sum before
+            # it, the curve is a straight line between the two
+            target = PARETO_ABUNDANCE * totals
+            row = (kept & (cumulative >= target)).argmax(axis=0)
+            before = np.where(row > 0,
+                              cumulative[np.maximum(row - 1, 0), columns],
+                              0.0)
+            step = sorted_values[row, columns]
+            values['pareto'] = (row + (target - before) / step) / n
+
+    return {EVENNESS_INDICES[name]: np.where(empty, np.nan, values[name])
+            for name in indices}
+
+
+def build_samples(dataframe, sorted_values, order, cumulative, lengths):
+    '''
+    Turns the output of process_matrix back into one dataframe per sample
+
+    Parameters
+    ----------
+    dataframe
+        The data frame process_matrix was run on, used for bin and sample names
+    sorted_values, order, cumulative, lengths
+        The output of process_matrix
+
+    Returns
+    -------
+    list
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Rel Abund and Cum Prop TRFs.
+    '''
+    samples = []
+    for i, title in enumerate(dataframe.columns):
+        length = int(lengths[i])
+        sample = pd.DataFrame(
+            {title: sorted_values[:length, i],
+             'Cum Rel Abund': cumulative[:length, i],
+             'Cum Prop TRFs': np.arange(1, length + 1) / length},
+            index=dataframe.index[order[:length, i]])
+        samples.append(sample)
+    return samples
 
 
 def sort_bins(dataframe):
@@ -133,14 +927,13 @@ def sort_bins(dataframe):
         A list of dataframes, each dataframe contains a single sample
     '''
 
+    sorted_values, order = sort_matrix(dataframe.to_numpy(dtype=np.float64))
+
     # split each column into its own dataframe
     samples = []
-
-    for col in dataframe.columns:
-
-        # sort the bins in descending order, convert result to a new dataframe
-        data = dataframe.loc[:, col].sort_values(ascending=False).to_frame()
-        samples.append(data)
+    for i, col in enumerate(dataframe.columns):
+        samples.append(pd.DataFrame({col: sorted_values[:, i]},
+                                    index=dataframe.index[order[:, i]]))
     return samples
 
 
@@ -162,17 +955,8 @@ def calculate_cumulative_relative_abundance(samples):
 
     samples2 = []
     for sample in samples:
-        cum_rel_abund = []
-
-        # calculate cumulative relative abundance and cumulative prop trfs
-        for i in range(0, len(sample)):
-            if i > 0:
-                cum_rel_abund.append(sample.iloc[i][0] + cum_rel_abund[i - 1])
-            else:
-                cum_rel_abund.append(sample.iloc[i][0])
-
-        sample['Cum Rel Abund'] = cum_rel_abund
-
+        sample['Cum Rel Abund'] = cumulative_matrix(
+            sample.iloc[:, 0].to_numpy(dtype=np.float64))
         samples2.append(sample)
 
     return samples2
@@ -195,14 +979,7 @@ def calculate_cumulative_prop_trf(samples):
     '''
     samples2 = []
     for sample in samples:
-        cum_prop_trfs = []
-
-        # calculate cumulative prop trfs
-        for i in range(0, len(sample)):
-            cum_prop_trfs.append((i + 1) / len(sample))
-
-        sample['Cum Prop TRFs'] = cum_prop_trfs
-
+        sample['Cum Prop TRFs'] = np.arange(1, len(sample) + 1) / len(sample)
         samples2.append(sample)
 
     return samples2
@@ -228,167 +1005,4087 @@ def remove_cumulative_abundance_over_one(samples):
 
     # get each sample in turn
     for col in samples:
-        found = False
-        new_frame = col
-
-        # go through each row and check for values over 1
-        for row_index in col.index:
-            val = col["Cum Rel Abund"][row_index]
-            # if we've already found the first row with a value of 1,
-            # then start removing rows
-            if found:
-                # remove the row and save the resulting frame back to new_frame
-                new_frame = new_frame.drop(row_index)
-            # look for values over 1
-            # floating point representation means it might not be exactly 1
-            elif val > 0.999999:
-                found = True
+        length = int(cutoff_lengths(col["Cum Rel Abund"].to_numpy()))
         # add the new reduced dataframe to a list to replace samples
-        samples2.append(new_frame)
+        samples2.append(col.iloc[:length].copy())
 
     return samples2
 
 
-def make_graph(samples, filename):
+# by default curves are drawn to within a quarter of a pixel of a default
+# sized graph, which is about 500 pixels across the axes
+GRAPH_TOLERANCE = 0.0005
+
+
+def _farthest_point(x, y, start, end):
     '''
-    Makes a graph
+    Finds the point between start and end furthest from the straight line
+    joining them
 
-    Parameters
-    ----------
-    samples
-        A list of dataframes, each dataframe should contain 3 columns one with
-        the name of the step, Cum Prop TRFs and Cum Rel Abund.
-    filename
-        Name of the file to save the graph to
+    Returns
+    -------
+    tuple
+        The index of the point and its distance from the line
+    '''
+    dx = x[end] - x[start]
+    dy = y[end] - y[start]
+    length = math.hypot(dx, dy)
+    px = x[start + 1:end] - x[start]
+    py = y[start + 1:end] - y[start]
+    if length == 0:
+        distances = np.hypot(px, py)
+    else:
+        distances = np.abs(dx * py - dy * px) / length
+    i = int(np.argmax(distances))
+    return start + 1 + i, distances[i]
+
+
+def simplify_curve(x, y, tolerance):
+    '''
+    Simplifies a curve with the Douglas-Peucker algorithm, only keeping the
+    points needed to stay within tolerance of the full curve. The end points
+    and the knee of the curve (the point furthest from the line between the
+    end points) are always kept. As the points kept are a subset of the
+    originals a monotone curve stays monotone.
+
+    Parameters
+    ----------
+    x, y
+        The coordinates of the curve
+    tolerance
+        The largest distance allowed between the simplified curve and any of
+        the original points, in the same units as x and y
+
+    Returns
+    -------
+    numpy.ndarray
+        The indices of the points to keep, in order
     '''
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= 2:
+        return np.arange(n)
 
-    # the - prefix means a line will drawn
-    # see https://matplotlib.org/api/markers_api.html for a list of markers
-    markerlist = ["-+", "-,", "-o", "-*", "-.", "-^", "-<", "->", "-v"]
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = True
+    keep[-1] = True
 
-    # the list of markers to use, must be longer or equal to number of steps
-    # check it really is
-#    assert len(markerlist) >= len(samples)
+    knee, distance = _farthest_point(x, y, 0, n - 1)
+    keep[knee] = True
+
+    # segments still to be checked, avoids recursing on very long curves
+    segments = [(0, knee), (knee, n - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        i, distance = _farthest_point(x, y, start, end)
+        if distance > tolerance:
+            keep[i] = True
+            segments.append((start, i))
+            segments.append((i, end))
+
+    return np.flatnonzero(keep)
+
+
+def simplify_samples(samples, tolerance):
+    '''
+    Simplifies the curve of each sample with simplify_curve
+
+    Parameters
+    ----------
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    tolerance
+        The largest distance allowed from the full curve, None leaves the
+        samples as they are
+
+    Returns
+    -------
+    list
+        A list of dataframes only containing the rows needed for each curve
+    '''
+    if tolerance is None:
+        return samples
 
-    # counter for going through the makerlist
-    i = 0
-    # make graph
+    samples2 = []
     for col in samples:
+        keep = simplify_curve(col.loc[:, 'Cum Prop TRFs'],
+                              col.loc[:, 'Cum Rel Abund'], tolerance)
+        samples2.append(col.iloc[keep])
+    return samples2
+
+
+def make_figure():
+    '''
+    Makes an empty figure for the graph with its axes, labels and the 1:1
+    line already drawn. The figure is made without pyplot so nothing is left
+    behind in pyplot's global state between calls.
+
+    Returns
+    -------
+    tuple
+        The matplotlib figure and axes
+    '''
+    # matplotlib is slow to import so only do it when a graph is made.
+    # The figure is saved without pyplot, so no backend needs choosing.
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    axes = figure.add_subplot()
+
+    axes.set_xlim(0, 1.0)
+    axes.set_ylim(0, 1.05)
+
+    axes.annotate("",
+                  xy=(0, 0), xycoords='data',
+                  xytext=(1, 1), textcoords='data',
+                  arrowprops=dict(arrowstyle="-",
+                                  connectionstyle="arc3,rad=0."), )
+
+    axes.set_ylabel("Cumulative Relative Abundance")
+    axes.set_xlabel("Cumulative Prop TRF")
+    axes.grid()
+    return figure, axes
+
+
+def add_curves(axes, samples, tolerance=GRAPH_TOLERANCE):
+    '''
+    Adds the curves of a list of samples to a graph
+
+    Parameters
+    ----------
+    axes
+        The axes to draw on, from make_figure
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    tolerance
+        How far the drawn curves may be from the full curves, see
+        simplify_curve. None draws every point.
+    '''
+    for col in simplify_samples(samples, tolerance):
         # get the title of current sample from the heading of its 1st column
         title = col.columns[0]
 
-        plt.xlim(0, 1.0)
-        plt.ylim(0, 1.05)
+        # plot cumulative prop trfs vs cumulative relative abundance
+        axes.plot(col.loc[:, 'Cum Prop TRFs'], col.loc[:, 'Cum Rel Abund'],
+                  label=title)
 
-        plt.annotate("",
-                     xy=(0, 0), xycoords='data',
-                     xytext=(1, 1), textcoords='data',
-                     arrowprops=dict(arrowstyle="-",
-                                     connectionstyle="arc3,rad=0."), )
 
-        # plot cumulative prop trfs vs cumulative relative abundance
-#        plt.plot(col.loc[:, 'Cum Prop TRFs'], col.loc[:, 'Cum Rel Abund'],
-#                markerlist[i], label=title)
+def save_graph(figure, axes, filename):
+    '''
+    Adds the legend to a graph and saves it
+
+    Parameters
+    ----------
+    figure
+        The figure from make_figure
+    axes
+        The axes from make_figure
+    filename
+        Name of the file to save the graph to
+    '''
+    axes.legend()
+    figure.savefig(filename)
+
+
+def make_graph(samples, filename, tolerance=GRAPH_TOLERANCE):
+    '''
+    Makes a graph
+
+    Parameters
+    ----------
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    filename
+        Name of the file to save the graph to
+    tolerance
+        How far the drawn curves may be from the full curves, see
+        simplify_curve. None draws every point.
+    '''
+    figure, axes = make_figure()
+    add_curves(axes, samples, tolerance)
+    save_graph(figure, axes, filename)
+
+
+# how many bytes of resample counts to hold at once when bootstrapping
+BOOTSTRAP_MEMORY = 64 * 1024 * 1024
 
-        plt.plot(col.loc[:, 'Cum Prop TRFs'], col.loc[:, 'Cum Rel Abund'],
-                 label=title)
 
+def bootstrap_gini(data, replicates, rng=None, memory_budget=BOOTSTRAP_MEMORY):
+    '''
+    Calculates the gini coefficient of many bootstrap resamples of the data.
+    Each resample is drawn as multinomial counts of how many times each value
+    is picked, so with the values sorted once the gini of every resample can
+    be calculated together without sorting again. The resamples are done in
+    chunks which fit within the memory budget.
+
+    Parameters
+    ----------
+    data
+        The values to resample
+    replicates
+        How many resamples to make
+    rng
+        numpy random Generator to use, a new unseeded one if None
+    memory_budget
+        Roughly how many bytes to use at once
+
+    Returns
+    -------
+    numpy.ndarray
+        The gini coefficient of each resample
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    values = np.sort(np.asarray(data, dtype=np.float64))
+    n = len(values)
+    if n == 0:
+        return np.full(replicates, np.nan)
+
+    chunk = max(1, int(memory_budget // (8 * 4 * n)))
+    probabilities = np.full(n, 1.0 / n)
+    ginis = np.empty(replicates)
+    for start in range(0, replicates, chunk):
+        stop = min(start + chunk, replicates)
+        counts = rng.multinomial(n, probabilities, size=stop - start)
+        # the copies of value j take up ranks above[j] - counts[j] + 1 to
+        # above[j] in the sorted resample, so their ranks add up to
+        # counts[j] * (2 * above[j] - counts[j] + 1) / 2
+        above = np.cumsum(counts, axis=1)
+        ranked = (counts * (2 * above - counts + 1)) @ values / 2
+        totals = counts @ values
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ginis[start:stop] = (2 * ranked - (n + 1) * totals) / (n * totals)
+    return ginis
 
 
-        plt.ylabel("Cumulative Relative Abundance")
-        plt.xlabel("Cumulative Prop TRF")
-        plt.grid()
-        plt.legend()
-        plt.savefig(filename)
-        i = i + 1
+def _bootstrap_interval(args):
+    '''
+    Bootstraps one sample's gini coefficient and returns the confidence
+    interval, run in a worker process by bootstrap_intervals
+    '''
+    data, replicates, confidence, seed = args
+    ginis = bootstrap_gini(data, replicates, np.random.default_rng(seed))
+    tail = (1 - confidence) / 2 * 100
+    return tuple(np.nanpercentile(ginis, [tail, 100 - tail]))
 
 
-def make_gini_file(samples, gini_file):
+def bootstrap_intervals(samples, replicates, confidence=0.95, seed=None,
+                        jobs=1):
     '''
-    Calculates the Gini coefficients and saves them to a TSV file
+    Calculates bootstrap confidence intervals of the gini coefficient of each
+    sample. Every sample gets its own random stream made from the seed and
+    its title, so the results don't depend on the number of processes or the
+    order of the samples.
 
     Parameters
     ----------
     samples
         A list of dataframes, each dataframe should contain 3 columns one with
         the name of the step, Cum Prop TRFs and Cum Rel Abund.
-    gini_file
-        Name of the file to save the gini coefficient data to
+    replicates
+        How many bootstrap resamples to make of each sample
+    confidence
+        The confidence level of the intervals, e.g. 0.95
+    seed
+        Seed for the random numbers, None for different results each time
+    jobs
+        Number of processes to spread the samples over
+
+    Returns
+    -------
+    list
+        The (lower, upper) bounds of the interval for each sample
     '''
-    titles = []
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    tasks = []
     for col in samples:
-        titles.append(col.columns[0])
-    # make an empty data frame for the gini coefficients
-    gini_dataframe = pd.DataFrame(columns=['Gini', 'Corrected Gini', 'n'],
-                                  index=titles)
+        title = str(col.columns[0])
+        sample_seed = np.random.SeedSequence(
+            seed, spawn_key=(zlib.crc32(title.encode()),))
+        tasks.append((col.iloc[:, 0].to_numpy(dtype=np.float64), replicates,
+                      confidence, sample_seed))
+
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(_bootstrap_interval, tasks))
+    return [_bootstrap_interval(task) for task in tasks]
+
+
+def rarefy_counts(counts, depth, replicates, rng=None):
+    '''
+    Subsamples depth reads without replacement from each column of a table
+    of counts, several times over. Every replicate of a sample is drawn in
+    one call to numpy's multivariate hypergeometric sampler over only the
+    bins with reads, so the python loop runs once per sample however many
+    bins there are.
+
+    Parameters
+    ----------
+    counts
+        2D numpy array of integer read counts, one row per bin and one column
+        per sample
+    depth
+        How many reads to keep in each subsample, samples with fewer reads
+        are kept whole
+    replicates
+        How many subsamples to draw from each sample
+    rng
+        numpy random Generator to use, a new unseeded one if None
+
+    Returns
+    -------
+    numpy.ndarray
+        The subsampled counts, with shape bins x samples x replicates
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    counts = np.asarray(counts, dtype=np.int64)
+    totals = counts.sum(axis=0)
+    drawn = np.zeros(counts.shape + (replicates,), dtype=np.int64)
+    for sample in range(counts.shape[1]):
+        rows = np.flatnonzero(counts[:, sample])
+        if totals[sample] <= depth:
+            drawn[rows, sample] = counts[rows, sample, np.newaxis]
+        else:
+            drawn[rows, sample] = rng.multivariate_hypergeometric(
+                counts[rows, sample], depth, size=replicates).T
+    return drawn
+
+
+def _rarefaction_chunk(args):
+    '''
+    Rarefies a group of samples to every depth and returns the mean and
+    standard deviation of their gini coefficients, run in a worker process
+    by rarefaction_gini
+    '''
+    counts, depths, replicates, seed = args
+    rng = np.random.default_rng(seed)
+    totals = counts.sum(axis=0)
+    means = np.full((len(depths), counts.shape[1]), np.nan)
+    sds = np.full((len(depths), counts.shape[1]), np.nan)
+    for i, depth in enumerate(depths):
+        # samples without enough reads can't be rarefied to this depth
+        enough = totals >= depth
+        if not enough.any():
+            continue
+        drawn = rarefy_counts(counts[:, enough], depth, replicates, rng)
+        values = drawn.reshape(counts.shape[0], -1) / depth
+        # the sort order isn't needed so this skips sort_matrix's argsort
+        sorted_values = -np.sort(-values, axis=0)
+        lengths = cutoff_lengths(cumulative_matrix(sorted_values))
+        ginis = matrix_gini(sorted_values, lengths).reshape(-1, replicates)
+        means[i, enough] = ginis.mean(axis=1)
+        if replicates > 1:
+            sds[i, enough] = ginis.std(axis=1, ddof=1)
+    return means, sds
+
+
+def rarefaction_gini(counts, depths, replicates=10, seed=None, jobs=1,
+                     memory_budget=BOOTSTRAP_MEMORY):
+    '''
+    Calculates the gini coefficient of every sample rarefied to each of a
+    list of depths. The samples are done in groups that fit within the
+    memory budget, each group with its own random stream made from the seed,
+    so the results don't depend on the number of processes.
+
+    Parameters
+    ----------
+    counts
+        2D numpy array of integer read counts, one row per bin and one column
+        per sample
+    depths
+        The numbers of reads to rarefy to
+    replicates
+        How many subsamples to draw at each depth
+    seed
+        Seed for the random numbers, None for different results each time
+    jobs
+        Number of processes to spread the groups of samples over
+    memory_budget
+        Roughly how many bytes each process uses at once
+
+    Returns
+    -------
+    tuple
+        2D numpy arrays of the mean and standard deviation of the gini
+        coefficients, one row per depth and one column per sample. Samples
+        with fewer reads than the depth are NaN.
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    n_bins, n_samples = counts.shape
+    chunk = max(1, int(memory_budget //
+                       (8 * 4 * max(n_bins, 1) * replicates)))
+    tasks = [(counts[:, start:start + chunk], depths, replicates,
+              np.random.SeedSequence(seed, spawn_key=(start,)))
+             for start in range(0, n_samples, chunk)]
+
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_rarefaction_chunk, tasks))
+    else:
+        results = [_rarefaction_chunk(task) for task in tasks]
+    if not results:
+        empty = np.empty((len(depths), 0))
+        return empty, empty
+    return (np.concatenate([means for means, _ in results], axis=1),
+            np.concatenate([sds for _, sds in results], axis=1))
 
-    # make graph
-    for col in samples:
-        # get the title of current sample from the heading of its 1st column
-        title = col.columns[0]
 
-        # calculate gini coefficient and corrected gini (g * (n/n-1))
-        gini = calculate_gini(col.iloc[:, 0])
-        corrected_gini = gini * (len(col) / (len(col) - 1))
+def make_gini_file(samples, gini_file, ginis=None, bootstrap=0,
+                   confidence=0.95, seed=None, jobs=1, output_format=None,
+                   indices=()):
+    '''
+    Calculates the Gini coefficients and saves them to a file, TSV unless
+    another format is asked for
 
-        # add gini coefficients into a dataframe for saving the result
-        # 24-March-2021: limit to a certain precision for csv exporting.
-        gini_dataframe.loc[title, 'Gini'] = "{:f}".format(gini)
-        gini_dataframe.loc[title, 'Corrected Gini'] = "{:f}".format(corrected_gini)
-        gini_dataframe.loc[title, 'n'] = len(col)
+    Parameters
+    ----------
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    gini_file
+        Name of the file to save the gini coefficient data to
+    ginis
+        Optional gini coefficients already calculated for each sample, e.g.
+        by matrix_gini. They are calculated here if this isn't given.
+    bootstrap, confidence, seed, jobs
+        Add bootstrap confidence intervals, see make_gini_dataframe
+    output_format
+        The format to save in, see write_table
+    indices
+        Evenness indices to add as extra columns, see make_gini_dataframe
+    '''
+    gini_dataframe = make_gini_dataframe(samples, ginis, bootstrap,
+                                         confidence, seed, jobs, indices)
 
     print(gini_dataframe)
     # save the gini coefficients to a file
-    gini_dataframe.to_csv(gini_file, sep='\t')
+    # 24-March-2021: limit to a certain precision for csv exporting.
+    write_table(gini_dataframe, gini_file, output_format, float_format='%f')
 
 
-def run(input_file, graph_file, output_file):
+def sample_evenness(samples, indices):
     '''
-    runs everything
-    **** change this function to alter filenames ****
+    Runs matrix_evenness on a list of sample dataframes, one sample at a time
+
+    Parameters
+    ----------
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    indices
+        Keys of EVENNESS_INDICES to calculate
+
+    Returns
+    -------
+    dict
+        An array with the index of each sample for each column name
+    '''
+    results = [matrix_evenness(
+        col.iloc[:, 0].to_numpy(dtype=np.float64)[:, np.newaxis],
+        col['Cum Rel Abund'].to_numpy(dtype=np.float64)[:, np.newaxis],
+        [len(col)], indices) for col in samples]
+    return {EVENNESS_INDICES[name]: np.array(
+        [result[EVENNESS_INDICES[name]][0] for result in results],
+        dtype=np.float64) for name in indices}
+
+
+def make_gini_dataframe(samples, ginis=None, bootstrap=0, confidence=0.95,
+                        seed=None, jobs=1, indices=()):
+    '''
+    Calculates the Gini coefficients of each sample
+
+    Parameters
+    ----------
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    ginis
+        Optional gini coefficients already calculated for each sample
+    bootstrap
+        If more than 0, the number of bootstrap resamples used to add
+        confidence intervals of the Gini and Corrected Gini, see
+        bootstrap_intervals
+    confidence
+        The confidence level of the intervals
+    seed
+        Seed for the bootstrap resamples
+    jobs
+        Number of processes to spread the bootstrapping over
+    indices
+        Keys of EVENNESS_INDICES to add as extra columns, worked out from the
+        sorted abundances and Cum Rel Abund of each sample, see
+        matrix_evenness
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        The Gini, Corrected Gini and n of each sample, indexed by sample name.
+        Samples with only one bin have a Corrected Gini of NaN.
+    '''
+    # get the title of each sample from the heading of its 1st column
+    titles = [col.columns[0] for col in samples]
+    n = np.array([len(col) for col in samples], dtype=np.int64)
+
+    # calculate gini coefficient and corrected gini (g * (n/n-1))
+    if ginis is None:
+        ginis = [calculate_gini(col.iloc[:, 0]) for col in samples]
+    ginis = np.asarray(ginis, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        correction = np.where(n > 1, n / (n - 1), np.nan)
+
+    columns = {'Gini': ginis, 'Corrected Gini': ginis * correction, 'n': n}
+    for name, values in sample_evenness(samples, indices).items():
+        columns[name] = values
+    if bootstrap > 0:
+        intervals = np.array(bootstrap_intervals(samples, bootstrap,
+                                                 confidence, seed, jobs),
+                             dtype=np.float64).reshape(-1, 2)
+        columns['Gini CI Lower'] = intervals[:, 0]
+        columns['Gini CI Upper'] = intervals[:, 1]
+        columns['Corrected Gini CI Lower'] = intervals[:, 0] * correction
+        columns['Corrected Gini CI Upper'] = intervals[:, 1] * correction
+
+    return pd.DataFrame(columns, index=titles)
+
+
+# the file formats write_table can save to and their file extensions
+OUTPUT_FORMATS = {'tsv': '.tsv', 'parquet': '.parquet',
+                  'feather': '.feather', 'jsonl': '.jsonl'}
+
+
+def guess_output_format(filename):
+    '''
+    Works out which format to save a file in from its extension
+
+    Parameters
+    ----------
+    filename
+        The name of the file
+
+    Returns
+    -------
+    str
+        One of the keys of OUTPUT_FORMATS, tsv for unknown extensions
+    '''
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.json', '.ndjson'):
+        return 'jsonl'
+    for output_format, format_extension in OUTPUT_FORMATS.items():
+        if extension == format_extension:
+            return output_format
+    return 'tsv'
+
+
+def write_table(dataframe, filename, output_format=None, index=True,
+                float_format=None):
+    '''
+    Saves a data frame as TSV, Parquet, Feather or JSON lines, keeping the
+    type of each column in the formats that have them
+
+    Parameters
+    ----------
+    dataframe
+        The data frame to save
+    filename
+        Name of the file to save it to
+    output_format
+        One of the keys of OUTPUT_FORMATS, None guesses it from the filename
+    index
+        Save the index as the first column. In formats other than TSV it is
+        called Sample if it doesn't have a name.
+    float_format
+        Format string for numbers in TSV files, e.g. '%f'
+
+    Raises
+    ------
+    ValueError
+        If the format isn't known or the library needed to write it isn't
+        installed
+    '''
+    if output_format is None:
+        output_format = guess_output_format(filename)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("unknown output format " + repr(output_format))
+
+    if output_format == 'tsv':
+        dataframe.to_csv(filename, sep='\t', index=index,
+                         float_format=float_format, na_rep='nan')
+        return
+
+    if index:
+        dataframe = dataframe.rename_axis(
+            dataframe.index.name or 'Sample').reset_index()
+    else:
+        dataframe = dataframe.reset_index(drop=True)
+    try:
+        if output_format == 'parquet':
+            dataframe.to_parquet(filename, index=False)
+        elif output_format == 'feather':
+            dataframe.to_feather(filename)
+        else:
+            dataframe.to_json(filename, orient='records', lines=True,
+                              double_precision=15)
+    except ImportError as error:
+        raise ValueError("can't write " + output_format + " files: " +
+                         str(error))
+
+
+def make_curve_dataframe(samples, tolerance=None):
+    '''
+    Puts the curve of every sample into one long table, with a row for each
+    point of each curve
+
+    Parameters
+    ----------
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    tolerance
+        How far the curves may be from the full curves, see simplify_curve.
+        None keeps every point.
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        Sample, Cum Prop TRFs and Cum Rel Abund columns, the sample names
+        are stored once as a categorical column
+    '''
+    samples = simplify_samples(samples, tolerance)
+    titles = [col.columns[0] for col in samples]
+    lengths = [len(col) for col in samples]
+    codes = np.repeat(np.arange(len(samples)), lengths)
+
+    def column(name):
+        if not samples:
+            return np.zeros(0)
+        return np.concatenate([col.loc[:, name].to_numpy(dtype=np.float64)
+                               for col in samples])
+
+    return pd.DataFrame({
+        'Sample': pd.Categorical.from_codes(codes, categories=titles),
+        'Cum Prop TRFs': column('Cum Prop TRFs'),
+        'Cum Rel Abund': column('Cum Rel Abund')})
+
+
+def make_curve_file(samples, curve_file, tolerance=None, output_format=None):
+    '''
+    Saves the curve of every sample so they don't need calculating again
+
+    Parameters
+    ----------
+    samples
+        A list of dataframes, each dataframe should contain 3 columns one with
+        the name of the step, Cum Prop TRFs and Cum Rel Abund.
+    curve_file
+        Name of the file to save the curves to
+    tolerance
+        How far the saved curves may be from the full curves, see
+        simplify_curve. None saves every point.
+    output_format
+        The format to save in, see write_table
+    '''
+    write_table(make_curve_dataframe(samples, tolerance), curve_file,
+                output_format, index=False)
+
+
+# where parsed input files are cached and how big the cache can get in bytes
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'pl_curves')
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+# change this if the layout of the cache changes so old entries are ignored
+CACHE_VERSION = '1'
+
+
+def hash_file(filename):
+    '''
+    Calculates the SHA-256 hash of a file's contents
+
+    Parameters
+    ----------
+    filename
+        The file to hash
+
+    Returns
+    -------
+    str
+        The hash as a hex string
+    '''
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_table(input_file, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+    '''
+    Reads a tab separated table with a Bin column into a dataframe.
+    If a cache directory is given the parsed table is saved there as numpy
+    arrays, keyed by the hash of the file, and later reads memory map those
+    instead of parsing the text again.
 
     Parameters
     ----------
     input_file
         The file to read data from
-    graph_file
-        The file to save the graph as
-    output_file
-        The file to save the data to
+    cache_dir
+        Directory to cache parsed tables in, None doesn't use a cache
+    cache_size
+        The most bytes the cache can use, the least recently used tables are
+        removed when it gets bigger than this. Tables too big for the cache
+        on their own aren't saved.
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        The table with one row per bin and one column per sample
     '''
+    if cache_dir is None:
+        return pd.read_csv(input_file, delimiter='\t', index_col='Bin')
+
+    entry = os.path.join(cache_dir,
+                         CACHE_VERSION + '-' + hash_file(input_file))
+    if os.path.isdir(entry):
+        # mark it as recently used so it is the last to be evicted
+        os.utime(entry)
+        return _load_cached_table(entry)
 
     dataframe = pd.read_csv(input_file, delimiter='\t', index_col='Bin')
+    # a table bigger than the whole cache would be evicted straight away,
+    # so don't spend the time writing it. The values alone are 8 bytes each.
+    if 8 * dataframe.size > cache_size:
+        return dataframe
+    _save_cached_table(dataframe, entry)
+    evict_cache(cache_dir, cache_size)
+    return dataframe
 
-    # check all columns sum to 1, if so proceed and calculate/graph
-    if check_columns(dataframe):
-        dataframe = remove_zeros(dataframe)
-        samples = sort_bins(dataframe)
-        samples = calculate_cumulative_relative_abundance(samples)
-        samples = remove_cumulative_abundance_over_one(samples)
-        samples = calculate_cumulative_prop_trf(samples)
-        make_graph(samples, graph_file)
-        make_gini_file(samples, output_file)
-        return samples
-    else:
-        sys.stderr.write("Error: columns don't sum to 1\n")
-        sys.exit(1)
 
+def _save_cached_table(dataframe, entry):
+    '''
+    Saves a table as an entry in the cache, it is written to a temporary
+    directory first so other processes never see a partly written entry
+    '''
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(entry))
+    try:
+        np.save(os.path.join(tmp, 'values.npy'),
+                dataframe.to_numpy(dtype=np.float64))
+        bins = dataframe.index.to_numpy()
+        if bins.dtype == object:
+            # numpy can only load object arrays with pickle, store text
+            bins = bins.astype(str)
+        np.save(os.path.join(tmp, 'bins.npy'), bins)
+        with open(os.path.join(tmp, 'samples.json'), 'w') as f:
+            json.dump({'samples': [str(c) for c in dataframe.columns],
+                       'index_name': dataframe.index.name}, f)
+        os.replace(tmp, entry)
+    except OSError:
+        # another process may have cached the same file first
+        shutil.rmtree(tmp, ignore_errors=True)
 
-if __name__ == "__main__":
-    # parse command line arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument('inputfile')
-    parser.add_argument('-g', '--graph', help='Graph file name',
-                        default='graph.png', required=False)
-    parser.add_argument('-o', '--output', help='Output data file name',
-                        required=False)
 
-    args = parser.parse_args()
+def _load_cached_table(entry):
+    '''
+    Loads a table from the cache, the values are memory mapped
+    '''
+    values = np.load(os.path.join(entry, 'values.npy'), mmap_mode='r')
+    bins = np.load(os.path.join(entry, 'bins.npy'))
+    with open(os.path.join(entry, 'samples.json')) as f:
+        meta = json.load(f)
+    return pd.DataFrame(values, columns=meta['samples'],
+                        index=pd.Index(bins, name=meta['index_name']))
 
-    if args.output is None:
-        args.output = args.inputfile + ".output.tsv"
 
-    print("Input file:", args.inputfile)
+def evict_cache(cache_dir, cache_size):
+    '''
+    Removes the least recently used tables from the cache until it uses no
+    more than cache_size bytes
+
+    Parameters
+    ----------
+    cache_dir
+        The cache directory
+    cache_size
+        The most bytes the cache can use
+    '''
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if not os.path.isdir(path):
+            continue
+        size = sum(os.path.getsize(os.path.join(path, f))
+                   for f in os.listdir(path))
+        entries.append((os.path.getmtime(path), size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= cache_size:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+# a table stored one sample (column) at a time, only holding the non-zero
+# values. The values of sample i are data[indptr[i]:indptr[i + 1]] and their
+# rows (positions in bins) are the same slice of indices, in row order.
+SparseTable = namedtuple('SparseTable',
+                         ['bins', 'samples', 'indptr', 'indices', 'data'])
+
+
+def read_sparse_table(input_file, chunksize=10000):
+    '''
+    Reads a tab separated table with a Bin column in chunks, only keeping
+    its non-zero values
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    chunksize
+        How many rows to read at once
+
+    Returns
+    -------
+    SparseTable
+        The non-zero values of each sample
+    '''
+    bins = []
+    rows = []
+    cols = []
+    data = []
+    samples = None
+    offset = 0
+    for chunk in pd.read_csv(input_file, delimiter='\t', index_col='Bin',
+                             chunksize=chunksize):
+        samples = chunk.columns
+        values = chunk.to_numpy(dtype=np.float64)
+        chunk_rows, chunk_cols = np.nonzero(values)
+        rows.append(chunk_rows + offset)
+        cols.append(chunk_cols)
+        data.append(values[chunk_rows, chunk_cols])
+        bins.append(chunk.index)
+        offset += len(chunk)
+
+    if samples is None:
+        samples = pd.read_csv(input_file, delimiter='\t', index_col='Bin',
+                              nrows=0).columns
+        return SparseTable(pd.Index([], name='Bin'), samples,
+                           np.zeros(len(samples) + 1, dtype=np.intp),
+                           np.zeros(0, dtype=np.intp), np.zeros(0))
+
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    data = np.concatenate(data)
+
+    # group the values by sample, keeping them in row order within each one
+    order = np.argsort(cols, kind='stable')
+    indptr = np.zeros(len(samples) + 1, dtype=np.intp)
+    np.cumsum(np.bincount(cols, minlength=len(samples)), out=indptr[1:])
+    return SparseTable(bins[0].append(bins[1:]), samples, indptr,
+                       rows[order], data[order])
+
+
+def read_long_table(input_file, chunksize=100000, delimiter=None,
+                    sample_column='Sample', bin_column='Bin',
+                    abundance_column='Abundance'):
+    '''
+    Reads a long (tidy) format table with one line per sample and bin in
+    chunks, grouping the values by sample without ever making the wide
+    table. Bins and samples are numbered in the order they first appear,
+    records with an abundance of zero are skipped and repeated records for
+    the same sample and bin are added together. Bin and sample names are
+    always read as strings, so a name is the same in every chunk.
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    chunksize
+        How many lines to read at once
+    delimiter
+        The column separator, by default a comma for .csv files and a tab for
+        anything else
+    sample_column, bin_column, abundance_column
+        The names of the columns holding the sample, bin and abundance
+
+    Returns
+    -------
+    SparseTable
+        The non-zero values of each sample
+    '''
+    if delimiter is None:
+        delimiter = ',' if input_file.lower().endswith('.csv') else '\t'
+
+    bin_codes = {}
+    sample_codes = {}
+    rows = []
+    cols = []
+    data = []
+    for chunk in pd.read_csv(input_file, delimiter=delimiter,
+                             usecols=[sample_column, bin_column,
+                                      abundance_column],
+                             dtype={sample_column: str, bin_column: str},
+                             chunksize=chunksize):
+        chunk = chunk[chunk[abundance_column].to_numpy() != 0]
+        for column, codes, out in ((bin_column, bin_codes, rows),
+                                   (sample_column, sample_codes, cols)):
+            # number this chunk's names then map them onto the global numbers
+            local, names = pd.factorize(chunk[column])
+            mapping = np.array([codes.setdefault(name, len(codes))
+                                for name in names], dtype=np.intp)
+            out.append(mapping[local] if len(mapping) else local)
+        data.append(chunk[abundance_column].to_numpy(dtype=np.float64))
+
+    n_samples = len(sample_codes)
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.intp)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.intp)
+    data = np.concatenate(data) if data else np.zeros(0)
+
+    # group by sample then bin, adding together any repeated records
+    order = np.lexsort((rows, cols))
+    rows = rows[order]
+    cols = cols[order]
+    data = data[order]
+    if len(data):
+        first = np.ones(len(data), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        starts = np.flatnonzero(first)
+        data = np.add.reduceat(data, starts)
+        rows = rows[starts]
+        cols = cols[starts]
+
+    indptr = np.zeros(n_samples + 1, dtype=np.intp)
+    np.cumsum(np.bincount(cols, minlength=n_samples), out=indptr[1:])
+    return SparseTable(pd.Index(list(bin_codes), name='Bin'),
+                       pd.Index(list(sample_codes)), indptr, rows, data)
+
+
+def sparse_report(table):
+    '''
+    Makes a ColumnReport of a SparseTable, like column_report
+
+    Parameters
+    ----------
+    table
+        The SparseTable
+
+    Returns
+    -------
+    ColumnReport
+        The sample names and the total, missing and negative count of each
+    '''
+    n_samples = len(table.samples)
+    cols = np.repeat(np.arange(n_samples), np.diff(table.indptr))
+    missing = np.isnan(table.data)
+    totals = np.bincount(cols, weights=np.where(missing, 0.0, table.data),
+                         minlength=n_samples)
+    return ColumnReport(list(table.samples), totals,
+                        np.bincount(cols[missing], minlength=n_samples),
+                        np.bincount(cols[table.data < 0],
+                                    minlength=n_samples))
+
+
+def remove_sparse_zeros(table):
+    '''
+    Removes all bins which are empty in every sample, like remove_zeros
+
+    Parameters
+    ----------
+    table
+        The SparseTable
+
+    Returns
+    -------
+    SparseTable
+        The table with the empty bins removed
+    '''
+    row_totals = np.bincount(table.indices, weights=table.data,
+                             minlength=len(table.bins))
+    non_empty = row_totals != 0
+
+    # number the remaining rows and drop values left in removed rows
+    new_rows = np.cumsum(non_empty) - 1
+    kept = non_empty[table.indices]
+    cols = np.repeat(np.arange(len(table.samples)), np.diff(table.indptr))
+    indptr = np.zeros(len(table.samples) + 1, dtype=np.intp)
+    np.cumsum(np.bincount(cols[kept], minlength=len(table.samples)),
+              out=indptr[1:])
+    return SparseTable(table.bins[non_empty], table.samples, indptr,
+                       new_rows[table.indices[kept]], table.data[kept])
+
+
+def process_sparse_sample(indices, data, n_rows):
+    '''
+    Sorts, sums and cuts off a single sample from its non-zero values.
+    This only works on the non-zero values unless the sample's cumulative
+    abundance never reaches 1, in which case its zero bins are kept too.
+
+    Parameters
+    ----------
+    indices
+        The rows of the non-zero values, in row order
+    data
+        The non-zero values
+    n_rows
+        The number of rows (bins) in the table
+
+    Returns
+    -------
+    tuple
+        The kept values sorted largest first, their rows and their
+        cumulative relative abundance
+    '''
+    order = np.argsort(-data, kind='stable')
+    values = data[order]
+    rows = indices[order]
+    cumulative = cumulative_matrix(values)
+    length = int(cutoff_lengths(cumulative))
+    if (length > 0 and cumulative[length - 1] > CUMULATIVE_THRESHOLD) or \
+            len(values) == n_rows:
+        return values[:length], rows[:length], cumulative[:length]
+
+    # never reached 1, so the zeros belong in the sample, after any positive
+    # values and before any negative ones
+    positive = int(np.count_nonzero(values > 0))
+    zero_rows = np.setdiff1d(np.arange(n_rows), indices, assume_unique=True)
+    values = np.concatenate((values[:positive], np.zeros(len(zero_rows)),
+                             values[positive:]))
+    rows = np.concatenate((rows[:positive], zero_rows, rows[positive:]))
+    cumulative = cumulative_matrix(values)
+    length = int(cutoff_lengths(cumulative))
+    return values[:length], rows[:length], cumulative[:length]
+
+
+def process_sparse_samples(table):
+    '''
+    Sorts, sums and cuts off every sample of a SparseTable and calculates
+    their gini coefficients, giving the same results as process_samples does
+    on the dense table
+
+    Parameters
+    ----------
+    table
+        The SparseTable, with any empty bins already removed
+
+    Returns
+    -------
+    tuple
+        A list of dataframes, one per sample as made by build_samples, and
+        the gini coefficient of each sample
+    '''
+    samples = []
+    ginis = np.empty(len(table.samples))
+    for i, title in enumerate(table.samples):
+        start, stop = table.indptr[i], table.indptr[i + 1]
+        values, rows, cumulative = process_sparse_sample(
+            table.indices[start:stop], table.data[start:stop],
+            len(table.bins))
+        length = len(values)
+        samples.append(pd.DataFrame(
+            {title: values,
+             'Cum Rel Abund': cumulative,
+             'Cum Prop TRFs': np.arange(1, length + 1) / length},
+            index=table.bins[rows]))
+        ginis[i] = gini_from_sorted(values)
+    return samples, ginis
+
+
+def read_numeric_table(input_file, cache_dir=None):
+    '''
+    Reads a plain tab separated table of numbers with a Bin column using only
+    numpy, which starts much faster than pandas. A table already in the cache
+    made by read_table is memory mapped instead.
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    cache_dir
+        Directory read_table caches parsed tables in, None doesn't use it.
+        Nothing is added to the cache here as the bin names aren't read.
+
+    Returns
+    -------
+    tuple
+        The sample names and a 2D numpy array of the values with one row per
+        bin and one column per sample
+
+    Raises
+    ------
+    ValueError
+        If the table has anything other than numbers in its sample columns
+    '''
+    if cache_dir is not None:
+        entry = os.path.join(cache_dir,
+                             CACHE_VERSION + '-' + hash_file(input_file))
+        if os.path.isdir(entry):
+            os.utime(entry)
+            with open(os.path.join(entry, 'samples.json')) as f:
+                samples = json.load(f)['samples']
+            values = np.load(os.path.join(entry, 'values.npy'), mmap_mode='r')
+            return samples, values
+
+    with open(input_file, newline='') as f:
+        header = next(csv.reader(f, delimiter='\t'))
+        if 'Bin' not in header:
+            raise ValueError("Bin column not found")
+        columns = [i for i, name in enumerate(header) if name != 'Bin']
+        values = np.loadtxt(f, delimiter='\t', usecols=columns, ndmin=2,
+                            dtype=np.float64)
+    return [header[i] for i in columns], values
+
+
+def run_gini_only(input_file, output_file, jobs=1, cache_dir=None,
+                  normalise=False, indices=()):
+    '''
+    Calculates the gini coefficients without pandas or matplotlib, for quick
+    runs that don't need a graph. The output file is the same as the one
+    written by run. Tables which aren't plain numbers are read with pandas.
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from, see read_numeric_table
+    output_file
+        The file to save the data to
+    jobs
+        Number of processes to spread the samples over
+    cache_dir
+        Directory read_table caches parsed tables in
+    normalise
+        Divide each sample by its total first, for files of read counts
+    indices
+        Keys of EVENNESS_INDICES to add as extra columns, see
+        matrix_evenness
+
+    Returns
+    -------
+    tuple
+        The sample names, the gini coefficients and the n of each sample
+    '''
+    try:
+        samples, values = read_numeric_table(input_file, cache_dir)
+    except ValueError:
+        dataframe = read_table(input_file, cache_dir)
+        samples = list(dataframe.columns)
+        values = dataframe.to_numpy(dtype=np.float64)
+
+    report = column_report(samples, values)
+    if normalise:
+        values = normalise_columns(values, report.totals)
+        report = normalised_report(report)
+    check_report(report)
+
+    # same as remove_zeros
+    values = values[values.sum(axis=1) != 0]
+    sorted_values, order, cumulative, lengths = process_matrix(values,
+                                                               jobs=jobs)
+    ginis = matrix_gini(sorted_values, lengths)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corrected_ginis = ginis * np.where(lengths > 1,
+                                           lengths / (lengths - 1), np.nan)
+    evenness = matrix_evenness(sorted_values, cumulative, lengths, indices)
+    rows = []
+    for i, (title, gini, corrected_gini, n) in enumerate(
+            zip(samples, ginis, corrected_ginis, lengths)):
+        rows.append([title, "{:f}".format(gini),
+                     "{:f}".format(corrected_gini), int(n)] +
+                    ["{:f}".format(values[i]) for values in evenness.values()])
+
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow(['', 'Gini', 'Corrected Gini', 'n'] + list(evenness))
+        writer.writerows(rows)
+    for row in rows:
+        print(*row, sep='\t')
+    return samples, ginis, lengths
+
+
+def run_rarefaction(input_file, output_file, depths, replicates=10,
+                    total=None, seed=None, jobs=1, cache_dir=None):
+    '''
+    Calculates how the gini coefficient of each sample changes with
+    sequencing depth and saves a table of the mean and standard deviation at
+    each depth
+
+    Parameters
+    ----------
+    input_file
+        The file to read read counts from, or relative abundances if total
+        is given
+    output_file
+        The file to save the data to
+    depths
+        The numbers of reads to rarefy to
+    replicates
+        How many subsamples to draw at each depth
+    total
+        The number of reads the relative abundances were made from, None if
+        the file already has counts
+    seed
+        Seed for the subsamples, None gives different results each time
+    jobs
+        Number of processes to use
+    cache_dir
+        Directory read_table caches parsed tables in
+
+    Returns
+    -------
+    tuple
+        The sample names, the depths and the mean and standard deviation of
+        the gini coefficients, see rarefaction_gini
+    '''
+    try:
+        samples, values = read_numeric_table(input_file, cache_dir)
+    except ValueError:
+        dataframe = read_table(input_file, cache_dir)
+        samples = list(dataframe.columns)
+        values = dataframe.to_numpy(dtype=np.float64)
+
+    if total is not None:
+        values = np.rint(values * total)
+    elif not np.array_equal(values, np.rint(values)):
+        raise ValueError("rarefaction needs read counts, or relative "
+                         "abundances and a total")
+    if (values < 0).any():
+        raise ValueError("read counts can't be negative")
+    counts = values[values.sum(axis=1) != 0].astype(np.int64)
+
+    depths = sorted(set(int(depth) for depth in depths))
+    means, sds = rarefaction_gini(counts, depths, replicates, seed, jobs)
+
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        header = ['Depth']
+        for title in samples:
+            header += [title + ' Mean', title + ' SD']
+        writer.writerow(header)
+        for depth, mean_row, sd_row in zip(depths, means, sds):
+            row = [depth]
+            for mean, sd in zip(mean_row, sd_row):
+                row += ["{:f}".format(mean), "{:f}".format(sd)]
+            writer.writerow(row)
+    return samples, depths, means, sds
+
+
+def scan_table(input_file, memory_budget, spill_file=None):
+    '''
+    Reads through a table in chunks to find its sample names, a ColumnReport
+    of its samples and which bins aren't empty, without loading it all at once
+
+    Parameters
+    ----------
+    input_file
+        The tab separated file to read, it must have a Bin column
+    memory_budget
+        Roughly how many bytes to use for each chunk
+    spill_file
+        If given, the values of the non-empty bins are also written to this
+        file as raw 64 bit floats, one row after another, so the text only
+        needs parsing once, see read_column_groups
+
+    Returns
+    -------
+    tuple
+        The sample names, the ColumnReport of the samples, the names of the
+        non-empty bins and a boolean array marking the non-empty rows of the
+        file
+    '''
+    columns = pd.read_csv(input_file, delimiter='\t', index_col='Bin',
+                          nrows=0).columns
+    # allow a few copies of each chunk for parsing and converting it
+    chunksize = max(1, int(memory_budget // (8 * 4 * (len(columns) + 1))))
+
+    totals = np.zeros(len(columns))
+    nans = np.zeros(len(columns), dtype=np.int64)
+    negatives = np.zeros(len(columns), dtype=np.int64)
+    keep = []
+    bins = []
+    spill = open(spill_file, 'wb') if spill_file is not None else None
+    try:
+        for chunk in pd.read_csv(input_file, delimiter='\t', index_col='Bin',
+                                 chunksize=chunksize):
+            values = chunk.to_numpy(dtype=np.float64)
+            totals += np.nansum(values, axis=0)
+            nans += np.isnan(values).sum(axis=0)
+            negatives += (values < 0).sum(axis=0)
+            # same test as remove_zeros, bins whose row adds up to zero are
+            # empty
+            non_empty = values.sum(axis=1) != 0
+            keep.append(non_empty)
+            bins.append(chunk.index[non_empty])
+            if spill is not None:
+                np.ascontiguousarray(values[non_empty]).tofile(spill)
+    finally:
+        if spill is not None:
+            spill.close()
+
+    keep = np.concatenate(keep) if keep else np.zeros(0, dtype=bool)
+    bins = bins[0].append(bins[1:]) if bins else pd.Index([], name='Bin')
+    report = ColumnReport(list(columns), totals, nans, negatives)
+    return columns, report, bins, keep
+
+
+def read_column_groups(spill_file, memory_budget, columns, n_rows):
+    '''
+    Reads the values saved by scan_table one group of columns at a time.
+    The rows are first copied a block at a time into a second file with one
+    column after another, which the first file is replaced with, so each
+    group is then a single contiguous read. Each group is sized so the
+    matrix for it and the sorted copies made by process_matrix fit within
+    the memory budget.
+
+    Parameters
+    ----------
+    spill_file
+        The file of values written by scan_table
+    memory_budget
+        Roughly how many bytes to use
+    columns
+        The sample names, as returned by scan_table
+    n_rows
+        The number of non-empty bins, the rows of the file
+
+    Yields
+    ------
+    tuple
+        The names of the samples in the group and a 2D numpy array of their
+        values with one row per kept bin
+    '''
+    n_columns = len(columns)
+    if n_rows == 0 or n_columns == 0:
+        if n_columns:
+            yield columns, np.empty((0, n_columns))
+        return
+
+    rows = np.memmap(spill_file, dtype=np.float64, mode='r',
+                     shape=(n_rows, n_columns))
+    by_column = np.memmap(spill_file + '.columns', dtype=np.float64,
+                          mode='w+', shape=(n_columns, n_rows))
+    # a block of rows and its transposed copy
+    block = max(1, int(memory_budget // (8 * 2 * n_columns)))
+    for start in range(0, n_rows, block):
+        by_column[:, start:start + block] = rows[start:start + block].T
+    by_column.flush()
+    del rows, by_column
+    os.replace(spill_file + '.columns', spill_file)
+    by_column = np.memmap(spill_file, dtype=np.float64, mode='r',
+                          shape=(n_columns, n_rows))
+
+    # the values, sorted values, order and cumulative sums are all n_rows long
+    group_size = max(1, int(memory_budget // (8 * 4 * n_rows)))
+    for start in range(0, n_columns, group_size):
+        values = np.array(by_column[start:start + group_size].T, order='C')
+        yield columns[start:start + group_size], values
+
+
+class SampleCurve:
+    '''
+    One sample of a LorenzResults. It only holds a reference to the results
+    and its position, and its arrays are views into the flat arrays of the
+    results.
+    '''
+
+    __slots__ = ('_results', '_index')
+
+    def __init__(self, results, index):
+        self._results = results
+        self._index = index
+
+    def _slice(self, array):
+        offsets = self._results.offsets
+        return array[offsets[self._index]:offsets[self._index + 1]]
+
+    @property
+    def name(self):
+        '''The name of the sample'''
+        return self._results.samples[self._index]
+
+    @property
+    def n(self):
+        '''The number of bins kept for the sample'''
+        offsets = self._results.offsets
+        return int(offsets[self._index + 1] - offsets[self._index])
+
+    @property
+    def gini(self):
+        '''The gini coefficient of the sample'''
+        return float(self._results.ginis[self._index])
+
+    @property
+    def corrected_gini(self):
+        '''The gini coefficient multiplied by n / (n - 1), NaN if n is 1'''
+        n = self.n
+        return self.gini * (n / (n - 1)) if n > 1 else math.nan
+
+    @property
+    def bins(self):
+        '''The names of the kept bins, largest first'''
+        return self._results.bins[self._slice(self._results.rows)]
+
+    @property
+    def abundances(self):
+        '''The relative abundance of each kept bin, largest first'''
+        return self._slice(self._results.abundances)
+
+    @property
+    def cum_rel_abund(self):
+        '''The cumulative relative abundance, the y values of the curve'''
+        return self._slice(self._results.cumulative)
+
+    @property
+    def cum_prop_trfs(self):
+        '''The cumulative proportion of bins, the x values of the curve'''
+        n = self.n
+        return np.arange(1, n + 1) / n
+
+    def to_dataframe(self):
+        '''
+        Makes the dataframe build_samples would have made for this sample
+
+        Returns
+        -------
+        pandas.core.frame.DataFrame
+            The abundances, Cum Rel Abund and Cum Prop TRFs of the sample
+        '''
+        return pd.DataFrame({self.name: self.abundances,
+                             'Cum Rel Abund': self.cum_rel_abund,
+                             'Cum Prop TRFs': self.cum_prop_trfs},
+                            index=self._results.bin_index[
+                                self._slice(self._results.rows)])
+
+    def __repr__(self):
+        return "SampleCurve({!r}, gini={:f}, n={})".format(self.name,
+                                                           self.gini, self.n)
+
+
+class LorenzResults:
+    '''
+    The curves and gini coefficients of many samples held in a few flat
+    numpy arrays rather than a dataframe per sample, so they are small to
+    keep and quick to pickle. The kept rows of every sample are stored one
+    after another, sample i being rows offsets[i] to offsets[i + 1].
+
+    Indexing or iterating gives a SampleCurve for each sample and
+    to_dataframes gives the list of dataframes run returns.
+    '''
+
+    __slots__ = ('samples', 'bin_index', 'offsets', 'rows', 'abundances',
+                 'cumulative', 'ginis')
+
+    def __init__(self, samples, bin_index, offsets, rows, abundances,
+                 cumulative, ginis):
+        '''
+        Parameters
+        ----------
+        samples
+            The sample names
+        bin_index
+            The names of every bin of the table, as a pandas Index
+        offsets
+            Where each sample starts in the flat arrays, with the total length
+            at the end
+        rows
+            The position in bin_index of each kept bin
+        abundances
+            The relative abundance of each kept bin, largest first
+        cumulative
+            The cumulative relative abundance of each kept bin
+        ginis
+            The gini coefficient of each sample
+        '''
+        self.samples = list(samples)
+        self.bin_index = bin_index
+        self.offsets = offsets
+        self.rows = rows
+        self.abundances = abundances
+        self.cumulative = cumulative
+        self.ginis = ginis
+
+    @classmethod
+    def from_matrix(cls, samples, bin_index, sorted_values, order, cumulative,
+                    lengths, ginis=None):
+        '''
+        Makes the results from the output of process_matrix
+
+        Parameters
+        ----------
+        samples
+            The sample names
+        bin_index
+            The names of the bins, as a pandas Index
+        sorted_values, order, cumulative, lengths
+            The output of process_matrix
+        ginis
+            The gini coefficient of each sample, calculated with matrix_gini
+            if not given
+
+        Returns
+        -------
+        LorenzResults
+            The results
+        '''
+        if ginis is None:
+            ginis = matrix_gini(sorted_values, lengths)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        # the transposes put each sample's kept rows one after another
+        kept = (np.arange(sorted_values.shape[0])[:, np.newaxis] <
+                lengths).T
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        # bin positions rarely need more than 32 bits, which halves them
+        rows = order.T[kept]
+        if sorted_values.shape[0] <= np.iinfo(np.int32).max:
+            rows = rows.astype(np.int32)
+        return cls(samples, bin_index, offsets, rows,
+                   sorted_values.T[kept], cumulative.T[kept],
+                   np.asarray(ginis, dtype=np.float64))
+
+    @property
+    def bins(self):
+        '''The names of every bin of the table as a numpy array'''
+        return self.bin_index.to_numpy()
+
+    @property
+    def n(self):
+        '''The number of bins kept for each sample'''
+        return np.diff(self.offsets)
+
+    @property
+    def corrected_ginis(self):
+        '''The corrected gini coefficient of each sample, see SampleCurve'''
+        n = self.n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.ginis * np.where(n > 1, n / (n - 1), np.nan)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            index = self.samples.index(index)
+        elif index < 0:
+            index += len(self.samples)
+        if not 0 <= index < len(self.samples):
+            raise IndexError("sample index out of range")
+        return SampleCurve(self, index)
+
+    def __iter__(self):
+        return (SampleCurve(self, i) for i in range(len(self.samples)))
+
+    def to_dataframes(self):
+        '''
+        Makes the list of dataframes run and build_samples give, one per
+        sample, for code which expects them
+
+        Returns
+        -------
+        list
+            A list of dataframes, each dataframe should contain 3 columns one
+            with the name of the step, Cum Rel Abund and Cum Prop TRFs.
+        '''
+        return [sample.to_dataframe() for sample in self]
+
+    def gini_dataframe(self):
+        '''
+        Makes the table of gini coefficients make_gini_dataframe gives
+
+        Returns
+        -------
+        pandas.core.frame.DataFrame
+            The Gini, Corrected Gini and n of each sample, indexed by sample
+            name
+        '''
+        return pd.DataFrame({'Gini': self.ginis,
+                             'Corrected Gini': self.corrected_ginis,
+                             'n': self.n}, index=self.samples)
+
+
+class LorenzAnalyzer:
+    '''
+    Library interface to the columnar engine. It checks a table, sorts and
+    sums every sample and gives a LorenzResults, without making a dataframe
+    for each sample.
+
+    Examples
+    --------
+    >>> results = LorenzAnalyzer(jobs=4).analyze_file('table.tsv')
+    >>> results['Step I'].gini
+    '''
+
+    def __init__(self, jobs=1, normalise=False, cache_dir=None,
+                 cache_size=DEFAULT_CACHE_SIZE):
+        '''
+        Parameters
+        ----------
+        jobs
+            Number of processes to spread the samples over
+        normalise
+            Divide each sample by its total first, for tables of read counts
+        cache_dir
+            Directory to cache parsed input files in, see read_table
+        cache_size
+            The most bytes the cache can use
+        '''
+        self.jobs = jobs
+        self.normalise = normalise
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+
+    def analyze(self, values, samples, bins):
+        '''
+        Analyzes a table held as a numpy array
+
+        Parameters
+        ----------
+        values
+            2D numpy array with one row per bin and one column per sample
+        samples
+            The name of each sample
+        bins
+            The name of each bin
+
+        Returns
+        -------
+        LorenzResults
+            The curves and gini coefficients of every sample
+
+        Raises
+        ------
+        ValueError
+            If any sample doesn't sum to 1 or has missing or negative values
+        '''
+        values = np.asarray(values, dtype=np.float64)
+        report = column_report(samples, values)
+        if self.normalise:
+            values = normalise_columns(values, report.totals)
+            report = normalised_report(report)
+        check_report(report)
+
+        # same as remove_zeros
+        non_empty = values.sum(axis=1) != 0
+        bin_index = pd.Index(bins, name='Bin')[non_empty]
+        sorted_values, order, cumulative, lengths = process_matrix(
+            values[non_empty], jobs=self.jobs)
+        return LorenzResults.from_matrix(samples, bin_index, sorted_values,
+                                         order, cumulative, lengths)
+
+    def analyze_dataframe(self, dataframe):
+        '''
+        Analyzes a table read by read_table
+
+        Parameters
+        ----------
+        dataframe
+            Data frame with one row per bin and one column per sample
+
+        Returns
+        -------
+        LorenzResults
+            The curves and gini coefficients of every sample
+        '''
+        return self.analyze(dataframe.to_numpy(dtype=np.float64),
+                            dataframe.columns, dataframe.index)
+
+    def analyze_file(self, input_file):
+        '''
+        Reads and analyzes a tab separated file with a Bin column
+
+        Parameters
+        ----------
+        input_file
+            The file to read data from
+
+        Returns
+        -------
+        LorenzResults
+            The curves and gini coefficients of every sample
+        '''
+        return self.analyze_dataframe(read_table(input_file, self.cache_dir,
+                                                 self.cache_size))
+
+
+# how many points of each curve are compared by curve_distances
+DISTANCE_GRID = 501
+# about how many bytes of curve differences to work on at once, small enough
+# to stay in the processor's cache
+DISTANCE_TILE_BYTES = 256 * 1024
+
+
+def resample_curves(results, grid_size=DISTANCE_GRID):
+    '''
+    Finds the height of every sample's curve at the same evenly spaced
+    points between 0 and 1, by linear interpolation between the points of
+    each curve, which starts at (0, 0)
+
+    Parameters
+    ----------
+    results
+        The LorenzResults of the samples
+    grid_size
+        The number of points to use
+
+    Returns
+    -------
+    numpy.ndarray
+        32 bit floats with one row per sample and one column per point
+    '''
+    n = results.n
+    grid = np.linspace(0, 1, grid_size)
+    # a zero in front of each sample's cumulative abundances is the origin
+    padded = np.insert(results.cumulative, results.offsets[:-1], 0.0)
+    starts = results.offsets[:-1] + np.arange(len(n))
+    curves = np.empty((len(n), grid_size), dtype=np.float32)
+    block = max(1, int(DISTANCE_TILE_BYTES * 16 // (8 * 4 * grid_size)))
+    for start in range(0, len(n), block):
+        lengths = n[start:start + block, np.newaxis]
+        position = grid * lengths
+        below = np.minimum(np.floor(position), lengths - 1).astype(np.int64)
+        index = starts[start:start + block, np.newaxis] + below
+        low = padded[index]
+        curves[start:start + block] = low + (position - below) * (
+            padded[index + 1] - low)
+    return curves
+
+
+def _distance_rows(curves, area, gap, start, stop):
+    '''
+    Fills in rows start to stop of the distance matrices, only working out
+    the columns from start onwards and copying them to the other half
+    '''
+    grid_size = curves.shape[1]
+    # the trapezium rule on the evenly spaced grid
+    weights = np.full(grid_size, 1 / max(grid_size - 1, 1), dtype=np.float32)
+    weights[[0, -1]] /= 2
+    tile = max(1, DISTANCE_TILE_BYTES // (4 * grid_size))
+    differences = np.empty((tile, grid_size), dtype=np.float32)
+    area_rows = np.empty((stop - start, curves.shape[0] - start),
+                         dtype=np.float32)
+    gap_rows = np.empty_like(area_rows)
+
+    for column in range(start, curves.shape[0], tile):
+        others = curves[column:column + tile]
+        difference = differences[:len(others)]
+        for row in range(start, stop):
+            np.subtract(others, curves[row], out=difference)
+            np.abs(difference, out=difference)
+            np.dot(difference, weights,
+                   out=area_rows[row - start, column - start:
+                                 column - start + len(others)])
+            difference.max(axis=1, out=gap_rows[
+                row - start, column - start:column - start + len(others)])
+
+    area[start:stop, start:] = area_rows
+    gap[start:stop, start:] = gap_rows
+    area[start:, start:stop] = area_rows.T
+    gap[start:, start:stop] = gap_rows.T
+
+
+def _attach_distance_arrays(specs, files):
+    '''
+    Process pool initialiser for curve_distances, maps the shared memory
+    blocks and memory maps the output files
+    '''
+    _attach_shared_arrays(specs)
+    for key, filename in files.items():
+        _shared_arrays[key] = (None, np.load(filename, mmap_mode='r+'))
+
+
+def _shared_distance_rows(bounds):
+    '''Runs _distance_rows on the shared arrays in a worker process'''
+    _distance_rows(_shared_arrays['curves'][1], _shared_arrays['area'][1],
+                   _shared_arrays['gap'][1], *bounds)
+
+
+def curve_distances(curves, jobs=1, area_file=None, gap_file=None):
+    '''
+    Works out the area between and the largest vertical gap between the
+    curves of every pair of samples. The matrices are filled in a block of
+    rows at a time, comparing each row with a tile of other curves small
+    enough to stay in the processor's cache, and only half of each matrix is
+    worked out as they are symmetric.
+
+    Parameters
+    ----------
+    curves
+        The curves from resample_curves
+    jobs
+        Number of processes to spread the rows over
+    area_file, gap_file
+        .npy files to write the matrices to through memory maps, so they
+        don't need to fit in memory. None keeps a matrix in memory.
+
+    Returns
+    -------
+    tuple
+        The area and gap matrices as 32 bit floats, memory mapped if a file
+        was given
+    '''
+    curves = np.ascontiguousarray(curves, dtype=np.float32)
+    n_samples = curves.shape[0]
+    outputs = {}
+    for key, filename in (('area', area_file), ('gap', gap_file)):
+        if filename is None:
+            outputs[key] = None
+        else:
+            outputs[key] = np.lib.format.open_memmap(
+                filename, mode='w+', dtype=np.float32,
+                shape=(n_samples, n_samples))
+
+    # several row blocks per worker to even out the load, later rows have
+    # fewer columns left to do
+    rows = max(1, min(256, n_samples // max(jobs * 8, 1)))
+    bounds = [(start, min(start + rows, n_samples))
+              for start in range(0, n_samples, rows)]
+
+    if jobs <= 1 or len(bounds) <= 1:
+        for key in outputs:
+            if outputs[key] is None:
+                outputs[key] = np.empty((n_samples, n_samples),
+                                        dtype=np.float32)
+        for start, stop in bounds:
+            _distance_rows(curves, outputs['area'], outputs['gap'], start,
+                           stop)
+        return outputs['area'], outputs['gap']
+
+    from multiprocessing import shared_memory
+    shapes = {'curves': curves.shape}
+    shapes.update((key, (n_samples, n_samples))
+                  for key, output in outputs.items() if output is None)
+    blocks = {}
+    arrays = {}
+    try:
+        for key, shape in shapes.items():
+            blocks[key] = shared_memory.SharedMemory(
+                create=True, size=max(int(np.prod(shape)) * 4, 1))
+            arrays[key] = np.ndarray(shape, dtype=np.float32,
+                                     buffer=blocks[key].buf)
+        arrays['curves'][:] = curves
+        specs = {key: (blocks[key].name, shape, np.float32)
+                 for key, shape in shapes.items()}
+        files = {key: filename for key, filename in
+                 (('area', area_file), ('gap', gap_file))
+                 if filename is not None}
+        for output in outputs.values():
+            if output is not None:
+                output.flush()
+        with ProcessPoolExecutor(max_workers=jobs,
+                                 initializer=_attach_distance_arrays,
+                                 initargs=(specs, files)) as pool:
+            list(pool.map(_shared_distance_rows, bounds))
+
+        for key in outputs:
+            if outputs[key] is None:
+                outputs[key] = arrays[key].copy()
+        return outputs['area'], outputs['gap']
+    finally:
+        arrays.clear()
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+def write_distance_matrix(matrix, samples, filename):
+    '''
+    Saves a distance matrix as a TSV file with the sample names along the
+    top and down the side, a block of rows at a time
+
+    Parameters
+    ----------
+    matrix
+        The square matrix, which can be memory mapped
+    samples
+        The sample names
+    filename
+        Name of the file to save to
+    '''
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        writer.writerow([''] + list(samples))
+        for start in range(0, len(samples), 256):
+            block = np.asarray(matrix[start:start + 256])
+            for title, row in zip(samples[start:start + 256], block):
+                writer.writerow([title] + ["{:f}".format(value)
+                                           for value in row])
+
+
+def run_distances(input_file, prefix, grid_size=DISTANCE_GRID, jobs=1,
+                  matrix_format='npy', normalise=False, cache_dir=None,
+                  matrix_dir=None):
+    '''
+    Compares the curves of every pair of samples in a table, saving the area
+    between them and the largest vertical gap between them as two matrices
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    prefix
+        The start of the output file names. npy matrices are saved to
+        prefix.area.npy and prefix.max_gap.npy with the sample names in
+        prefix.samples.txt, tsv matrices to prefix.area.tsv and
+        prefix.max_gap.tsv.
+    grid_size
+        The number of points of each curve to compare
+    jobs
+        Number of processes to use
+    matrix_format
+        npy or tsv
+    normalise
+        Divide each sample by its total first, for files of read counts
+    cache_dir
+        Directory read_table caches parsed tables in
+    matrix_dir
+        Directory to keep the area.npy and gap.npy files tsv matrices are
+        worked out in, None uses a temporary directory which is deleted
+        afterwards
+
+    Returns
+    -------
+    tuple
+        The sample names and the area and gap matrices memory mapped from
+        their .npy files, the matrices are None for tsv without a matrix_dir
+    '''
+    results = LorenzAnalyzer(jobs=jobs, normalise=normalise,
+                             cache_dir=cache_dir).analyze_file(input_file)
+    curves = resample_curves(results, grid_size)
+    samples = [str(sample) for sample in results.samples]
+
+    if matrix_format == 'npy':
+        area, gap = curve_distances(curves, jobs, prefix + '.area.npy',
+                                    prefix + '.max_gap.npy')
+        with open(prefix + '.samples.txt', 'w') as f:
+            f.writelines(sample + '\n' for sample in samples)
+        return samples, area, gap
+
+    # work through memory mapped files so big matrices don't need to fit in
+    # memory while they are written out
+    if matrix_dir is not None:
+        os.makedirs(matrix_dir, exist_ok=True)
+        return (samples,) + _write_distance_tsv(curves, samples, prefix,
+                                                matrix_dir, jobs)
+    with tempfile.TemporaryDirectory() as directory:
+        _write_distance_tsv(curves, samples, prefix, directory, jobs)
+    return samples, None, None
+
+
+def _write_distance_tsv(curves, samples, prefix, directory, jobs):
+    '''
+    Works out the distance matrices in .npy files in directory and writes
+    them out as tsv files, returning the memory mapped matrices
+    '''
+    area, gap = curve_distances(curves, jobs,
+                                os.path.join(directory, 'area.npy'),
+                                os.path.join(directory, 'gap.npy'))
+    write_distance_matrix(area, samples, prefix + '.area.tsv')
+    write_distance_matrix(gap, samples, prefix + '.max_gap.tsv')
+    return area, gap
+
+
+def read_group_file(filename):
+    '''
+    Reads which group each sample is in from a tab separated file with a
+    sample name and a group name on each line. A Sample/Group heading, blank
+    lines and lines starting with # are skipped.
+
+    Parameters
+    ----------
+    filename
+        The file to read
+
+    Returns
+    -------
+    dict
+        The group of each sample name
+
+    Raises
+    ------
+    ValueError
+        If a line doesn't have two columns
+    '''
+    mapping = {}
+    with open(filename, newline='') as f:
+        for number, row in enumerate(csv.reader(f, delimiter='\t'), 1):
+            if not row or not ''.join(row).strip() or \
+                    row[0].startswith('#'):
+                continue
+            if len(row) != 2:
+                raise ValueError("line {} of {} should have a sample and a "
+                                 "group".format(number, filename))
+            sample, group = row[0].strip(), row[1].strip()
+            if number == 1 and (sample.lower(), group.lower()) == \
+                    ('sample', 'group'):
+                continue
+            mapping[sample] = group
+    return mapping
+
+
+def group_samples(samples, mapping=None, pattern=None):
+    '''
+    Puts the samples into groups, using a mapping of sample names to groups
+    or a regular expression. The group matched by a pattern is its first
+    bracketed group, or the whole match if it has none, e.g. "Step \\w+"
+    puts "Step I a" and "Step I b" together. Samples that aren't in the
+    mapping or don't match the pattern are each a group of their own.
+
+    Parameters
+    ----------
+    samples
+        The sample names
+    mapping
+        The group of each sample name, see read_group_file
+    pattern
+        A regular expression searched for in each sample name, only used if
+        there's no mapping
+
+    Returns
+    -------
+    tuple
+        The group names in the order they are first seen and the index of
+        each sample's group in them
+    '''
+    regex = re.compile(pattern) if pattern is not None else None
+    groups = {}
+    codes = np.empty(len(samples), dtype=np.int64)
+    for i, sample in enumerate(samples):
+        group = None
+        if mapping is not None:
+            group = mapping.get(str(sample))
+        elif regex is not None:
+            match = regex.search(str(sample))
+            if match is not None:
+                group = match.group(1) if regex.groups else match.group(0)
+        if group is None:
+            group = str(sample)
+        codes[i] = groups.setdefault(group, len(groups))
+    return list(groups), codes
+
+
+def group_statistics(values, codes, n_groups):
+    '''
+    Finds the mean, standard deviation, minimum and maximum of the rows of
+    each group at once, by sorting the rows into their groups and reducing
+    each run of rows
+
+    Parameters
+    ----------
+    values
+        1D or 2D numpy array with one row per sample
+    codes
+        The index of each sample's group, see group_samples. Every group
+        needs at least one sample.
+    n_groups
+        The number of groups
+
+    Returns
+    -------
+    tuple
+        The mean, standard deviation, minimum and maximum with one row per
+        group. Groups of one sample have a standard deviation of NaN.
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rows = values[order]
+    shape = (-1,) + (1,) * (values.ndim - 1)
+
+    mean = np.add.reduceat(rows, starts, axis=0) / sizes.reshape(shape)
+    squares = np.add.reduceat((rows - mean[codes[order]]) ** 2, starts,
+                              axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sd = np.sqrt(squares / (sizes - 1).reshape(shape))
+    sd[sizes < 2] = np.nan
+    return (mean, sd, np.minimum.reduceat(rows, starts, axis=0),
+            np.maximum.reduceat(rows, starts, axis=0))
+
+
+def make_group_dataframes(results, groups, codes, grid_size=DISTANCE_GRID):
+    '''
+    Works out the mean curve of each group, with the standard deviation,
+    minimum and maximum around it, and statistics of the gini coefficients
+    of the samples in each group. All the curves are interpolated onto the
+    same grid together, see resample_curves.
+
+    Parameters
+    ----------
+    results
+        The LorenzResults of the samples
+    groups, codes
+        The groups from group_samples
+    grid_size
+        The number of points of each mean curve
+
+    Returns
+    -------
+    tuple
+        A dataframe of gini statistics indexed by group, and a long table of
+        the group curves with Group, Cum Prop TRFs, Mean Cum Rel Abund, SD
+        Cum Rel Abund, Min Cum Rel Abund and Max Cum Rel Abund columns
+    '''
+    n_groups = len(groups)
+    curves = resample_curves(results, grid_size)
+    mean, sd, low, high = group_statistics(curves, codes, n_groups)
+    grid = np.linspace(0, 1, grid_size)
+
+    gini = group_statistics(results.ginis, codes, n_groups)
+    corrected = group_statistics(results.corrected_ginis, codes, n_groups)
+    gini_dataframe = pd.DataFrame({
+        'Samples': np.bincount(codes, minlength=n_groups),
+        'Mean Gini': gini[0], 'SD Gini': gini[1],
+        'Min Gini': gini[2], 'Max Gini': gini[3],
+        'Mean Corrected Gini': corrected[0],
+        'SD Corrected Gini': corrected[1],
+        # twice the area under the mean curve less the area under the 1:1
+        # line, the same as the gini coefficient of a curve
+        'Mean Curve Gini': (mean[:, 1:] + mean[:, :-1]).sum(axis=1) /
+        max(grid_size - 1, 1) - 1},
+        index=groups)
+
+    curve_dataframe = pd.DataFrame({
+        'Group': pd.Categorical.from_codes(
+            np.repeat(np.arange(n_groups), grid_size), categories=groups),
+        'Cum Prop TRFs': np.tile(grid, n_groups),
+        'Mean Cum Rel Abund': mean.ravel(),
+        'SD Cum Rel Abund': sd.ravel(),
+        'Min Cum Rel Abund': low.ravel(),
+        'Max Cum Rel Abund': high.ravel()})
+    return gini_dataframe, curve_dataframe
+
+
+def make_group_graph(curve_dataframe, filename, envelope='sd'):
+    '''
+    Makes a graph of the mean curve of each group with a shaded envelope
+
+    Parameters
+    ----------
+    curve_dataframe
+        The group curves from make_group_dataframes
+    filename
+        Name of the file to save the graph to
+    envelope
+        sd shades one standard deviation either side of the mean, range
+        shades between the lowest and highest curves of the group
+    '''
+    figure, axes = make_figure()
+    for group, curve in curve_dataframe.groupby('Group', observed=True,
+                                                sort=False):
+        x = curve['Cum Prop TRFs'].to_numpy()
+        mean = curve['Mean Cum Rel Abund'].to_numpy()
+        if envelope == 'range':
+            lower = curve['Min Cum Rel Abund'].to_numpy()
+            upper = curve['Max Cum Rel Abund'].to_numpy()
+        else:
+            sd = curve['SD Cum Rel Abund'].to_numpy()
+            lower, upper = np.clip(mean - sd, 0, 1), np.clip(mean + sd, 0, 1)
+        line, = axes.plot(x, mean, label=group)
+        axes.fill_between(x, lower, upper, color=line.get_color(), alpha=0.2,
+                          linewidth=0)
+    save_graph(figure, axes, filename)
+
+
+def run_groups(input_file, graph_file, output_file, mapping=None,
+               pattern=None, curve_file=None, envelope='sd',
+               grid_size=DISTANCE_GRID, jobs=1, normalise=False,
+               cache_dir=None, output_format=None):
+    '''
+    Runs a table whose samples are replicates of a few groups, saving the
+    mean curve and gini statistics of each group instead of every sample
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    graph_file
+        The file to save the graph of the group curves as, None doesn't make
+        a graph
+    output_file
+        The file to save the gini statistics of each group to
+    mapping, pattern
+        How to group the samples, see group_samples
+    curve_file
+        The file to save the group curves to, None doesn't save them
+    envelope
+        sd or range, the envelope drawn around each mean curve
+    grid_size
+        The number of points of each mean curve
+    jobs
+        Number of processes to spread the samples over
+    normalise
+        Divide each sample by its total first, for files of read counts
+    cache_dir
+        Directory read_table caches parsed tables in
+    output_format
+        The format to save the output and curve files in, see write_table
+
+    Returns
+    -------
+    tuple
+        The gini statistics and curves of each group, see
+        make_group_dataframes
+    '''
+    results = LorenzAnalyzer(jobs=jobs, normalise=normalise,
+                             cache_dir=cache_dir).analyze_file(input_file)
+    groups, codes = group_samples(results.samples, mapping, pattern)
+    gini_dataframe, curve_dataframe = make_group_dataframes(
+        results, groups, codes, grid_size)
+
+    if graph_file is not None:
+        make_group_graph(curve_dataframe, graph_file, envelope)
+    print(gini_dataframe)
+    write_table(gini_dataframe, output_file, output_format, float_format='%f')
+    if curve_file is not None:
+        write_table(curve_dataframe, curve_file, output_format, index=False)
+    return gini_dataframe, curve_dataframe
+
+
+def process_samples(dataframe, jobs=1, result_cache=None, counts=None,
+                    hashed_bins=None):
+    '''
+    Sorts, sums and cuts off every sample in a table and calculates their
+    gini coefficients. If a result cache directory is given each sample's
+    results are saved there, keyed by the hash of its non-zero bins and
+    values, and samples which haven't changed since an earlier run are loaded
+    instead of being calculated again, even if other samples or bins have
+    been added to the table.
+
+    Parameters
+    ----------
+    dataframe
+        The data frame to process, with any empty bins already removed
+    jobs
+        Number of processes to spread the samples over
+    result_cache
+        Directory to cache the results of each sample in, None doesn't use a
+        cache
+    counts
+        Optional dictionary to add the number of cache 'hits' and 'misses' to
+    hashed_bins
+        hash_bins of the table's bins if already worked out, e.g. for each
+        group of columns of the same table
+
+    Returns
+    -------
+    tuple
+        A list of dataframes, one per sample as made by build_samples, and
+        the gini coefficient of each sample
+    '''
+    if result_cache is None:
+        sorted_values, order, cumulative, lengths = process_matrix(
+            dataframe, jobs=jobs)
+        samples = build_samples(dataframe, sorted_values, order, cumulative,
+                                lengths)
+        return samples, matrix_gini(sorted_values, lengths)
+
+    values = dataframe.to_numpy(dtype=np.float64)
+    bins = dataframe.index.astype(str)
+    if hashed_bins is None:
+        hashed_bins = hash_bins(dataframe.index)
+    bin_hashes, bins_digest = hashed_bins
+    keys = sample_hashes(bin_hashes, values)
+    samples = [None] * len(keys)
+    ginis = np.empty(len(keys))
+
+    for i, key in enumerate(keys):
+        cached = _load_sample_result(result_cache, key)
+        if cached is not None and not cached['complete']:
+            # the curve kept some zero bins, so depends on the whole table
+            cached = _load_sample_result(
+                result_cache, _table_key(key, bins_digest))
+        if cached is None:
+            continue
+        rows = bins.get_indexer(cached['bins'])
+        if (rows < 0).any():
+            continue
+        samples[i] = pd.DataFrame(
+            {dataframe.columns[i]: cached['values'],
+             'Cum Rel Abund': cached['cumulative'],
+             'Cum Prop TRFs': cached['prop']},
+            index=dataframe.index[rows])
+        ginis[i] = cached['gini']
+
+    missing = [i for i, sample in enumerate(samples) if sample is None]
+    if missing:
+        sorted_values, order, cumulative, lengths = process_matrix(
+            values[:, missing], jobs=jobs)
+        new_samples = build_samples(dataframe.iloc[:, missing], sorted_values,
+                                    order, cumulative, lengths)
+        new_ginis = matrix_gini(sorted_values, lengths)
+        for j, i in enumerate(missing):
+            samples[i] = new_samples[j]
+            ginis[i] = new_ginis[j]
+            length = int(lengths[j])
+            complete = bool(length > 0 and
+                            cumulative[length - 1, j] > CUMULATIVE_THRESHOLD)
+            key = keys[i]
+            if not complete:
+                _save_sample_result(result_cache, key, complete=False)
+                key = _table_key(key, bins_digest)
+            _save_sample_result(result_cache, key, new_samples[j],
+                                bins[order[:length, j]], new_ginis[j],
+                                complete)
+
+    if counts is not None:
+        counts['hits'] = counts.get('hits', 0) + len(keys) - len(missing)
+        counts['misses'] = counts.get('misses', 0) + len(missing)
+    return samples, ginis
+
+
+def print_cache_counts(counts):
+    '''
+    Reports how many samples were found in the result cache
+
+    Parameters
+    ----------
+    counts
+        Dictionary of cache 'hits' and 'misses' from process_samples
+    '''
+    print("Result cache:", counts['hits'], "hits,", counts['misses'],
+          "misses")
+
+
+def hash_bins(bins):
+    '''
+    Hashes each bin name to 64 bits, and the whole list of bins, in one
+    vectorised pass so the names are only looked at once per table
+
+    Parameters
+    ----------
+    bins
+        The bin names of the table
+
+    Returns
+    -------
+    tuple
+        An array of the hash of each bin name and the digest of the table's
+        bins
+    '''
+    bin_hashes = pd.util.hash_array(np.asarray(bins, dtype=str).astype(object))
+    return bin_hashes, hashlib.sha256(bin_hashes.tobytes()).hexdigest()
+
+
+def sample_hashes(bin_hashes, values):
+    '''
+    Calculates a hash of each sample (column) in a table from the names and
+    values of its non-zero bins, so the results of unchanged samples can be
+    found again even after bins or samples are added to the table
+
+    Parameters
+    ----------
+    bin_hashes
+        The hash of each bin name, from hash_bins
+    values
+        2D numpy array of the values, one column per sample
+
+    Returns
+    -------
+    list
+        The hash of each sample as a hex string
+    '''
+    keys = []
+    for i in range(values.shape[1]):
+        rows = np.flatnonzero(values[:, i])
+        digest = hashlib.sha256(CACHE_VERSION.encode())
+        digest.update(bin_hashes[rows].tobytes())
+        digest.update(np.ascontiguousarray(values[rows, i]).tobytes())
+        keys.append(digest.hexdigest())
+    return keys
+
+
+def _table_key(key, bins_digest):
+    '''
+    The result cache key of a sample whose curve never reaches 1, so keeps
+    its zero bins and also depends on the bins of the rest of the table
+    '''
+    return hashlib.sha256((key + bins_digest).encode()).hexdigest()
+
+
+def _load_sample_result(result_cache, key):
+    '''
+    Loads a sample's results from the result cache, None if they aren't there
+    '''
+    try:
+        with np.load(os.path.join(result_cache, key + '.npz')) as cached:
+            return {name: cached[name] for name in cached.files}
+    except (OSError, ValueError):
+        return None
+
+
+def _save_sample_result(result_cache, key, sample=None, bins=None, gini=None,
+                        complete=True):
+    '''
+    Saves a sample's results to the result cache, using a temporary file so
+    other processes never see a partly written result. The bins of the kept
+    rows are saved by name so they can be found again in a different table.
+    An entry with complete False and no results marks a sample whose results
+    are saved under its _table_key.
+    '''
+    os.makedirs(result_cache, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=result_cache, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        if sample is None:
+            np.savez(f, complete=complete)
+        else:
+            n = len(sample)
+            corrected_gini = gini * n / (n - 1) if n > 1 else math.nan
+            np.savez(f, bins=np.asarray(bins, dtype=str),
+                     values=sample.iloc[:, 0].to_numpy(),
+                     cumulative=sample.loc[:, 'Cum Rel Abund'].to_numpy(),
+                     prop=sample.loc[:, 'Cum Prop TRFs'].to_numpy(),
+                     gini=gini, corrected_gini=corrected_gini, n=n,
+                     complete=complete)
+    os.replace(tmp, os.path.join(result_cache, key + '.npz'))
+
+
+class StageProfiler:
+    '''
+    Records how long each stage of a run takes and how much memory it uses,
+    writing one JSON line per stage. Each line has the stage name, the wall
+    and CPU time in seconds, the peak resident set size of the process so
+    far in bytes, any sizes (bins, samples, non-zeros) the stage reported
+    and, if allocation tracing is switched on, the peak number of bytes
+    allocated by python during the stage.
+
+    run uses a profiler which does nothing when it isn't given one, so the
+    cost of profiling is only paid when it is asked for.
+    '''
+
+    enabled = True
+
+    def __init__(self, filename=None, trace_allocations=False):
+        '''
+        Parameters
+        ----------
+        filename
+            File to append the JSON lines to, standard error if None. Only
+            the name is stored so the profiler can be passed to other
+            processes.
+        trace_allocations
+            Use tracemalloc to record the peak allocations of each stage,
+            this slows everything down a lot
+        '''
+        self.filename = filename
+        self.trace_allocations = trace_allocations
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, **context):
+        '''
+        Records a stage, use as a with statement. The dictionary it gives can
+        be updated with extra values such as sizes to add to the record.
+
+        Parameters
+        ----------
+        name
+            The name of the stage
+        context
+            Any other values to put in the record, e.g. the input file name
+        '''
+        record = {'stage': name}
+        record.update(context)
+        # only stop tracing afterwards if this stage started it
+        started = False
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started = True
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield record
+
+            record['wall_time'] = time.perf_counter() - wall
+            record['cpu_time'] = time.process_time() - cpu
+            record['peak_rss'] = _peak_rss()
+            if self.trace_allocations:
+                record['peak_allocated'] = \
+                    tracemalloc.get_traced_memory()[1] - allocated
+        finally:
+            if started:
+                tracemalloc.stop()
+        self.records.append(record)
+        self.emit(record)
+
+    def table_sizes(self, values):
+        '''
+        Works out the sizes of a table to add to a record
+
+        Parameters
+        ----------
+        values
+            A dataframe or 2D numpy array with one row per bin, or a
+            SparseTable
+
+        Returns
+        -------
+        dict
+            The number of bins, samples and non-zero values
+        '''
+        if isinstance(values, SparseTable):
+            # only the non-zero values are stored, so no counting is needed
+            return {'bins': len(values.bins), 'samples': len(values.samples),
+                    'nonzeros': len(values.data)}
+        values = np.asarray(values)
+        return {'bins': values.shape[0], 'samples': values.shape[1],
+                'nonzeros': int(np.count_nonzero(values))}
+
+    def emit(self, record):
+        '''
+        Writes a record as a JSON line
+
+        Parameters
+        ----------
+        record
+            The dictionary to write
+        '''
+        line = json.dumps(record, default=str) + '\n'
+        if self.filename is None:
+            sys.stderr.write(line)
+        else:
+            # one short append per line keeps lines from several processes
+            # from being mixed up
+            with open(self.filename, 'a') as f:
+                f.write(line)
+
+
+class _NullProfiler:
+    '''
+    A profiler which records nothing, used when profiling is switched off
+    '''
+
+    enabled = False
+
+    @contextmanager
+    def stage(self, name, **context):
+        yield {}
+
+    def table_sizes(self, values):
+        return {}
+
+
+def _peak_rss():
+    '''
+    The peak resident set size of this process in bytes, None if the
+    resource module isn't available (e.g. on Windows)
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_streaming(input_file, graph_file, output_file, memory_budget,
+                  jobs=1, tolerance=GRAPH_TOLERANCE, result_cache=None,
+                  bootstrap=0, confidence=0.95, seed=None, normalise=False,
+                  curve_file=None, output_format=None, indices=(),
+                  profiler=None):
+    '''
+    runs everything on a table too big to load at once. The text is parsed
+    once in chunks, the non-empty rows are kept in a temporary binary file
+    and the samples are processed one group of columns at a time from it.
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    graph_file
+        The file to save the graph as, None doesn't make a graph
+    output_file
+        The file to save the data to
+    memory_budget
+        Roughly how many bytes of table data to hold in memory at once
+    jobs
+        Number of processes to spread the samples over
+    tolerance
+        How far the graphed and saved curves may be from the full curves,
+        only the simplified curves are kept in memory
+    result_cache
+        Directory to cache the results of each sample in, see
+        process_samples
+    bootstrap, confidence, seed
+        Add bootstrap confidence intervals, see make_gini_dataframe
+    normalise
+        Divide each sample by its total first, for files of read counts
+    curve_file
+        The file to save the curve of every sample to, None doesn't save them
+    output_format
+        The format to save the output and curve files in, see write_table
+    indices
+        Evenness indices to add to the output, see make_gini_dataframe
+    profiler
+        A StageProfiler to record each stage with, see run. Each group of
+        columns is recorded as its own process_samples stage.
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        The gini coefficients of every sample
+    '''
+    if profiler is None:
+        profiler = _NullProfiler()
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        spill_file = os.path.join(spill_dir, 'values')
+        with profiler.stage('read_table', file=input_file) as record:
+            columns, report, bins, keep = scan_table(input_file,
+                                                     memory_budget,
+                                                     spill_file)
+            # the non-zero values are only counted group by group below
+            sizes = {'bins': len(bins), 'samples': len(columns)}
+            record.update(sizes)
+        totals = report.totals
+        if normalise:
+            report = normalised_report(report)
+        check_report(report)
+
+        if graph_file is not None:
+            figure, axes = make_figure()
+        counts = {'hits': 0, 'misses': 0}
+        # every group has the same bins, so they only need hashing once
+        hashed_bins = hash_bins(bins) if result_cache is not None else None
+        gini_dataframes = []
+        curve_dataframes = []
+        start = 0
+        for group, values in read_column_groups(spill_file, memory_budget,
+                                                columns, len(bins)):
+            with profiler.stage('process_samples', file=input_file,
+                                group=start) as record:
+                record.update(profiler.table_sizes(values))
+                if normalise:
+                    values = normalise_columns(
+                        values, totals[start:start + len(group)])
+                start += len(group)
+                dataframe = pd.DataFrame(values, index=bins, columns=group)
+                samples, ginis = process_samples(dataframe, jobs,
+                                                 result_cache, counts,
+                                                 hashed_bins)
+                # the curves of each group are added to the same figure
+                if graph_file is not None:
+                    add_curves(axes, samples, tolerance)
+                gini_dataframes.append(make_gini_dataframe(
+                    samples, ginis, bootstrap, confidence, seed, jobs,
+                    indices))
+                if curve_file is not None:
+                    curve_dataframes.append(make_curve_dataframe(samples,
+                                                                 tolerance))
+
+    if graph_file is not None:
+        with profiler.stage('make_graph', file=input_file, **sizes):
+            save_graph(figure, axes, graph_file)
+    if result_cache is not None:
+        print_cache_counts(counts)
+
+    with profiler.stage('make_gini_file', file=input_file, **sizes):
+        gini_dataframe = pd.concat(gini_dataframes)
+        print(gini_dataframe)
+        write_table(gini_dataframe, output_file, output_format,
+                    float_format='%f')
+    if curve_file is not None:
+        with profiler.stage('make_curve_file', file=input_file, **sizes):
+            curves = pd.concat(curve_dataframes, ignore_index=True)
+            curves['Sample'] = curves['Sample'].astype('category')
+            write_table(curves, curve_file, output_format, index=False)
+    return gini_dataframe
+
+
+def run_sparse(input_file, graph_file, output_file, memory_budget=None,
+               tolerance=GRAPH_TOLERANCE, long_format=False, bootstrap=0,
+               confidence=0.95, seed=None, jobs=1, normalise=False,
+               curve_file=None, output_format=None, indices=(),
+               profiler=None):
+    '''
+    runs everything only holding the non-zero values of the table, so memory
+    and time depend on the number of non-zero values rather than the number
+    of bins multiplied by the number of samples
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    graph_file
+        The file to save the graph as, None doesn't make a graph
+    output_file
+        The file to save the data to
+    memory_budget
+        Roughly how many bytes to use for each chunk of the file as it is read
+    tolerance
+        How far the graphed curves may be from the full curves, see
+        simplify_curve. None draws every point.
+    long_format
+        The file is in long format with Sample, Bin and Abundance columns,
+        see read_long_table
+    bootstrap, confidence, seed, jobs
+        Add bootstrap confidence intervals, see make_gini_dataframe
+    normalise
+        Divide each sample by its total first, for files of read counts
+    curve_file
+        The file to save the curve of every sample to, None doesn't save them
+    output_format
+        The format to save the output and curve files in, see write_table
+    indices
+        Evenness indices to add to the output, see make_gini_dataframe
+    profiler
+        A StageProfiler to record each stage with, see run
+
+    Returns
+    -------
+    list
+        A list of dataframes, one per sample
+    '''
+    if profiler is None:
+        profiler = _NullProfiler()
+
+    with profiler.stage('read_table', file=input_file) as record:
+        if long_format:
+            if memory_budget is None:
+                table = read_long_table(input_file)
+            else:
+                table = read_long_table(input_file, chunksize=max(
+                    1, int(memory_budget // (8 * 4 * 3))))
+        elif memory_budget is None:
+            table = read_sparse_table(input_file)
+        else:
+            columns = pd.read_csv(input_file, delimiter='\t',
+                                  index_col='Bin', nrows=0).columns
+            table = read_sparse_table(input_file, chunksize=max(
+                1, int(memory_budget // (8 * 4 * (len(columns) + 1)))))
+        sizes = profiler.table_sizes(table)
+        record.update(sizes)
+
+    with profiler.stage('check_columns', file=input_file, **sizes):
+        report = sparse_report(table)
+        if normalise:
+            cols = np.repeat(np.arange(len(table.samples)),
+                             np.diff(table.indptr))
+            table = table._replace(data=normalise_columns(
+                table.data, report.totals[cols]))
+            report = normalised_report(report)
+    check_report(report)
+
+    with profiler.stage('remove_zeros', file=input_file) as record:
+        table = remove_sparse_zeros(table)
+        sizes = profiler.table_sizes(table)
+        record.update(sizes)
+
+    with profiler.stage('process_samples', file=input_file, **sizes):
+        samples, ginis = process_sparse_samples(table)
+
+    if graph_file is not None:
+        with profiler.stage('make_graph', file=input_file, **sizes):
+            make_graph(samples, graph_file, tolerance)
+    with profiler.stage('make_gini_file', file=input_file, **sizes):
+        make_gini_file(samples, output_file, ginis, bootstrap, confidence,
+                       seed, jobs, output_format, indices)
+    if curve_file is not None:
+        with profiler.stage('make_curve_file', file=input_file, **sizes):
+            make_curve_file(samples, curve_file, tolerance, output_format)
+    return samples
+
+
+def run(input_file, graph_file, output_file, jobs=1, memory_budget=None,
+        tolerance=GRAPH_TOLERANCE, cache_dir=None,
+        cache_size=DEFAULT_CACHE_SIZE, result_cache=None, sparse=False,
+        long_format=False, profiler=None, bootstrap=0, confidence=0.95,
+        seed=None, normalise=False, curve_file=None, output_format=None,
+        indices=()):
+    '''
+    runs everything
+    **** change this function to alter filenames ****
+
+    Parameters
+    ----------
+    input_file
+        The file to read data from
+    graph_file
+        The file to save the graph as, None doesn't make a graph
+    output_file
+        The file to save the data to
+    jobs
+        Number of processes to spread the samples over
+    memory_budget
+        If given, the table is streamed in chunks using roughly this many
+        bytes at once, see run_streaming. The gini coefficients are returned
+        instead of the samples in this case.
+    tolerance
+        How far the graphed curves may be from the full curves, see
+        simplify_curve. None draws every point.
+    cache_dir
+        Directory to cache the parsed input in, see read_table. None doesn't
+        use a cache.
+    cache_size
+        The most bytes the cache can use
+    result_cache
+        Directory to cache the results of each sample in, so only new or
+        changed samples are calculated, see process_samples. None doesn't
+        use a cache.
+    sparse
+        Only hold the non-zero values of the table, see run_sparse. The
+        memory budget sets how much of the file is read at once.
+    long_format
+        The file is in long format with Sample, Bin and Abundance columns
+        instead of one column per sample, see read_long_table. These are
+        always read with the sparse path.
+    profiler
+        A StageProfiler to record the time and memory used by each stage,
+        None doesn't record anything. The streaming and sparse paths record
+        their own read, process and write stages.
+    bootstrap
+        If more than 0, the number of bootstrap resamples used to add
+        confidence intervals to the output file, see bootstrap_intervals
+    confidence
+        The confidence level of the intervals
+    seed
+        Seed for the bootstrap resamples, None gives different intervals
+        each time
+    normalise
+        Divide each sample by its total before checking it, so files of read
+        counts can be used directly
+    curve_file
+        The file to save the curve of every sample to, simplified with the
+        same tolerance as the graph. None doesn't save them.
+    output_format
+        The format to save the output and curve files in, see write_table.
+        None guesses it from each file's extension.
+    indices
+        Keys of EVENNESS_INDICES to add to the output file as extra columns,
+        calculated from the same sorted values as the gini coefficients
+
+    Raises
+    ------
+    ValueError
+        If any sample doesn't sum to 1 or has missing or negative values,
+        listing every one of them
+    '''
+    if profiler is None:
+        profiler = _NullProfiler()
+
+    if sparse or long_format:
+        return run_sparse(input_file, graph_file, output_file,
+                          memory_budget=memory_budget, tolerance=tolerance,
+                          long_format=long_format, bootstrap=bootstrap,
+                          confidence=confidence, seed=seed, jobs=jobs,
+                          normalise=normalise, curve_file=curve_file,
+                          output_format=output_format, indices=indices,
+                          profiler=profiler)
+
+    if memory_budget is not None:
+        return run_streaming(input_file, graph_file, output_file,
+                             memory_budget, jobs=jobs, tolerance=tolerance,
+                             result_cache=result_cache, bootstrap=bootstrap,
+                             confidence=confidence, seed=seed,
+                             normalise=normalise, curve_file=curve_file,
+                             output_format=output_format, indices=indices,
+                             profiler=profiler)
+
+    with profiler.stage('read_table', file=input_file) as record:
+        dataframe = read_table(input_file, cache_dir, cache_size)
+        sizes = profiler.table_sizes(dataframe)
+        record.update(sizes)
+
+    # check all columns sum to 1, if so proceed and calculate/graph
+    with profiler.stage('check_columns', file=input_file, **sizes):
+        report = column_report(dataframe.columns,
+                               dataframe.to_numpy(dtype=np.float64))
+        if normalise:
+            dataframe = normalise_columns(dataframe, report.totals)
+            report = normalised_report(report)
+    check_report(report)
+
+    with profiler.stage('remove_zeros', file=input_file) as record:
+        dataframe = remove_zeros(dataframe)
+        # every later stage works on the table without the empty bins
+        sizes = profiler.table_sizes(dataframe)
+        record.update(sizes)
+
+    # sort, cumulative sum and cut off every sample in one go
+    with profiler.stage('process_samples', file=input_file,
+                        **sizes) as record:
+        counts = {'hits': 0, 'misses': 0}
+        samples, ginis = process_samples(dataframe, jobs, result_cache, counts)
+        if result_cache is not None:
+            record.update(counts)
+            print_cache_counts(counts)
+
+    if graph_file is not None:
+        with profiler.stage('make_graph', file=input_file, **sizes):
+            make_graph(samples, graph_file, tolerance)
+
+    with profiler.stage('make_gini_file', file=input_file, **sizes):
+        make_gini_file(samples, output_file, ginis, bootstrap, confidence,
+                       seed, jobs, output_format, indices)
+    if curve_file is not None:
+        with profiler.stage('make_curve_file', file=input_file, **sizes):
+            make_curve_file(samples, curve_file, tolerance, output_format)
+    return samples
+
+
+# files made by earlier batch runs, these are skipped when expanding inputs
+BATCH_SUFFIXES = tuple(['.graph.png'] +
+                       ['.output' + extension
+                        for extension in OUTPUT_FORMATS.values()] +
+                       ['.curves' + extension
+                        for extension in OUTPUT_FORMATS.values()])
+
+
+def expand_inputs(inputs):
+    '''
+    Turns a list of files, directories and glob patterns into a list of input
+    files. Directories give every file directly inside them, apart from the
+    output files of earlier batch runs.
+
+    Parameters
+    ----------
+    inputs
+        The file names, directory names and glob patterns
+
+    Returns
+    -------
+    list
+        The input files, in the order given with each directory or pattern
+        sorted by name
+    '''
+    files = []
+    for name in inputs:
+        if os.path.isdir(name):
+            matches = [os.path.join(name, f) for f in sorted(os.listdir(name))
+                       if os.path.isfile(os.path.join(name, f))]
+        elif glob.has_magic(name):
+            matches = sorted(f for f in glob.glob(name) if os.path.isfile(f))
+        else:
+            files.append(name)
+            continue
+        files.extend(f for f in matches if not f.endswith(BATCH_SUFFIXES))
+    return files
+
+
+def _run_batch_file(input_file, graph, curves, options):
+    '''
+    Runs one file of a batch, returning how long it took and the error
+    message if it failed
+    '''
+    extension = OUTPUT_FORMATS[options.get('output_format') or 'tsv']
+    start = time.perf_counter()
+    try:
+        run(input_file, input_file + ".graph.png" if graph else None,
+            input_file + ".output" + extension,
+            curve_file=input_file + ".curves" + extension if curves else None,
+            **options)
+    except Exception as error:
+        return time.perf_counter() - start, str(error) or repr(error)
+    return time.perf_counter() - start, None
+
+
+def run_batch(input_files, workers=1, graph=True, curves=False, **options):
+    '''
+    Runs many input files in one process, or spread over a pool of
+    processes, so the start up cost is only paid once. The graph, output and
+    curve file names are made by adding ".graph.png", ".output.tsv" and
+    ".curves.tsv" to each input file name, with the extension of the output
+    format if another one is given. A file which fails is reported rather
+    than stopping the batch.
+
+    Parameters
+    ----------
+    input_files
+        The files to read data from
+    workers
+        Number of processes to spread the files over
+    graph
+        Whether to make a graph for each file
+    curves
+        Whether to save the curves of each file, see make_curve_file
+    options
+        Any other keyword arguments are passed on to run
+
+    Returns
+    -------
+    list
+        A (file name, seconds taken, error message or None) tuple for each
+        file, in the same order as input_files
+    '''
+    if workers > 1 and len(input_files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_batch_file, input_files,
+                                    [graph] * len(input_files),
+                                    [curves] * len(input_files),
+                                    [options] * len(input_files)))
+    else:
+        results = [_run_batch_file(f, graph, curves, options)
+                   for f in input_files]
+
+    return [(f, seconds, error)
+            for f, (seconds, error) in zip(input_files, results)]
+
+
+def print_batch_summary(results):
+    '''
+    Prints how long each file in a batch took and which ones failed
+
+    Parameters
+    ----------
+    results
+        The list returned by run_batch
+    '''
+    print("Batch summary:")
+    width = max([len(f) for f, _, _ in results] + [4])
+    for input_file, seconds, error in results:
+        status = "ok" if error is None else "failed: " + error
+        print("{:<{width}}  {:8.3f}s  {}".format(input_file, seconds, status,
+                                                 width=width))
+    failed = sum(1 for _, _, error in results if error is not None)
+    print(len(results), "files,", failed, "failed,",
+          "{:.3f}s in total".format(sum(s for _, s, _ in results)))
+
+
+# how often a watched directory is looked at and how long a file must stay
+# the same size and age before it is treated as completely written, seconds
+WATCH_INTERVAL = 2.0
+WATCH_SETTLE = 5.0
+# name of the file a watched directory's state is kept in
+WATCH_STATE = '.pl_curve_watch.json'
+# how many files a watch worker process handles before it is replaced, so
+# memory doesn't creep up over days of running
+WATCH_RECYCLE = 100
+
+
+def load_watch_state(state_file):
+    '''
+    Reads the state file of a watched directory
+
+    Parameters
+    ----------
+    state_file
+        The JSON file the state is kept in
+
+    Returns
+    -------
+    dict
+        The size, modification time, hash and error of every file that has
+        been processed, keyed by file name. Empty if there is no state file.
+    '''
+    try:
+        with open(state_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_watch_state(state, state_file):
+    '''
+    Writes the state file of a watched directory, replacing the old one in
+    one go so it is never left half written
+
+    Parameters
+    ----------
+    state
+        The state, see load_watch_state
+    state_file
+        The JSON file the state is kept in
+    '''
+    directory = os.path.dirname(os.path.abspath(state_file))
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(temporary, state_file)
+
+
+def watch_candidates(directory, state_file):
+    '''
+    Lists the files in a watched directory which might be input tables,
+    leaving out outputs, the state file and hidden or temporary files
+
+    Parameters
+    ----------
+    directory
+        The watched directory
+    state_file
+        The state file, which may be in the directory
+
+    Returns
+    -------
+    list
+        The file names
+    '''
+    state_file = os.path.abspath(state_file)
+    return [f for f in expand_inputs([directory])
+            if not os.path.basename(f).startswith('.')
+            and not f.endswith(('.tmp', '.part', '~'))
+            and os.path.abspath(f) != state_file]
+
+
+def watch(directory, state_file=None, workers=1, interval=WATCH_INTERVAL,
+          settle=WATCH_SETTLE, graph=True, curves=False, once=False,
+          **options):
+    '''
+    Watches a directory and runs every new or changed table in it, naming
+    the outputs like run_batch. A file is only run once its size and
+    modification time have stayed the same for settle seconds, so files
+    still being written are left alone. Files which have only been touched
+    are recognised by their hash and not run again. What has been run is
+    kept in a state file so restarting doesn't run everything again.
+
+    Parameters
+    ----------
+    directory
+        The directory to watch
+    state_file
+        The JSON file to keep the state in, WATCH_STATE in the directory if
+        None
+    workers
+        Number of processes to run files in
+    interval
+        Seconds between looking at the directory
+    settle
+        Seconds a file must stay unchanged before it is run
+    graph
+        Whether to make a graph for each file
+    curves
+        Whether to save the curves of each file, see make_curve_file
+    once
+        Return once every file is up to date instead of watching for ever
+    options
+        Any other keyword arguments are passed on to run
+
+    Returns
+    -------
+    list
+        A (file name, seconds taken, error message or None) tuple for each
+        file run, only when once is set
+    '''
+    if state_file is None:
+        state_file = os.path.join(directory, WATCH_STATE)
+    state = load_watch_state(state_file)
+    # the size and modification time each waiting file was last seen with
+    # and when it was first seen like that
+    waiting = {}
+    # the file each running future is for and the state to record for it
+    running = {}
+    results = []
+
+    pool_options = {}
+    if sys.version_info >= (3, 11):
+        pool_options['max_tasks_per_child'] = WATCH_RECYCLE
+    with ProcessPoolExecutor(max_workers=workers, **pool_options) as pool:
+        while True:
+            now = time.monotonic()
+            present = set()
+            busy = set(input_file for input_file, _ in running.values())
+            for input_file in watch_candidates(directory, state_file):
+                present.add(input_file)
+                if input_file in busy:
+                    continue
+                try:
+                    stat = os.stat(input_file)
+                except FileNotFoundError:
+                    continue
+                seen = [stat.st_size, stat.st_mtime_ns]
+                done = state.get(input_file)
+                if done is not None and [done['size'],
+                                         done['mtime_ns']] == seen:
+                    waiting.pop(input_file, None)
+                    continue
+                # wait for the file to stop changing
+                if input_file not in waiting or \
+                        waiting[input_file][0] != seen:
+                    waiting[input_file] = (seen, now)
+                    continue
+                if now - waiting[input_file][1] < settle:
+                    continue
+                del waiting[input_file]
+
+                digest = hash_file(input_file)
+                if done is not None and done['sha256'] == digest:
+                    done['size'], done['mtime_ns'] = seen
+                    save_watch_state(state, state_file)
+                    continue
+                future = pool.submit(_run_batch_file, input_file, graph,
+                                     curves, options)
+                running[future] = (input_file, dict(
+                    size=seen[0], mtime_ns=seen[1], sha256=digest))
+
+            for future in [f for f in running if f.done()]:
+                input_file, record = running.pop(future)
+                try:
+                    seconds, error = future.result()
+                except Exception as exception:
+                    seconds, error = 0.0, str(exception) or repr(exception)
+                state[input_file] = dict(record, error=error)
+                save_watch_state(state, state_file)
+                status = "ok" if error is None else "failed: " + error
+                print("{}  {:.3f}s  {}".format(input_file, seconds, status),
+                      flush=True)
+                if once:
+                    results.append((input_file, seconds, error))
+
+            # forget files which have gone so the state doesn't grow for ever
+            gone = set(state) - present
+            for input_file in gone:
+                del state[input_file]
+            if gone:
+                save_watch_state(state, state_file)
+            for input_file in set(waiting) - present:
+                del waiting[input_file]
+
+            if once and not waiting and not running:
+                return results
+            time.sleep(interval)
+
+
+# how many requests can wait for a worker before new ones are turned away,
+# and the largest request body accepted in bytes
+SERVE_QUEUE = 64
+SERVE_MAX_BODY = 256 * 1024 * 1024
+
+
+def parse_request_table(body, content_type):
+    '''
+    Reads the abundance table sent to the server, either a tab separated
+    table with a Bin column or JSON in long format
+
+    Parameters
+    ----------
+    body
+        The request body as bytes
+    content_type
+        The Content-Type header of the request. application/json bodies are
+        a list of objects, or an object of lists, with Sample, Bin and
+        Abundance keys. Anything else is read as a tab separated table.
+
+    Returns
+    -------
+    tuple
+        The sample names, the bin names and a 2D numpy array of the values
+        with one row per bin and one column per sample
+
+    Raises
+    ------
+    ValueError
+        If the body can't be read as a table
+    '''
+    if content_type.split(';')[0].strip() == 'application/json':
+        try:
+            frame = pd.DataFrame(json.loads(body))
+        except (TypeError, json.JSONDecodeError) as error:
+            raise ValueError("can't read JSON body: " + str(error))
+        missing = {'Sample', 'Bin', 'Abundance'} - set(frame.columns)
+        if missing:
+            raise ValueError("JSON body is missing " +
+                             ", ".join(sorted(missing)))
+        sample_codes, samples = pd.factorize(frame['Sample'])
+        bin_codes, bins = pd.factorize(frame['Bin'])
+        values = np.zeros((len(bins), len(samples)))
+        # repeated sample and bin pairs are added together
+        np.add.at(values, (bin_codes, sample_codes),
+                  frame['Abundance'].to_numpy(dtype=np.float64))
+        return list(samples), bins, values
+
+    dataframe = pd.read_csv(io.BytesIO(body), delimiter='\t', index_col='Bin')
+    return (list(dataframe.columns), dataframe.index,
+            dataframe.to_numpy(dtype=np.float64))
+
+
+def serve_request(body, content_type, normalise=False,
+                  tolerance=GRAPH_TOLERANCE, graph=False):
+    '''
+    Does the work for one request to the server, in a worker process
+
+    Parameters
+    ----------
+    body, content_type
+        The request body and its Content-Type, see parse_request_table
+    normalise
+        Divide each sample by its total first, for tables of read counts
+    tolerance
+        How far the returned curves may be from the full curves, see
+        simplify_curve. None returns every point.
+    graph
+        Also return the graph as a base64 encoded PNG
+
+    Returns
+    -------
+    tuple
+        The JSON response body as bytes and the seconds the work took
+    '''
+    start = time.perf_counter()
+    samples, bins, values = parse_request_table(body, content_type)
+    results = LorenzAnalyzer(normalise=normalise).analyze(values, samples,
+                                                          bins)
+
+    def number(value):
+        # JSON has no NaN
+        return None if math.isnan(value) else float(value)
+
+    response = {'samples': []}
+    for sample in results:
+        x = sample.cum_prop_trfs
+        y = sample.cum_rel_abund
+        if tolerance is not None:
+            keep = simplify_curve(x, y, tolerance)
+            x, y = x[keep], y[keep]
+        response['samples'].append({
+            'sample': str(sample.name), 'gini': number(sample.gini),
+            'corrected_gini': number(sample.corrected_gini), 'n': sample.n,
+            'curve': {'Cum Prop TRFs': x.tolist(),
+                      'Cum Rel Abund': y.tolist()}})
+    if graph:
+        png = io.BytesIO()
+        make_graph(results.to_dataframes(), png, tolerance)
+        response['graph'] = base64.b64encode(png.getvalue()).decode('ascii')
+    return json.dumps(response).encode(), time.perf_counter() - start
+
+
+def _warm_worker():
+    '''
+    Imports everything a request needs when a server worker starts, so the
+    first request doesn't pay for it
+    '''
+    pd.DataFrame
+    from matplotlib.figure import Figure  # noqa: F401
+
+
+class GiniServer:
+    '''
+    A small HTTP server which keeps the worker processes, pandas and
+    matplotlib loaded between requests. It only listens on localhost unless
+    told otherwise.
+
+    POST /gini with a table as the body returns the Gini, Corrected Gini, n
+    and curve of every sample as JSON, see serve_request. The query string
+    can have normalise=1, graph=1 and tolerance=<number>. GET /health
+    returns how busy the server is.
+
+    At most workers requests are worked on at once and up to queue more wait
+    for a worker, after that requests get a 503. Every response has a
+    Server-Timing header with the milliseconds spent waiting for a worker,
+    computing and in total.
+    '''
+
+    def __init__(self, host='127.0.0.1', port=8000, workers=1,
+                 queue=SERVE_QUEUE, max_body=SERVE_MAX_BODY, timeout=None):
+        '''
+        Parameters
+        ----------
+        host
+            The address to listen on
+        port
+            The port to listen on, 0 picks a free one
+        workers
+            Number of worker processes
+        queue
+            How many requests can wait for a worker
+        max_body
+            The largest request body accepted in bytes
+        timeout
+            Seconds a request can take to compute before a 504 is returned,
+            None waits for ever. The worker carries on with it either way
+            and its slot isn't free until it has finished.
+        '''
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue = queue
+        self.max_body = max_body
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self._pool = None
+        self._slots = None
+        self._server = None
+
+    async def start(self):
+        '''
+        Starts the worker processes and starts listening, the port is
+        updated with the one actually used
+        '''
+        self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                         initializer=_warm_worker)
+        self._slots = asyncio.Semaphore(self.workers)
+        # start every worker now rather than on the first requests
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self._pool, _warm_worker)
+                               for _ in range(self.workers)])
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        '''
+        Starts the server and handles requests until cancelled, or until the
+        process is sent SIGTERM
+        '''
+        await self.start()
+        print("Serving on http://{}:{}".format(self.host, self.port))
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            # signal handlers can't be added on windows
+            pass
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await self.close()
+
+    async def close(self):
+        '''Stops listening and shuts down the worker processes'''
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            if sys.version_info >= (3, 9):
+                self._pool.shutdown(cancel_futures=True)
+            else:
+                self._pool.shutdown()
+
+    async def _handle(self, reader, writer):
+        '''Reads one request, answers it and closes the connection'''
+        received = time.perf_counter()
+        timing = {}
+        try:
+            status, body, content_type = await self._answer(reader, timing)
+        except Exception as error:
+            status, body, content_type = 500, _error_body(error), \
+                'application/json'
+        timing['total'] = time.perf_counter() - received
+
+        headers = [
+            'HTTP/1.1 {} {}'.format(status, HTTPStatus(status).phrase),
+            'Content-Type: ' + content_type,
+            'Content-Length: {}'.format(len(body)),
+            'Connection: close',
+            'Server-Timing: ' + ', '.join(
+                '{};dur={:.3f}'.format(name, seconds * 1000)
+                for name, seconds in timing.items())]
+        if status == 503:
+            headers.append('Retry-After: 1')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1') +
+                     body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _answer(self, reader, timing):
+        '''
+        Works out the response to a request
+
+        Returns
+        -------
+        tuple
+            The status code, body and content type of the response
+        '''
+        try:
+            method, target, headers = await _read_request_head(reader)
+            url = urllib.parse.urlsplit(target)
+            if url.path == '/health' and method == 'GET':
+                return 200, json.dumps({
+                    'workers': self.workers, 'running': self.running,
+                    'waiting': self.waiting}).encode(), 'application/json'
+            length, options = self._check_request(method, url, headers)
+        except _RequestError as error:
+            return error.status, _error_body(error), 'application/json'
+
+        # turn busy requests away before reading their bodies, which counts
+        # as waiting so the bound holds while bodies are read
+        if self.running + self.waiting >= self.workers + self.queue:
+            return 503, _error_body("server busy"), 'application/json'
+        self.waiting += 1
+        try:
+            body = await reader.readexactly(length)
+            queued = time.perf_counter()
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        timing['queue'] = time.perf_counter() - queued
+
+        try:
+            response = await self._compute(
+                body, headers.get('content-type', ''), options, timing)
+        except asyncio.TimeoutError:
+            return 504, _error_body("timed out"), 'application/json'
+        except ValueError as error:
+            return 400, _error_body(error), 'application/json'
+        return 200, response, 'application/json'
+
+    def _check_request(self, method, url, headers):
+        '''
+        Checks a request for /gini can be answered
+
+        Returns
+        -------
+        tuple
+            The length of the body and the keyword arguments for
+            serve_request from the query string
+
+        Raises
+        ------
+        _RequestError
+            If it can't be answered
+        '''
+        if url.path != '/gini':
+            raise _RequestError(404, "not found")
+        if method != 'POST':
+            raise _RequestError(405, "use POST")
+        try:
+            length = int(headers['content-length'])
+        except (KeyError, ValueError):
+            raise _RequestError(411, "Content-Length needed")
+        if length < 0:
+            raise _RequestError(400, "Content-Length can't be negative")
+        if length > self.max_body:
+            raise _RequestError(413, "body too large")
+
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            tolerance = float(query.get('tolerance', [GRAPH_TOLERANCE])[0])
+        except ValueError:
+            raise _RequestError(400, "tolerance should be a number")
+        return length, dict(
+            normalise=query.get('normalise', ['0'])[0] not in ('0', ''),
+            tolerance=tolerance if tolerance > 0 else None,
+            graph=query.get('graph', ['0'])[0] not in ('0', ''))
+
+    async def _compute(self, body, content_type, options, timing):
+        '''
+        Runs serve_request in a worker once a slot has been acquired. The
+        slot is only given back once the worker has finished, which can be
+        after the request has timed out.
+        '''
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._pool.submit(serve_request, body, content_type,
+                                       **options)
+        except Exception:
+            self._finished()
+            raise
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._finished))
+
+        response, timing['compute'] = await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        return response
+
+    def _finished(self):
+        '''Gives back a worker's slot once its request is done'''
+        self.running -= 1
+        self._slots.release()
+
+
+class _RequestError(Exception):
+    '''A request GiniServer can't answer, with the status code to give'''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_request_head(reader):
+    '''
+    Reads the request line and headers of a request
+
+    Returns
+    -------
+    tuple
+        The method, target and a dictionary of the headers with lower case
+        names
+
+    Raises
+    ------
+    _RequestError
+        If the request is malformed
+    '''
+    try:
+        request_line = (await reader.readline()).decode('latin-1')
+        method, target, _ = request_line.split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    except ValueError:
+        raise _RequestError(400, "malformed request")
+    return method, target, headers
+
+
+def _error_body(error):
+    '''The JSON body of an error response'''
+    return json.dumps({'error': str(error)}).encode()
+
+
+def make_parser():
+    '''
+    Makes the parser for the command line options
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        The parser
+    '''
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputfile', nargs='*',
+                        help='Input files, directories or glob patterns')
+    parser.add_argument('-g', '--graph', help='Graph file name, only for a '
+                        'single input file', required=False)
+    parser.add_argument('-o', '--output', help='Output data file name, only '
+                        'for a single input file', required=False)
+    parser.add_argument('-c', '--curves', help='Save the curve of every '
+                        'sample to this file, or next to each input file if '
+                        'a batch is run', nargs='?', const='', required=False)
+    parser.add_argument('-f', '--format', help='Format of the output and '
+                        'curve files, guessed from the file name if not '
+                        'given', choices=sorted(OUTPUT_FORMATS),
+                        required=False)
+    parser.add_argument('-n', '--no-graph', help="Don't make a graph, "
+                        'plain numeric tables are then read without pandas',
+                        action='store_true')
+    parser.add_argument('--serve', help='Run a server on [HOST:]PORT which '
+                        'calculates the gini coefficients of tables posted '
+                        'to /gini, using --workers processes',
+                        metavar='[HOST:]PORT', required=False)
+    parser.add_argument('--serve-queue', help='Number of requests which can '
+                        'wait for a server worker', type=int,
+                        default=SERVE_QUEUE, required=False)
+    parser.add_argument('--serve-timeout', help='Seconds a server request '
+                        'can take', type=float, required=False)
+    parser.add_argument('--watch', help='Keep watching this directory and '
+                        'run every new or changed table in it, using '
+                        '--workers processes', metavar='DIR', required=False)
+    parser.add_argument('--watch-state', help='File to keep track of the '
+                        'tables already run in, ' + WATCH_STATE + ' in the '
+                        'watched directory by default', required=False)
+    parser.add_argument('--watch-interval', help='Seconds between looking '
+                        'at the watched directory', type=float,
+                        default=WATCH_INTERVAL, required=False)
+    parser.add_argument('--settle', help='Seconds a watched file must stay '
+                        'unchanged before it is run, so half written files '
+                        'are left alone', type=float, default=WATCH_SETTLE,
+                        required=False)
+    parser.add_argument('-w', '--workers', help='Number of processes to '
+                        'spread several input files over',
+                        type=int, default=1, required=False)
+    parser.add_argument('-j', '--jobs', help='Number of processes to use',
+                        type=int, default=1, required=False)
+    parser.add_argument('-m', '--memory-budget',
+                        help='Stream the input file using about this many MB',
+                        type=float, required=False)
+    parser.add_argument('-s', '--sparse', help='Only hold the non-zero '
+                        'values of the input file', action='store_true')
+    parser.add_argument('-l', '--long', help='The input file has Sample, Bin '
+                        'and Abundance columns with one line per sample and '
+                        'bin', action='store_true')
+    parser.add_argument('--normalise', help='Divide each sample by its '
+                        'total first, so tables of read counts can be used',
+                        action='store_true')
+    parser.add_argument('--check', help='Report the total, deviation from 1 '
+                        'and missing and negative values of every sample '
+                        'without calculating anything', action='store_true')
+    parser.add_argument('-t', '--tolerance',
+                        help='How far the graphed curves may be from the '
+                        'full curves, 0 draws every point',
+                        type=float, default=GRAPH_TOLERANCE, required=False)
+    parser.add_argument('-e', '--evenness', help='Comma separated evenness '
+                        'indices to add to the output, from ' +
+                        ', '.join(EVENNESS_INDICES) + ' or all',
+                        required=False)
+    parser.add_argument('-b', '--bootstrap', help='Add confidence intervals '
+                        'to the output from this many bootstrap resamples',
+                        type=int, default=0, required=False)
+    parser.add_argument('--confidence', help='Confidence level of the '
+                        'bootstrap intervals', type=float, default=0.95,
+                        required=False)
+    parser.add_argument('-r', '--rarefy', help='Comma separated sequencing '
+                        'depths to rarefy each sample to, writes the gini '
+                        'coefficient at each depth instead of the usual '
+                        'output', required=False)
+    parser.add_argument('--replicates', help='Number of subsamples drawn at '
+                        'each rarefaction depth', type=int, default=10,
+                        required=False)
+    parser.add_argument('--total', help='Number of reads the relative '
+                        'abundances were made from, for rarefying files '
+                        "that don't have read counts", type=float,
+                        required=False)
+    parser.add_argument('--seed', help='Seed for the bootstrap and '
+                        'rarefaction resamples', type=int, required=False)
+    parser.add_argument('-d', '--distances', help='Compare the curves of '
+                        'every pair of samples, saving the area between them '
+                        'and the largest gap between them as matrices in '
+                        'files starting with PREFIX, instead of the usual '
+                        'output', metavar='PREFIX', required=False)
+    parser.add_argument('--distance-format', help='Format of the distance '
+                        'matrices', choices=['npy', 'tsv'], default='npy',
+                        required=False)
+    parser.add_argument('--grid', help='Number of points of each curve '
+                        'compared for the distances or averaged for the '
+                        'groups', type=int,
+                        default=DISTANCE_GRID, required=False)
+    parser.add_argument('--groups', help='Tab separated file of sample '
+                        'names and their groups, writes the mean curve and '
+                        'gini statistics of each group instead of the usual '
+                        'output', metavar='FILE', required=False)
+    parser.add_argument('--group-pattern', help='Regular expression finding '
+                        'the group in each sample name, its first bracketed '
+                        'group is used if it has one', metavar='REGEX',
+                        required=False)
+    parser.add_argument('--envelope', help='Shade one standard deviation '
+                        'or the range of each group around its mean curve',
+                        choices=['sd', 'range'], default='sd', required=False)
+    parser.add_argument('-p', '--profile', help='Write the time and memory '
+                        'used by each stage as JSON lines to this file, or '
+                        'standard error if no file is given', nargs='?',
+                        const='-', required=False)
+    parser.add_argument('--profile-allocations', help='Also record the '
+                        'peak python allocations of each stage, this is '
+                        'slow', action='store_true')
+    parser.add_argument('--cache-dir', help='Directory to cache parsed input '
+                        'files in', default=DEFAULT_CACHE_DIR, required=False)
+    parser.add_argument('--cache-size', help='Most MB the cache can use',
+                        type=float, default=DEFAULT_CACHE_SIZE / 1024 / 1024,
+                        required=False)
+    parser.add_argument('--no-cache', help="Don't cache parsed input files",
+                        action='store_true')
+    parser.add_argument('--result-cache', help='Directory to cache the '
+                        'results of each sample in, so only new or changed '
+                        'samples are calculated', required=False)
+
+    return parser
+
+
+def check_args(parser, args):
+    '''
+    Checks the command line options go together, exiting with a usage
+    message if they don't
+
+    Parameters
+    ----------
+    parser
+        The parser from make_parser
+    args
+        The parsed arguments
+
+    Returns
+    -------
+    tuple
+        The input files and whether there's just one of them
+    '''
+    if args.watch is not None:
+        if args.inputfile:
+            parser.error("input files can't be given with --watch")
+        if not os.path.isdir(args.watch):
+            parser.error("--watch should be a directory")
+    elif not args.inputfile:
+        parser.error("an input file is needed")
+
+    input_files = expand_inputs(args.inputfile)
+    single = len(args.inputfile) == 1 and input_files == args.inputfile
+    if args.no_graph and args.graph is not None:
+        parser.error("--graph can't be used with --no-graph")
+    if not single and (args.graph is not None or args.output is not None
+                       or args.curves):
+        parser.error("--graph, --output and a --curves file name can only be "
+                     "used with a single input file")
+
+    _check_modes(parser, args, single)
+    return input_files, single
+
+
+def _check_modes(parser, args, single):
+    '''Checks the options of the modes which only take one table'''
+    single_file_modes = [('--rarefy', args.rarefy is not None),
+                         ('--distances', args.distances is not None),
+                         ('--groups and --group-pattern', _grouped(args))]
+    for option, used in single_file_modes:
+        if used and not single:
+            parser.error(option + " can only be used with a single input "
+                         "file")
+    for option, used in single_file_modes[1:]:
+        if used and (args.sparse or args.long):
+            parser.error(option + " can't be used with --sparse or --long")
+
+    if args.groups is not None and args.group_pattern is not None:
+        parser.error("--groups and --group-pattern can't both be used")
+    if args.group_pattern is not None:
+        try:
+            re.compile(args.group_pattern)
+        except re.error as error:
+            parser.error("--group-pattern isn't a valid regular expression: " +
+                         str(error))
+    if args.grid < 2:
+        parser.error("--grid should be at least 2")
+
+
+def _grouped(args):
+    '''Whether the samples are to be grouped'''
+    return args.groups is not None or args.group_pattern is not None
+
+
+def _cache_dir(args):
+    '''The directory to cache parsed input files in, None for --no-cache'''
+    return None if args.no_cache else args.cache_dir
+
+
+def run_options(parser, args):
+    '''
+    Turns the command line options into the keyword arguments of run
+
+    Parameters
+    ----------
+    parser
+        The parser from make_parser, for reporting bad options
+    args
+        The parsed arguments
+
+    Returns
+    -------
+    dict
+        The keyword arguments for run, run_batch and watch
+    '''
+    indices = ()
+    if args.evenness is not None:
+        try:
+            indices = parse_evenness_indices(args.evenness)
+        except ValueError as error:
+            parser.error(str(error))
+
+    memory_budget = None
+    if args.memory_budget is not None:
+        memory_budget = args.memory_budget * 1024 * 1024
+
+    tolerance = args.tolerance
+    if tolerance == 0:
+        tolerance = None
+
+    profiler = None
+    if args.profile is not None:
+        profiler = StageProfiler(
+            None if args.profile == '-' else args.profile,
+            trace_allocations=args.profile_allocations)
+
+    return dict(jobs=args.jobs, memory_budget=memory_budget,
+                tolerance=tolerance, cache_dir=_cache_dir(args),
+                cache_size=args.cache_size * 1024 * 1024,
+                result_cache=args.result_cache, sparse=args.sparse,
+                long_format=args.long, profiler=profiler,
+                bootstrap=args.bootstrap, confidence=args.confidence,
+                seed=args.seed, normalise=args.normalise,
+                output_format=args.format, indices=indices)
+
+
+def _report_error(error):
+    '''Writes an error message for the user, giving the exit status'''
+    sys.stderr.write("Error: " + str(error) + "\n")
+    return 1
+
+
+def _main_serve(parser, args):
+    '''Runs --serve until interrupted'''
+    host, _, port = args.serve.rpartition(':')
+    try:
+        server = GiniServer(host or '127.0.0.1', int(port),
+                            workers=args.workers, queue=args.serve_queue,
+                            timeout=args.serve_timeout)
+    except ValueError:
+        parser.error("--serve should be [HOST:]PORT")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _main_watch(args, options):
+    '''Runs --watch until interrupted'''
+    try:
+        watch(args.watch, args.watch_state, workers=args.workers,
+              interval=args.watch_interval, settle=args.settle,
+              graph=not args.no_graph, curves=args.curves is not None,
+              **options)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _main_check(args, input_files):
+    '''Prints the --check report of each file, 1 if any are invalid'''
+    cache_dir = _cache_dir(args)
+    invalid = False
+    for input_file in input_files:
+        print("Input file:", input_file)
+        try:
+            samples, values = read_numeric_table(input_file, cache_dir)
+        except ValueError:
+            dataframe = read_table(input_file, cache_dir)
+            samples = list(dataframe.columns)
+            values = dataframe.to_numpy(dtype=np.float64)
+        report = column_report(samples, values)
+        print(*format_column_report(report), sep='\n')
+        invalid = invalid or invalid_columns(report).any()
+    return 1 if invalid else 0
+
+
+def _main_rarefy(parser, args, input_file):
+    '''Runs --rarefy on a single file'''
+    if args.output is None:
+        args.output = input_file + ".rarefaction.tsv"
+    print("Input file:", input_file)
+    print("Output file:", args.output)
+    try:
+        depths = [int(depth) for depth in args.rarefy.split(',')]
+    except ValueError:
+        parser.error("--rarefy should be a comma separated list of "
+                     "whole numbers")
+    try:
+        run_rarefaction(input_file, args.output, depths,
+                        replicates=args.replicates, total=args.total,
+                        seed=args.seed, jobs=args.jobs,
+                        cache_dir=_cache_dir(args))
+    except ValueError as error:
+        return _report_error(error)
+    return 0
+
+
+def _main_distances(args, input_file):
+    '''Runs --distances on a single file'''
+    print("Input file:", input_file)
+    print("Distance files:", args.distances + ".*")
+    try:
+        run_distances(input_file, args.distances, args.grid,
+                      jobs=args.jobs, matrix_format=args.distance_format,
+                      normalise=args.normalise, cache_dir=_cache_dir(args))
+    except ValueError as error:
+        return _report_error(error)
+    return 0
+
+
+def _main_groups(args, input_file):
+    '''Runs --groups or --group-pattern on a single file'''
+    extension = OUTPUT_FORMATS[args.format or 'tsv']
+    if args.graph is None and not args.no_graph:
+        args.graph = 'graph.png'
+    if args.output is None:
+        args.output = input_file + ".groups" + extension
+    if args.curves == '':
+        args.curves = input_file + ".group_curves" + extension
+    print("Input file:", input_file)
+    print("Output file:", args.output)
+    print("Graph file", args.graph)
+    try:
+        mapping = None
+        if args.groups is not None:
+            mapping = read_group_file(args.groups)
+        run_groups(input_file, args.graph, args.output, mapping,
+                   args.group_pattern, curve_file=args.curves,
+                   envelope=args.envelope, grid_size=args.grid,
+                   jobs=args.jobs, normalise=args.normalise,
+                   cache_dir=_cache_dir(args), output_format=args.format)
+    except (OSError, ValueError) as error:
+        return _report_error(error)
+    return 0
+
+
+def _main_single(args, input_file, options):
+    '''Runs a single file, without pandas if nothing needs it'''
+    extension = OUTPUT_FORMATS[args.format or 'tsv']
+    if args.graph is None and not args.no_graph:
+        args.graph = 'graph.png'
+    if args.output is None:
+        args.output = input_file + ".output" + extension
+    if args.curves == '':
+        args.curves = input_file + ".curves" + extension
+
+    print("Input file:", input_file)
     print("Output file:", args.output)
     print("Graph file", args.graph)
-    sample_data = run(args.inputfile, args.graph, args.output)
+    # options the numpy only reader can't handle
+    needs_pandas = (args.sparse or args.long
+                    or options['memory_budget'] is not None
+                    or args.result_cache is not None
+                    or options['profiler'] is not None or args.bootstrap > 0
+                    or args.curves is not None
+                    or (args.format or guess_output_format(args.output))
+                    != 'tsv')
+    try:
+        if args.no_graph and not needs_pandas:
+            run_gini_only(input_file, args.output, jobs=args.jobs,
+                          cache_dir=options['cache_dir'],
+                          normalise=args.normalise,
+                          indices=options['indices'])
+        else:
+            run(input_file, args.graph, args.output, curve_file=args.curves,
+                **options)
+    except ValueError as error:
+        return _report_error(error)
+    return 0
+
+
+def _main_batch(args, input_files, options):
+    '''Runs several files, 1 if any of them failed'''
+    results = run_batch(input_files, workers=args.workers,
+                        graph=not args.no_graph,
+                        curves=args.curves is not None, **options)
+    print_batch_summary(results)
+    return 1 if any(error is not None for _, _, error in results) else 0
+
+
+def main(argv=None):
+    '''
+    Runs the command line program
+
+    Parameters
+    ----------
+    argv
+        The command line arguments, sys.argv[1:] if None
+
+    Returns
+    -------
+    int
+        The exit status
+    '''
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.serve is not None:
+        return _main_serve(parser, args)
+
+    input_files, single = check_args(parser, args)
+    options = run_options(parser, args)
+
+    if args.watch is not None:
+        return _main_watch(args, options)
+    if args.check:
+        return _main_check(args, input_files)
+    if args.rarefy is not None:
+        return _main_rarefy(parser, args, input_files[0])
+    if args.distances is not None:
+        return _main_distances(args, input_files[0])
+    if _grouped(args):
+        return _main_groups(args, input_files[0])
+    if single:
+        return _main_single(args, input_files[0], options)
+    return _main_batch(args, input_files, options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+'''
+unit tests for bootstrap confidence intervals of the gini coefficient
+'''
+from pl_curve import bootstrap_gini, calculate_gini, run
+import numpy as np
+import pandas
+
+
+def test_bootstrap_gini_matches_resampling():
+    '''each resample's gini matches sorting the resampled values'''
+    data = np.array([5.0, 1.0, 1.0, 0.2, 3.0, 0.5])
+    ginis = bootstrap_gini(data, 50, np.random.default_rng(1),
+                           memory_budget=1000)
+
+    # draw the same resamples again and calculate them the slow way
+    rng = np.random.default_rng(1)
+    values = np.sort(data)
+    chunk = max(1, 1000 // (8 * 4 * len(data)))
+    expected = []
+    for start in range(0, 50, chunk):
+        counts = rng.multinomial(len(data), [1 / len(data)] * len(data),
+                                 size=min(chunk, 50 - start))
+        for row in counts:
+            resample = np.repeat(values, row)[::-1]
+            expected.append(calculate_gini(resample))
+    np.testing.assert_allclose(ginis, expected)
+
+
+def test_bootstrap_gini_equal_values():
+    '''resamples of identical values always have a gini of 0'''
+    ginis = bootstrap_gini([0.25] * 4, 100, np.random.default_rng(0))
+    np.testing.assert_allclose(ginis, 0, atol=1e-12)
+
+
+def test_run_bootstrap(tmp_path):
+    '''intervals are added to the output and are repeatable with a seed'''
+    filename = str(tmp_path / "input.tsv")
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\n")
+    f.write("219\t0.1\t0.3\n")
+    f.write("220\t0.2\t0.1\n")
+    f.write("221\t0.3\t0.2\n")
+    f.write("218\t0.4\t0.4\n")
+    f.close()
+
+    run(filename, None, str(tmp_path / "a.tsv"), bootstrap=500, seed=3)
+    run(filename, None, str(tmp_path / "b.tsv"), bootstrap=500, seed=3,
+        jobs=2)
+    assert open(str(tmp_path / "a.tsv")).read() == \
+        open(str(tmp_path / "b.tsv")).read()
+
+    output = pandas.read_csv(str(tmp_path / "a.tsv"), sep='\t', index_col=0)
+    assert list(output.columns) == ['Gini', 'Corrected Gini', 'n',
+                                    'Gini CI Lower', 'Gini CI Upper',
+                                    'Corrected Gini CI Lower',
+                                    'Corrected Gini CI Upper']
+    assert (output['Gini CI Lower'] <= output['Gini CI Upper']).all()
+    assert (output['Corrected Gini CI Lower'] >=
+            output['Gini CI Lower']).all()
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
-from pl_curve import check_columns
+from pl_curve import (check_columns, column_report, invalid_columns,
+                      check_report, sparse_report, SparseTable, run)
+from pytest import approx, raises
+import numpy as np
 import pandas
 
 
@@ -14,3 +17,60 @@ def test_check_columns_correct():
 def test_check_columns_incorrect():
     df = pandas.DataFrame([0.1, 0.8])
     assert check_columns(df) is False
+
+
+def test_check_columns_missing_and_negative():
+    '''missing and negative values are invalid even if the total is 1'''
+    df = pandas.DataFrame({'A': [0.2, 0.8, float('nan')], 'B': [1.2, -0.2, 0]})
+    assert check_columns(df) is False
+
+
+def test_column_report():
+    '''every column is reported, not just the first bad one'''
+    values = np.array([[0.5, 2.0, np.nan, 0.4],
+                       [0.5, -1.0, 0.2, 0.6]])
+    report = column_report(['A', 'B', 'C', 'D'], values)
+    assert list(report.totals) == approx([1.0, 1.0, 0.2, 1.0])
+    assert list(report.nans) == [0, 0, 1, 0]
+    assert list(report.negatives) == [0, 1, 0, 0]
+    assert list(invalid_columns(report)) == [False, True, True, False]
+
+    with raises(ValueError) as error:
+        check_report(report)
+    assert str(error.value).split('\n') == [
+        "columns don't sum to 1",
+        "B: total 1.000000 (+0.000000), 0 missing, 1 negative, invalid",
+        "C: total 0.200000 (-0.800000), 1 missing, 0 negative, invalid"]
+
+
+def test_sparse_report():
+    '''the same report from the non-zero values of a SparseTable'''
+    values = np.array([[0.5, 2.0, np.nan], [0.0, -1.0, 0.2]])
+    rows, cols = np.nonzero(values.T != 0)
+    table = SparseTable(['219', '218'], ['A', 'B', 'C'],
+                        np.searchsorted(rows, np.arange(4)), cols,
+                        values.T[values.T != 0])
+    report = sparse_report(table)
+    expected = column_report(['A', 'B', 'C'], values)
+    assert list(report.totals) == approx(list(expected.totals))
+    assert list(report.nans) == list(expected.nans)
+    assert list(report.negatives) == list(expected.negatives)
+
+
+def test_run_normalise(tmp_path):
+    '''tables of read counts give the same result once normalised'''
+    filename = str(tmp_path / "counts.tsv")
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\n")
+    f.write("219\t5\t30\n")
+    f.write("220\t0\t0\n")
+    f.write("218\t5\t70\n")
+    f.close()
+
+    with raises(ValueError):
+        run(filename, None, str(tmp_path / "test.tsv"))
+    for options in [{}, {'memory_budget': 100}, {'sparse': True}]:
+        output = str(tmp_path / "test.tsv")
+        run(filename, None, output, normalise=True, **options)
+        gini = pandas.read_csv(output, sep='\t', index_col=0)['Gini']
+        assert list(gini) == approx([0.0, 0.2])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+'''
+unit tests for the distances between the curves of every pair of samples
+'''
+from pl_curve import (LorenzAnalyzer, resample_curves, curve_distances,
+                      write_distance_matrix, run_distances)
+from pytest import approx
+import numpy as np
+import pandas
+import os
+
+
+def make_dataframe():
+    return pandas.DataFrame({'Step I': [0.5, 0.0, 0.5, 0.0],
+                             'Step II': [0.3, 0.0, 0.7, 0.0],
+                             'Step III': [0.1, 0.0, 0.2, 0.7]},
+                            index=pandas.Index(['219', '220', '218', '217'],
+                                               name='Bin'))
+
+
+def test_resample_curves():
+    '''interpolates each curve at the same points'''
+    results = LorenzAnalyzer().analyze_dataframe(make_dataframe())
+    curves = resample_curves(results, 7)
+    grid = np.linspace(0, 1, 7)
+
+    assert curves.shape == (3, 7)
+    assert curves.dtype == np.float32
+    for index, sample in enumerate(results):
+        x = np.concatenate([[0], sample.cum_prop_trfs])
+        y = np.concatenate([[0], sample.cum_rel_abund])
+        assert list(curves[index]) == approx(list(np.interp(grid, x, y)))
+
+
+def test_curve_distances():
+    '''the area between and largest gap between each pair of curves'''
+    results = LorenzAnalyzer().analyze_dataframe(make_dataframe())
+    area, gap = curve_distances(resample_curves(results, 7))
+
+    expected_area = np.array([[0, 0.1, 0.2], [0.1, 0, 0.1], [0.2, 0.1, 0]])
+    expected_gap = np.array([[0, 0.2, 11 / 30],
+                             [0.2, 0, 0.7 / 3],
+                             [11 / 30, 0.7 / 3, 0]])
+    np.testing.assert_allclose(area, expected_area, atol=1e-6)
+    np.testing.assert_allclose(gap, expected_gap, atol=1e-6)
+
+
+def test_curve_distances_jobs(tmp_path):
+    '''gives the same matrices with several processes and in files'''
+    rng = np.random.default_rng(1)
+    curves = np.sort(rng.random((40, 11)), axis=1)
+    area, gap = curve_distances(curves)
+
+    shared_area, shared_gap = curve_distances(curves, jobs=2)
+    file_area, file_gap = curve_distances(
+        curves, jobs=2, area_file=str(tmp_path / 'area.npy'),
+        gap_file=str(tmp_path / 'gap.npy'))
+
+    np.testing.assert_array_equal(area, area.T)
+    np.testing.assert_array_equal(shared_area, area)
+    np.testing.assert_array_equal(shared_gap, gap)
+    np.testing.assert_array_equal(np.load(tmp_path / 'area.npy'), area)
+    np.testing.assert_array_equal(np.load(tmp_path / 'gap.npy'), gap)
+
+
+def test_write_distance_matrix(tmp_path):
+    '''saves a labelled tsv matrix'''
+    filename = str(tmp_path / 'matrix.tsv')
+    write_distance_matrix(np.array([[0, 0.5], [0.5, 0]], dtype=np.float32),
+                          ['a', 'b'], filename)
+    with open(filename) as f:
+        assert f.read() == ('\ta\tb\n'
+                            'a\t0.000000\t0.500000\n'
+                            'b\t0.500000\t0.000000\n')
+
+
+def test_run_distances(tmp_path):
+    '''saves npy matrices with the sample names, or tsv matrices'''
+    input_file = str(tmp_path / 'input.tsv')
+    make_dataframe().to_csv(input_file, sep='\t')
+    prefix = str(tmp_path / 'out')
+
+    samples, area, gap = run_distances(input_file, prefix, 7, cache_dir=None)
+    assert samples == ['Step I', 'Step II', 'Step III']
+    assert float(area[0, 2]) == approx(0.2)
+    with open(prefix + '.samples.txt') as f:
+        assert f.read().split('\n') == samples + ['']
+    np.testing.assert_array_equal(np.load(prefix + '.max_gap.npy'), gap)
+
+    assert run_distances(input_file, prefix, 7, matrix_format='tsv',
+                         cache_dir=None) == (samples, None, None)
+    matrix = pandas.read_csv(prefix + '.area.tsv', sep='\t', index_col=0)
+    assert list(matrix.columns) == samples
+    np.testing.assert_allclose(matrix.to_numpy(), area, atol=1e-6)
+    assert os.path.exists(prefix + '.max_gap.tsv')
+
+    # the working matrices can be kept and are returned memory mapped
+    matrix_dir = str(tmp_path / 'matrices')
+    _, kept_area, kept_gap = run_distances(
+        input_file, prefix, 7, matrix_format='tsv', cache_dir=None,
+        matrix_dir=matrix_dir)
+    assert isinstance(kept_area, np.memmap)
+    np.testing.assert_array_equal(kept_gap, gap)
+    assert os.path.exists(os.path.join(matrix_dir, 'area.npy'))
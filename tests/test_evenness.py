@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+'''
+unit tests for the evenness indices added to the output
+'''
+from pl_curve import (matrix_evenness, process_matrix, parse_evenness_indices,
+                      make_gini_dataframe, process_samples, remove_zeros,
+                      run, run_gini_only, EVENNESS_INDICES)
+from pytest import approx, raises
+import numpy as np
+import pandas
+import math
+
+
+def test_matrix_evenness():
+    '''calculates each index from the sorted values and cumulative sums'''
+    values = np.array([[0.5, 0.3, 0.0], [0.5, 0.7, 0.0]])
+    sorted_values, order, cumulative, lengths = process_matrix(values)
+    evenness = matrix_evenness(sorted_values, cumulative, lengths)
+
+    shannon = -(0.3 * math.log(0.3) + 0.7 * math.log(0.7))
+    assert list(evenness) == list(EVENNESS_INDICES.values())
+    assert list(evenness['Shannon'][:2]) == approx([math.log(2), shannon])
+    assert list(evenness['Simpson'][:2]) == approx([0.5, 0.42])
+    assert list(evenness['Pielou'][:2]) == approx([1, shannon / math.log(2)])
+    assert list(evenness['Theil'][:2]) == approx([0, math.log(2) - shannon])
+    # 0.7 of the 0.8 is in the first bin, the rest is a third of the second
+    assert list(evenness['Pareto 80%'][:2]) == approx([0.8, 2 / 3])
+    # an empty sample has no indices
+    assert all(np.isnan(values[2]) for values in evenness.values())
+
+
+def test_make_gini_dataframe_indices():
+    '''adds the chosen indices as columns after n'''
+    dataframe = pandas.DataFrame({'Step I': [0.5, 0.0, 0.5],
+                                  'Step II': [0.1, 0.2, 0.7]},
+                                 index=pandas.Index(['219', '220', '218'],
+                                                    name='Bin'))
+    samples, ginis = process_samples(remove_zeros(dataframe))
+    gini_dataframe = make_gini_dataframe(samples, ginis,
+                                         indices=['pareto', 'shannon'])
+
+    assert list(gini_dataframe.columns) == ['Gini', 'Corrected Gini', 'n',
+                                            'Pareto 80%', 'Shannon']
+    # 0.7 and then a half of the 0.2 bin
+    assert gini_dataframe['Pareto 80%'].tolist() == approx([0.8, 0.5])
+    assert gini_dataframe.loc['Step II', 'Shannon'] == approx(
+        -sum(p * math.log(p) for p in [0.1, 0.2, 0.7]))
+
+
+def test_parse_evenness_indices():
+    '''takes a comma separated list or all'''
+    assert parse_evenness_indices('all') == list(EVENNESS_INDICES)
+    assert parse_evenness_indices('Theil, simpson') == ['theil', 'simpson']
+    with raises(ValueError):
+        parse_evenness_indices('shannon,hill')
+
+
+def test_run_gini_only_indices(tmp_path):
+    '''the numpy only path writes the same indices as run'''
+    filename = str(tmp_path / "input.tsv")
+    with open(filename, "w") as f:
+        f.write("Bin\tStep I\tStep II\n219\t0.5\t0.1\n220\t0.0\t0.2\n"
+                "218\t0.5\t0.7\n")
+
+    run_gini_only(filename, str(tmp_path / "fast.tsv"), indices=['simpson'])
+    run(filename, None, str(tmp_path / "full.tsv"), indices=['simpson'])
+
+    assert open(str(tmp_path / "fast.tsv")).read() == \
+        open(str(tmp_path / "full.tsv")).read()
+    assert open(str(tmp_path / "fast.tsv")).readline() == \
+        '\tGini\tCorrected Gini\tn\tSimpson\n'
@@ -2,10 +2,11 @@
 '''
 unit test for the gini coefficient function
 '''
-from pl_curve import calculate_gini
+from pl_curve import calculate_gini, gini_from_sorted
 from pytest import approx
 import pandas as pd
 import math
+import numpy as np
 
 
 def test_gini_empty():
@@ -33,3 +34,21 @@ def test_gini_four_even():
     '''test calculating a gini coefficient with four identical items'''
     gini = calculate_gini(pd.Series([1.0, 1.0, 1.0, 1.0]))
     assert gini == approx(0.0)
+
+
+def test_gini_outer_matches_sort():
+    '''the sort based gini should match the O(n**2) reference version'''
+    data = pd.Series(np.random.default_rng(42).lognormal(size=500))
+    assert calculate_gini(data) == approx(calculate_gini(data, method='outer'))
+
+
+def test_gini_outer_four():
+    '''test the reference gini method with four different items'''
+    gini = calculate_gini(pd.Series([1.0, 2.0, 3.0, 4.0]), method='outer')
+    assert gini == approx(0.25)
+
+
+def test_gini_from_sorted():
+    '''test calculating a gini coefficient on data sorted largest first'''
+    assert gini_from_sorted(np.array([4.0, 3.0, 2.0, 1.0])) == approx(0.25)
+    assert math.isnan(gini_from_sorted(np.array([0.0, 0.0])))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+'''
+unit tests for the mean curves and gini statistics of groups of replicates
+'''
+from pl_curve import (LorenzAnalyzer, read_group_file, group_samples,
+                      group_statistics, make_group_dataframes, run_groups)
+from pytest import approx, raises
+import numpy as np
+import pandas
+import math
+import os
+
+
+def make_dataframe():
+    return pandas.DataFrame({'Step I a': [0.5, 0.0, 0.5],
+                             'Step I b': [0.3, 0.0, 0.7],
+                             'Step II a': [0.1, 0.2, 0.7]},
+                            index=pandas.Index(['219', '220', '218'],
+                                               name='Bin'))
+
+
+def test_read_group_file(tmp_path):
+    '''skips the heading, comments and blank lines'''
+    filename = str(tmp_path / 'groups.tsv')
+    with open(filename, 'w') as f:
+        f.write('Sample\tGroup\nStep I a\tI\n\n# replicate b\nStep I b\tI\n')
+    assert read_group_file(filename) == {'Step I a': 'I', 'Step I b': 'I'}
+
+    with open(filename, 'w') as f:
+        f.write('Step I a\tI\textra\n')
+    with raises(ValueError):
+        read_group_file(filename)
+
+
+def test_group_samples():
+    '''groups by mapping or pattern, anything left over is on its own'''
+    samples = ['Step I a', 'Step I b', 'Step II a', 'Cryo']
+    groups, codes = group_samples(samples, pattern=r'Step \w+')
+    assert groups == ['Step I', 'Step II', 'Cryo']
+    assert list(codes) == [0, 0, 1, 2]
+    groups, codes = group_samples(samples, pattern=r'(\w+) [ab]$')
+    assert groups == ['I', 'II', 'Cryo']
+    groups, codes = group_samples(samples, {'Cryo': 'x', 'Step I b': 'x'})
+    assert groups == ['Step I a', 'x', 'Step II a']
+    assert list(codes) == [0, 1, 2, 1]
+
+
+def test_group_statistics():
+    '''matches the statistics of each group worked out separately'''
+    rng = np.random.default_rng(0)
+    values = rng.random((10, 4))
+    codes = np.array([2, 0, 1, 0, 2, 2, 0, 1, 0, 3])
+    mean, sd, low, high = group_statistics(values, codes, 4)
+
+    for group in range(3):
+        rows = values[codes == group]
+        assert list(mean[group]) == approx(list(rows.mean(axis=0)))
+        assert list(sd[group]) == approx(list(rows.std(axis=0, ddof=1)))
+        assert list(low[group]) == approx(list(rows.min(axis=0)))
+        assert list(high[group]) == approx(list(rows.max(axis=0)))
+    # one sample has no standard deviation
+    assert np.isnan(sd[3]).all()
+    assert list(mean[3]) == approx(list(values[9]))
+
+
+def test_make_group_dataframes():
+    '''averages the curves and ginis of each group'''
+    results = LorenzAnalyzer().analyze_dataframe(make_dataframe())
+    groups, codes = group_samples(results.samples, pattern=r'Step \w+')
+    ginis, curves = make_group_dataframes(results, groups, codes, 3)
+
+    assert list(ginis.index) == ['Step I', 'Step II']
+    assert list(ginis['Samples']) == [2, 1]
+    assert ginis.loc['Step I', 'Mean Gini'] == approx(0.1)
+    assert ginis.loc['Step I', 'SD Gini'] == approx(math.sqrt(0.02))
+    assert ginis.loc['Step I', 'Mean Corrected Gini'] == approx(0.2)
+    # the curves only bend at the grid points so the gini is exact
+    assert ginis.loc['Step I', 'Mean Curve Gini'] == approx(0.1)
+
+    step_i = curves[curves['Group'] == 'Step I']
+    assert list(step_i['Cum Prop TRFs']) == [0, 0.5, 1]
+    assert list(step_i['Mean Cum Rel Abund']) == approx([0, 0.6, 1])
+    assert list(step_i['Min Cum Rel Abund']) == approx([0, 0.5, 1])
+    assert list(step_i['Max Cum Rel Abund']) == approx([0, 0.7, 1])
+
+
+def test_run_groups(tmp_path):
+    '''saves the group statistics, curves and graph'''
+    input_file = str(tmp_path / 'input.tsv')
+    make_dataframe().to_csv(input_file, sep='\t')
+
+    run_groups(input_file, str(tmp_path / 'graph.png'),
+               str(tmp_path / 'groups.tsv'), pattern=r'Step \w+',
+               curve_file=str(tmp_path / 'curves.tsv'), envelope='range',
+               grid_size=11, cache_dir=None)
+
+    ginis = pandas.read_csv(str(tmp_path / 'groups.tsv'), sep='\t',
+                            index_col=0)
+    assert list(ginis.index) == ['Step I', 'Step II']
+    curves = pandas.read_csv(str(tmp_path / 'curves.tsv'), sep='\t')
+    assert len(curves) == 22
+    assert os.path.exists(str(tmp_path / 'graph.png'))
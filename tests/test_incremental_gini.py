@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+'''
+unit tests for keeping a gini coefficient up to date as bins change
+'''
+from pl_curve import IncrementalGini, calculate_gini
+from pytest import approx, raises
+import numpy as np
+import math
+
+
+def test_incremental_gini_insert():
+    '''matches calculate_gini as bins are added'''
+    gini = IncrementalGini()
+    assert math.isnan(gini.gini)
+
+    gini.insert('219', 0.3)
+    gini.insert('218', 0.7)
+    assert gini.n == 2
+    assert gini.gini == approx(0.2)
+    assert gini.corrected_gini == approx(0.4)
+
+
+def test_incremental_gini_random_updates():
+    '''a random mix of inserts, updates and removes, with repeated values'''
+    rng = np.random.default_rng(0)
+    gini = IncrementalGini()
+    bins = {}
+    for i in range(1000):
+        bins[i] = float(rng.integers(0, 20))
+        gini.insert(i, bins[i])
+
+    for step in range(2000):
+        i = int(rng.integers(0, 1200))
+        if i not in bins:
+            bins[i] = float(rng.integers(0, 20))
+            gini.insert(i, bins[i])
+        elif rng.random() < 0.3:
+            del bins[i]
+            gini.remove(i)
+        else:
+            bins[i] = float(rng.integers(0, 20))
+            gini.update(i, bins[i])
+
+    values = np.array(list(bins.values()))
+    assert gini.n == len(bins)
+    assert gini.gini == approx(calculate_gini(values))
+
+
+def test_incremental_gini_lorenz():
+    '''the curve is sorted largest first and ends at 1'''
+    gini = IncrementalGini({'a': 0.1, 'b': 0.6, 'c': 0.1, 'd': 0.2})
+
+    prop, abund = gini.lorenz()
+    assert prop == approx([0.25, 0.5, 0.75, 1.0])
+    assert abund == approx([0.6, 0.8, 0.9, 1.0])
+
+
+def test_incremental_gini_errors():
+    gini = IncrementalGini({'a': 0.5})
+    with raises(ValueError):
+        gini.insert('a', 0.1)
+    with raises(KeyError):
+        gini.update('b', 0.1)
+    with raises(KeyError):
+        gini.remove('b')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+'''
+unit tests for the array backed results of LorenzAnalyzer
+'''
+from pl_curve import (LorenzAnalyzer, LorenzResults, process_samples,
+                      remove_zeros, make_gini_dataframe)
+from pytest import approx, raises
+import numpy as np
+import pandas
+import pickle
+import math
+
+
+def make_dataframe():
+    return pandas.DataFrame({'Step I': [0.5, 0.0, 0.5, 0.0],
+                             'Step II': [0.3, 0.0, 0.7, 0.0],
+                             'Step III': [0.1, 0.0, 0.2, 0.7]},
+                            index=pandas.Index(['219', '220', '218', '217'],
+                                               name='Bin'))
+
+
+def test_analyze_dataframe():
+    '''gives the same curves and ginis as process_samples'''
+    dataframe = make_dataframe()
+    results = LorenzAnalyzer().analyze_dataframe(dataframe)
+    samples, ginis = process_samples(remove_zeros(dataframe))
+
+    assert len(results) == 3
+    assert list(results.ginis) == approx(list(ginis))
+    assert list(results.n) == [2, 2, 3]
+    for sample, expected in zip(results.to_dataframes(), samples):
+        pandas.testing.assert_frame_equal(sample, expected)
+    pandas.testing.assert_frame_equal(results.gini_dataframe(),
+                                      make_gini_dataframe(samples))
+
+
+def test_sample_curve():
+    '''a sample's arrays are views into the flat arrays'''
+    results = LorenzAnalyzer().analyze_dataframe(make_dataframe())
+    sample = results['Step II']
+    assert sample.name == 'Step II'
+    assert sample.gini == approx(0.2)
+    assert sample.corrected_gini == approx(0.4)
+    assert list(sample.bins) == ['218', '219']
+    assert list(sample.cum_rel_abund) == approx([0.7, 1.0])
+    assert list(sample.cum_prop_trfs) == approx([0.5, 1.0])
+    assert sample.abundances.base is not None
+    assert not hasattr(sample, '__dict__')
+
+    assert [s.name for s in results] == ['Step I', 'Step II', 'Step III']
+    assert results[-1].name == 'Step III'
+    with raises(IndexError):
+        results[3]
+
+
+def test_single_bin():
+    '''one bin can't be corrected'''
+    results = LorenzAnalyzer().analyze(np.array([[1.0]]), ['A'], ['219'])
+    assert results[0].n == 1
+    assert math.isnan(results[0].corrected_gini)
+    assert math.isnan(results.corrected_ginis[0])
+
+
+def test_pickle():
+    '''results survive being passed to another process'''
+    results = LorenzAnalyzer().analyze_dataframe(make_dataframe())
+    copy = pickle.loads(pickle.dumps(results))
+    assert isinstance(copy, LorenzResults)
+    assert copy.samples == results.samples
+    np.testing.assert_array_equal(copy.cumulative, results.cumulative)
+
+
+def test_analyze_checks_columns():
+    '''bad columns are reported, read counts can be normalised'''
+    counts = np.array([[5.0, 30.0], [5.0, 70.0]])
+    with raises(ValueError):
+        LorenzAnalyzer().analyze(counts, ['A', 'B'], ['1', '2'])
+    results = LorenzAnalyzer(normalise=True).analyze(counts, ['A', 'B'],
+                                                     ['1', '2'])
+    assert list(results.ginis) == approx([0.0, 0.2])
+
+
+def test_analyze_file(tmp_path):
+    filename = str(tmp_path / "input.tsv")
+    make_dataframe().to_csv(filename, sep='\t')
+    results = LorenzAnalyzer(jobs=2).analyze_file(filename)
+    assert list(results.ginis) == approx([0.0, 0.2, 0.4])
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+'''
+tests for the command line entry point
+'''
+from pl_curve import main
+from pytest import raises
+import os
+
+
+def write_input(filename):
+    with open(filename, "w") as f:
+        f.write("Bin\tStep I\tStep II\n219\t0.5\t0.3\n220\t0.0\t0.0\n"
+                "218\t0.5\t0.7\n")
+
+
+def test_main_single(tmp_path):
+    '''runs a single file and gives the exit status'''
+    filename = str(tmp_path / "input.tsv")
+    write_input(filename)
+    output = str(tmp_path / "output.tsv")
+
+    assert main([filename, '-n', '-o', output, '--no-cache']) == 0
+    assert os.path.exists(output)
+
+
+def test_main_errors(tmp_path, capsys):
+    '''bad tables give 1 and bad options a usage error'''
+    filename = str(tmp_path / "input.tsv")
+    with open(filename, "w") as f:
+        f.write("Bin\tStep I\n219\t0.5\n")
+    assert main([filename, '-n', '-o', str(tmp_path / "output.tsv"),
+                 '--no-cache']) == 1
+    assert "columns don't sum to 1" in capsys.readouterr().err
+
+    assert main([filename, '--check', '--no-cache']) == 1
+    with raises(SystemExit):
+        main([filename, filename, '--rarefy', '10'])
+    with raises(SystemExit):
+        main([filename, '--group-pattern', '('])
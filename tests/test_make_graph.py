@@ -3,6 +3,7 @@ from pl_curve import make_graph
 import pandas
 import numpy as np
 import os
+import matplotlib.pyplot as plt
 
 
 def test_make_graph():
@@ -32,3 +33,13 @@ def test_make_graph():
 
     make_graph(samples, "test.png")
     assert os.path.isfile("test.png") is True
+
+
+def test_make_graph_no_pyplot_state():
+    '''make_graph shouldn't leave any figures open in pyplot'''
+    df = pandas.DataFrame({'Step I': [0.6, 0.4], 'Cum Rel Abund': [0.6, 1.0],
+                           'Cum Prop TRFs': [0.5, 1.0]})
+
+    make_graph([df], "test.png")
+    make_graph([df], "test.png")
+    assert plt.get_fignums() == []
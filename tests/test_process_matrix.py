@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+'''
+unit tests for the columnar sort, cumulative sum and cut off engine
+'''
+from pl_curve import process_matrix, build_samples, matrix_gini
+from pl_curve import calculate_gini
+from pytest import approx
+import pandas
+import numpy as np
+
+
+def test_process_matrix():
+    '''each column is sorted, summed and cut off independently'''
+    values = np.array([[0.1, 0.4, 0.1],
+                       [0.7, 0.2, 0.2],
+                       [0.3, 0.2, 0.2]])
+
+    sorted_values, order, cumulative, lengths = process_matrix(values)
+
+    assert sorted_values[:, 0] == approx([0.7, 0.3, 0.1])
+    assert list(order[:, 0]) == [1, 2, 0]
+    assert cumulative[:, 1] == approx([0.4, 0.6, 0.8])
+    # first column goes over 1 on its second row, the others never do
+    assert list(lengths) == [2, 3, 3]
+
+
+def test_build_samples():
+    '''check the per sample dataframes match the old pipeline layout'''
+    df = pandas.DataFrame({'Step I': [0.3, 0.7], 'Step II': [0.5, 0.5]},
+                          index=['219', '218'])
+
+    samples = build_samples(df, *process_matrix(df))
+
+    assert len(samples) == 2
+    assert list(samples[0].columns) == ['Step I', 'Cum Rel Abund',
+                                        'Cum Prop TRFs']
+    assert list(samples[0].index) == ['218', '219']
+    assert samples[0].loc['219', 'Cum Rel Abund'] == approx(1.0)
+    assert samples[1].loc[:, 'Cum Prop TRFs'].tolist() == approx([0.5, 1.0])
+
+
+def test_process_matrix_jobs():
+    '''spreading the samples over several processes gives the same result'''
+    values = np.random.default_rng(1).random((50, 9))
+    values /= values.sum(axis=0)
+
+    serial = process_matrix(values)
+    parallel = process_matrix(values, jobs=3)
+
+    for a, b in zip(serial, parallel):
+        assert np.array_equal(a, b)
+
+
+def test_matrix_gini():
+    '''gini of the kept rows matches calculate_gini on each sample'''
+    values = np.array([[0.1, 0.25, 0.0],
+                       [0.2, 0.25, 0.0],
+                       [0.3, 0.25, 0.0],
+                       [0.4, 0.25, 0.0]])
+    sorted_values, order, cumulative, lengths = process_matrix(values)
+
+    ginis = matrix_gini(sorted_values, lengths)
+
+    assert ginis[0] == approx(calculate_gini(values[:, 0]))
+    assert ginis[0] == approx(0.25)
+    assert ginis[1] == approx(0.0)
+    assert np.isnan(ginis[2])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+'''
+unit tests for processing samples with the per sample result cache
+'''
+from pl_curve import process_samples
+from pytest import approx
+import pandas
+import numpy as np
+
+
+def make_table(columns):
+    rng = np.random.default_rng(7)
+    values = rng.random((20, columns))
+    values /= values.sum(axis=0)
+    return pandas.DataFrame(values, index=['bin' + str(i) for i in range(20)],
+                            columns=['Step ' + str(i) for i in range(columns)])
+
+
+def test_process_samples_no_cache():
+    '''without a cache every sample is calculated'''
+    samples, ginis = process_samples(make_table(2))
+    assert len(samples) == 2
+    assert len(ginis) == 2
+
+
+def test_process_samples_result_cache(tmp_path):
+    '''only the appended sample should be calculated on the second run'''
+    result_cache = str(tmp_path / "results")
+    counts = {}
+    samples, ginis = process_samples(make_table(2), result_cache=result_cache,
+                                     counts=counts)
+    assert counts == {'hits': 0, 'misses': 2}
+
+    dataframe = make_table(2)
+    dataframe['Step 2'] = dataframe['Step 0'].to_numpy()[::-1]
+    counts = {}
+    cached_samples, cached_ginis = process_samples(
+        dataframe, result_cache=result_cache, counts=counts)
+    assert counts == {'hits': 2, 'misses': 1}
+
+    fresh_samples, fresh_ginis = process_samples(dataframe)
+    assert cached_ginis == approx(fresh_ginis)
+    for cached, fresh in zip(cached_samples, fresh_samples):
+        pandas.testing.assert_frame_equal(cached, fresh)
+
+
+def test_process_samples_result_cache_new_bin(tmp_path):
+    '''a column adding a new bin doesn't change the other columns' keys'''
+    result_cache = str(tmp_path / "results")
+    process_samples(make_table(2), result_cache=result_cache)
+
+    dataframe = make_table(2)
+    dataframe.loc['bin20'] = 0.0
+    dataframe['Step 2'] = 0.0
+    dataframe.loc[['bin0', 'bin20'], 'Step 2'] = [0.4, 0.6]
+    # the new bin goes at the start so every row position changes
+    dataframe = dataframe.loc[['bin20'] + list(dataframe.index[:-1])]
+    counts = {}
+    cached_samples, cached_ginis = process_samples(
+        dataframe, result_cache=result_cache, counts=counts)
+    assert counts == {'hits': 2, 'misses': 1}
+
+    fresh_samples, fresh_ginis = process_samples(dataframe)
+    assert cached_ginis == approx(fresh_ginis)
+    for cached, fresh in zip(cached_samples, fresh_samples):
+        pandas.testing.assert_frame_equal(cached, fresh)
+
+
+def test_process_samples_result_cache_short_total(tmp_path):
+    '''a curve that keeps its zero bins is calculated again for new bins'''
+    result_cache = str(tmp_path / "results")
+    dataframe = pandas.DataFrame({'Step I': [0.6, 0.39995, 0.0],
+                                  'Step II': [0.5, 0.0, 0.5]},
+                                 index=['a', 'b', 'c'])
+    samples, ginis = process_samples(dataframe, result_cache=result_cache)
+    assert len(samples[0]) == 3
+
+    counts = {}
+    process_samples(dataframe, result_cache=result_cache, counts=counts)
+    assert counts == {'hits': 2, 'misses': 0}
+
+    dataframe.loc['d'] = [0.0, 0.0]
+    dataframe['Step III'] = [0.0, 0.0, 0.0, 1.0]
+    counts = {}
+    cached_samples, cached_ginis = process_samples(
+        dataframe, result_cache=result_cache, counts=counts)
+    assert counts == {'hits': 1, 'misses': 2}
+    assert len(cached_samples[0]) == 4
+    fresh_samples, fresh_ginis = process_samples(dataframe)
+    assert cached_ginis == approx(fresh_ginis)
+    for cached, fresh in zip(cached_samples, fresh_samples):
+        pandas.testing.assert_frame_equal(cached, fresh)
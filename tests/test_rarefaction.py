@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+'''
+unit tests for rarefying samples to different sequencing depths
+'''
+from pl_curve import rarefy_counts, rarefaction_gini, run_rarefaction
+from pytest import approx, raises
+import numpy as np
+import pandas
+
+
+def test_rarefy_counts():
+    '''subsamples have depth reads, smaller samples are kept whole'''
+    counts = np.array([[10, 0], [5, 3], [0, 1], [1, 1]])
+    drawn = rarefy_counts(counts, 6, 50, np.random.default_rng(0))
+    assert drawn.shape == (4, 2, 50)
+    assert (drawn.sum(axis=0) == [[6], [5]]).all()
+    assert (drawn <= counts[:, :, np.newaxis]).all()
+    assert (drawn[:, 1] == counts[:, 1, np.newaxis]).all()
+
+
+def test_rarefy_counts_distribution():
+    '''matches the mean of a hypergeometric distribution'''
+    counts = np.array([[30], [60], [10]])
+    drawn = rarefy_counts(counts, 20, 20000, np.random.default_rng(1))
+    assert drawn[:, 0].mean(axis=1) == approx([6, 12, 2], rel=0.02)
+
+
+def test_rarefaction_gini():
+    '''full depth gives the sample's own gini with no spread'''
+    counts = np.array([[4, 3], [3, 3], [2, 2], [1, 2]])
+    means, sds = rarefaction_gini(counts, [2, 10, 11], replicates=5, seed=0,
+                                  memory_budget=1)
+    assert means[1] == approx([0.25, 0.1])
+    assert sds[1] == approx([0.0, 0.0])
+    assert np.isnan(means[2]).all()
+    # one group per sample as the memory budget is tiny, same with jobs
+    again = rarefaction_gini(counts, [2, 10, 11], replicates=5, seed=0,
+                             jobs=2, memory_budget=1)
+    np.testing.assert_array_equal(means, again[0])
+
+
+def test_run_rarefaction(tmp_path):
+    '''relative abundances need a total'''
+    filename = str(tmp_path / "input.tsv")
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\n")
+    f.write("219\t0.5\t0.3\n")
+    f.write("220\t0.0\t0.0\n")
+    f.write("218\t0.5\t0.7\n")
+    f.close()
+    output = str(tmp_path / "output.tsv")
+
+    with raises(ValueError):
+        run_rarefaction(filename, output, [5])
+
+    run_rarefaction(filename, output, [10, 5, 10], total=10, seed=0)
+    table = pandas.read_csv(output, sep='\t', index_col=0)
+    assert list(table.index) == [5, 10]
+    assert list(table.columns) == ['Step I Mean', 'Step I SD',
+                                   'Step II Mean', 'Step II SD']
+    assert table.loc[10, 'Step II Mean'] == approx(0.2)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+'''
+unit tests for reading and caching input tables
+'''
+from pl_curve import read_table, evict_cache, hash_file, CACHE_VERSION
+import os
+import pl_curve
+import numpy as np
+
+
+def write_table(filename, bins):
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\n")
+    for i, name in enumerate(bins):
+        f.write(str(name) + "\t" + str(i) + "\t0.5\n")
+    f.close()
+
+
+def test_read_table_cache(tmp_path):
+    '''the second read should come from the cache and match the first'''
+    filename = str(tmp_path / "input.tsv")
+    cache_dir = str(tmp_path / "cache")
+    write_table(filename, ['219', 'abc'])
+
+    first = read_table(filename, cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    second = read_table(filename, cache_dir)
+    assert list(second.columns) == ['Step I', 'Step II']
+    assert list(second.index) == ['219', 'abc']
+    assert second.index.name == 'Bin'
+    assert np.array_equal(first.to_numpy(), second.to_numpy())
+    # the cached values are memory mapped rather than parsed
+    assert second.to_numpy().flags.writeable is False
+
+
+def test_read_table_no_cache(tmp_path):
+    '''without a cache directory nothing is written'''
+    filename = str(tmp_path / "input.tsv")
+    write_table(filename, [219, 218])
+
+    dataframe = read_table(filename)
+    assert list(dataframe.index) == [219, 218]
+    assert os.listdir(str(tmp_path)) == ["input.tsv"]
+
+
+def test_evict_cache(tmp_path):
+    '''the least recently used tables are removed first'''
+    cache_dir = str(tmp_path / "cache")
+    for i in range(3):
+        filename = str(tmp_path / ("input" + str(i) + ".tsv"))
+        write_table(filename, range(i + 1))
+        read_table(filename, cache_dir)
+
+    entries = sorted(os.listdir(cache_dir),
+                     key=lambda e: os.path.getmtime(os.path.join(cache_dir, e)))
+    evict_cache(cache_dir, 1)
+    assert os.listdir(cache_dir) == []
+
+    # a big enough cache keeps everything
+    for i in range(3):
+        read_table(str(tmp_path / ("input" + str(i) + ".tsv")), cache_dir)
+    evict_cache(cache_dir, 10 ** 9)
+    assert sorted(os.listdir(cache_dir)) == sorted(entries)
+
+
+def test_evict_cache_least_recently_used(tmp_path):
+    '''reading a table again keeps it, the next oldest is removed'''
+    cache_dir = str(tmp_path / "cache")
+    filenames = []
+    for i in range(3):
+        filename = str(tmp_path / ("input" + str(i) + ".tsv"))
+        write_table(filename, range(i + 1))
+        read_table(filename, cache_dir)
+        entry = os.path.join(cache_dir,
+                             CACHE_VERSION + '-' + hash_file(filename))
+        os.utime(entry, (1000 * (i + 1), 1000 * (i + 1)))
+        filenames.append(filename)
+    entries = [CACHE_VERSION + '-' + hash_file(f) for f in filenames]
+
+    # the oldest is used again so the middle one is now the oldest
+    read_table(filenames[0], cache_dir)
+    total = sum(os.path.getsize(os.path.join(cache_dir, e, f))
+                for e in entries for f in os.listdir(os.path.join(cache_dir,
+                                                                  e)))
+    evict_cache(cache_dir, total - 1)
+    assert sorted(os.listdir(cache_dir)) == sorted([entries[0], entries[2]])
+
+
+def test_read_table_too_big_to_cache(tmp_path, monkeypatch):
+    '''a table bigger than the cache isn't written out'''
+    def no_save(*args):
+        raise AssertionError("the table was saved")
+    monkeypatch.setattr(pl_curve, '_save_cached_table', no_save)
+    filename = str(tmp_path / "input.tsv")
+    write_table(filename, range(10))
+    cache_dir = str(tmp_path / "cache")
+
+    dataframe = read_table(filename, cache_dir, cache_size=100)
+    assert dataframe.shape == (10, 2)
+    assert not os.path.exists(cache_dir) or os.listdir(cache_dir) == []
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+from pl_curve import run, run_batch, expand_inputs
+from pytest import raises
+import os
+
+
+def write_inputs(directory):
+    f = open(os.path.join(directory, "good.tsv"), "w")
+    f.write("Bin\tStep I\tStep II\n")
+    f.write("219\t0.5\t0.3\n")
+    f.write("218\t0.5\t0.7\n")
+    f.close()
+
+    f = open(os.path.join(directory, "bad.tsv"), "w")
+    f.write("Bin\tStep I\n")
+    f.write("219\t0.5\n")
+    f.close()
+
+
+def test_run_bad_columns(tmp_path):
+    '''run raises an error rather than exiting'''
+    write_inputs(str(tmp_path))
+    with raises(ValueError):
+        run(str(tmp_path / "bad.tsv"), str(tmp_path / "test.png"),
+            str(tmp_path / "test.tsv"))
+
+
+def test_expand_inputs(tmp_path):
+    '''directories and globs are expanded, earlier outputs are skipped'''
+    directory = str(tmp_path)
+    write_inputs(directory)
+    open(os.path.join(directory, "good.tsv.output.tsv"), "w").close()
+
+    good = os.path.join(directory, "good.tsv")
+    bad = os.path.join(directory, "bad.tsv")
+    assert expand_inputs([directory]) == [bad, good]
+    assert expand_inputs([os.path.join(directory, "g*.tsv")]) == [good]
+    assert expand_inputs(["missing.tsv"]) == ["missing.tsv"]
+
+
+def test_run_batch(tmp_path):
+    '''a failing file is reported without stopping the rest of the batch'''
+    directory = str(tmp_path)
+    write_inputs(directory)
+    bad = os.path.join(directory, "bad.tsv")
+    good = os.path.join(directory, "good.tsv")
+
+    results = run_batch([bad, good])
+
+    assert [r[0] for r in results] == [bad, good]
+    assert results[0][2] == ("columns don't sum to 1\n"
+                             "Step I: total 0.500000 (-0.500000), 0 missing, "
+                             "0 negative, invalid")
+    assert results[1][2] is None
+    assert os.path.isfile(good + ".output.tsv") is True
+    assert os.path.isfile(good + ".graph.png") is True
+    assert os.path.isfile(bad + ".output.tsv") is False
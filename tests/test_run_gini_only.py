@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+from pl_curve import run, run_gini_only
+from pytest import approx
+import subprocess
+import sys
+import os
+
+
+def write_input(filename):
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\n")
+    f.write("219\t0.5\t0.3\n")
+    f.write("220\t0.0\t0.0\n")
+    f.write("218\t0.5\t0.7\n")
+    f.close()
+
+
+def test_run_gini_only(tmp_path):
+    '''the numpy only path writes the same file as run'''
+    filename = str(tmp_path / "input.tsv")
+    write_input(filename)
+
+    samples, ginis, lengths = run_gini_only(filename,
+                                            str(tmp_path / "fast.tsv"))
+    run(filename, None, str(tmp_path / "full.tsv"))
+
+    assert samples == ['Step I', 'Step II']
+    assert ginis == approx([0.0, 0.2])
+    assert list(lengths) == [2, 2]
+    assert open(str(tmp_path / "fast.tsv")).read() == \
+        open(str(tmp_path / "full.tsv")).read()
+    # no graph was asked for
+    assert not any(f.endswith('.png') for f in os.listdir(str(tmp_path)))
+
+
+def test_import_is_lazy():
+    '''importing pl_curve shouldn't import pandas or matplotlib'''
+    code = ("import sys, pl_curve; "
+            "print('pandas' in sys.modules, 'matplotlib' in sys.modules)")
+    directory = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.check_output([sys.executable, "-c", code],
+                                     cwd=directory)
+    assert output.split() == [b'False', b'False']
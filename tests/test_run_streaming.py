@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+from pl_curve import run, scan_table, read_column_groups
+from pytest import approx
+import pandas
+import numpy as np
+import os
+
+
+def test_run_streaming():
+    '''a tiny memory budget forces one sample and one row per chunk'''
+    f = open("test-input.tsv", "w")
+    f.write("Bin\tStep I\tStep II\tStep III\n")
+    f.write("219\t0.5\t0.3\t0.4\n")
+    f.write("220\t0.0\t0.0\t0.0\n")
+    f.write("218\t0.5\t0.7\t0.6\n")
+    f.close()
+
+    # delete test.tsv if it already exists
+    try:
+        os.remove("test.tsv")
+    # catch the error if file doesn't exist
+    except FileNotFoundError as error:
+        pass
+
+    run("test-input.tsv", "test.png", "test.tsv", memory_budget=1)
+    assert os.path.isfile("test.tsv") is True
+    assert os.path.isfile("test.png") is True
+
+    data = pandas.read_csv("test.tsv", delimiter='\t', index_col=0)
+    assert list(data.index) == ['Step I', 'Step II', 'Step III']
+    assert data.loc['Step I', 'Gini'] == approx(0.0)
+    assert data.loc['Step II', 'Gini'] == approx(0.2)
+    assert data.loc['Step II', 'Corrected Gini'] == approx(0.4)
+    assert data.loc['Step III', 'Gini'] == approx(0.1)
+    # the empty bin is removed
+    assert data.loc['Step III', 'n'] == 2
+
+
+def test_read_column_groups(tmp_path):
+    '''the groups read from the spill file match the table'''
+    rng = np.random.default_rng(3)
+    values = rng.random((30, 7))
+    values[[4, 11]] = 0
+    dataframe = pandas.DataFrame(values, index=pandas.Index(range(30),
+                                                            name='Bin'),
+                                 columns=['S' + str(i) for i in range(7)])
+    input_file = str(tmp_path / "input.tsv")
+    dataframe.to_csv(input_file, sep='\t')
+    spill_file = str(tmp_path / "spill")
+
+    columns, report, bins, keep = scan_table(input_file, 200, spill_file)
+    assert len(bins) == 28
+    groups = list(read_column_groups(spill_file, 1000, columns, len(bins)))
+
+    assert len(groups) > 1
+    assert [name for group, _ in groups for name in group] == list(columns)
+    expected = pandas.read_csv(input_file, sep='\t',
+                               index_col='Bin').to_numpy()[keep]
+    assert (np.hstack([group for _, group in groups]) == expected).all()
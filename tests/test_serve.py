@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+'''
+tests for the server, using a local client only
+'''
+from pl_curve import GiniServer, parse_request_table
+from pytest import approx, fixture, raises
+import asyncio
+import http.client
+import json
+import threading
+import time
+
+
+TABLE = b"Bin\tStep I\tStep II\n219\t0.5\t0.3\n220\t0.0\t0.0\n218\t0.5\t0.7\n"
+
+
+@fixture
+def server():
+    '''a server running in another thread on a free port'''
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = GiniServer(port=0, workers=1, queue=0)
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(60)
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(60)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def request(server, method, path, body=None, headers={}):
+    connection = http.client.HTTPConnection('127.0.0.1', server.port,
+                                            timeout=60)
+    connection.request(method, path, body, headers)
+    response = connection.getresponse()
+    result = (response.status, dict(response.getheaders()), response.read())
+    connection.close()
+    return result
+
+
+def test_parse_request_table():
+    '''long format JSON gives the same table as TSV'''
+    samples, bins, values = parse_request_table(TABLE, 'text/plain')
+    records = [{'Sample': s, 'Bin': b, 'Abundance': values[i, j]}
+               for j, s in enumerate(samples) for i, b in enumerate(bins)]
+    json_samples, json_bins, json_values = parse_request_table(
+        json.dumps(records).encode(), 'application/json; charset=utf-8')
+    assert json_samples == samples == ['Step I', 'Step II']
+    assert list(json_bins) == list(bins)
+    assert (json_values == values).all()
+
+    with raises(ValueError):
+        parse_request_table(b'[{"Sample": "A"}]', 'application/json')
+
+
+def test_serve_gini(server):
+    status, headers, body = request(server, 'POST', '/gini?tolerance=0',
+                                    TABLE)
+    assert status == 200
+    assert 'compute;dur=' in headers['Server-Timing']
+    response = json.loads(body)
+    assert [s['sample'] for s in response['samples']] == ['Step I',
+                                                          'Step II']
+    step2 = response['samples'][1]
+    assert step2['gini'] == approx(0.2)
+    assert step2['corrected_gini'] == approx(0.4)
+    assert step2['n'] == 2
+    assert step2['curve']['Cum Rel Abund'] == approx([0.7, 1.0])
+    assert 'graph' not in response
+
+
+def test_serve_json_graph(server):
+    '''read counts in long format, normalised, with the graph'''
+    records = [{'Sample': 'A', 'Bin': '1', 'Abundance': 3},
+               {'Sample': 'A', 'Bin': '2', 'Abundance': 1}]
+    status, headers, body = request(
+        server, 'POST', '/gini?normalise=1&graph=1',
+        json.dumps(records), {'Content-Type': 'application/json'})
+    assert status == 200
+    response = json.loads(body)
+    assert response['samples'][0]['gini'] == approx(0.25)
+    assert response['graph'].startswith('iVBORw0KGgo')
+
+
+def test_serve_errors(server):
+    status, _, body = request(server, 'POST', '/gini',
+                              b"Bin\tA\n219\t0.5\n")
+    assert status == 400
+    assert json.loads(body)['error'].startswith("columns don't sum to 1")
+    assert request(server, 'GET', '/gini')[0] == 405
+    assert request(server, 'GET', '/missing')[0] == 404
+
+    status, _, body = request(server, 'POST', '/gini', None,
+                              {'Content-Length': '-5'})
+    assert status == 400
+    assert json.loads(body)['error'] == "Content-Length can't be negative"
+
+    status, _, body = request(server, 'GET', '/health')
+    assert json.loads(body) == {'workers': 1, 'running': 0, 'waiting': 0}
+
+
+def test_serve_busy(server):
+    '''requests are turned away once the workers and queue are full'''
+    server.running = 1
+    try:
+        status, headers, _ = request(server, 'POST', '/gini', TABLE)
+    finally:
+        server.running = 0
+    assert status == 503
+    assert headers['Retry-After'] == '1'
+    assert request(server, 'POST', '/gini', TABLE)[0] == 200
+
+
+def test_serve_busy_before_body(server):
+    '''a busy server answers without waiting for the body'''
+    server.running = 1
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.port,
+                                                timeout=10)
+        connection.putrequest('POST', '/gini')
+        connection.putheader('Content-Length', str(100 * 1024 * 1024))
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 503
+        connection.close()
+    finally:
+        server.running = 0
+
+
+def test_serve_timeout_keeps_slot(server):
+    '''a timed out request holds its worker until it has finished'''
+    rows = ["Bin\t" + "\t".join("S" + str(i) for i in range(300))]
+    for b in range(50):
+        rows.append(str(b) + "\t" + "\t".join(["0.02"] * 300))
+    server.timeout = 0.05
+    status, _, _ = request(server, 'POST', '/gini?graph=1&tolerance=0',
+                           "\n".join(rows).encode())
+    assert status == 504
+
+    _, _, body = request(server, 'GET', '/health')
+    assert json.loads(body)['running'] == 1
+    assert request(server, 'POST', '/gini', TABLE)[0] == 503
+
+    server.timeout = None
+    for _ in range(600):
+        _, _, body = request(server, 'GET', '/health')
+        if json.loads(body)['running'] == 0:
+            break
+        time.sleep(0.1)
+    assert request(server, 'POST', '/gini', TABLE)[0] == 200
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+'''
+unit tests for simplifying curves before graphing them
+'''
+from pl_curve import simplify_curve, simplify_samples
+import pandas
+import numpy as np
+
+
+def make_curve(n):
+    '''a lorenz curve with n bins from a power law'''
+    values = np.sort(np.random.default_rng(3).pareto(1.5, n))[::-1]
+    y = np.cumsum(values) / values.sum()
+    x = np.arange(1, n + 1) / n
+    return x, y
+
+
+def test_simplify_curve_tolerance():
+    '''every original point should be within tolerance of the new curve'''
+    x, y = make_curve(100000)
+
+    keep = simplify_curve(x, y, 0.001)
+
+    assert len(keep) < 1000
+    assert keep[0] == 0
+    assert keep[-1] == len(x) - 1
+    # the simplified curve is still monotone
+    assert np.all(np.diff(y[keep]) >= 0)
+    # distance of each point from the simplified segment it falls in
+    segment = np.searchsorted(x[keep], x, side='right').clip(1, len(keep) - 1)
+    x0, y0 = x[keep][segment - 1], y[keep][segment - 1]
+    x1, y1 = x[keep][segment], y[keep][segment]
+    distance = (np.abs((x1 - x0) * (y - y0) - (y1 - y0) * (x - x0)) /
+                np.hypot(x1 - x0, y1 - y0))
+    assert np.all(distance <= 0.001 + 1e-12)
+
+
+def test_simplify_curve_knee():
+    '''the knee is kept even when the tolerance is huge'''
+    x = np.array([0.25, 0.5, 0.75, 1.0])
+    y = np.array([0.7, 0.9, 0.95, 1.0])
+
+    keep = simplify_curve(x, y, 10)
+
+    assert list(keep) == [0, 1, 3]
+
+
+def test_simplify_samples():
+    '''None leaves the samples alone'''
+    x, y = make_curve(1000)
+    df = pandas.DataFrame({'Step I': np.diff(y, prepend=0),
+                           'Cum Rel Abund': y, 'Cum Prop TRFs': x})
+
+    assert simplify_samples([df], None)[0] is df
+    simplified = simplify_samples([df], 0.01)[0]
+    assert len(simplified) < len(df)
+    assert list(simplified.columns) == list(df.columns)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+'''
+unit tests for the sparse path through the pipeline
+'''
+from pl_curve import read_sparse_table, remove_sparse_zeros, sparse_report
+from pl_curve import read_long_table
+from pl_curve import process_sparse_samples, process_samples, remove_zeros
+from pl_curve import process_sparse_sample
+from pytest import approx
+import pandas
+import numpy as np
+
+
+def write_table(filename):
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\tStep III\n")
+    f.write("219\t0.5\t0.0\t0.2\n")
+    f.write("220\t0.0\t0.0\t0.0\n")
+    f.write("218\t0.5\t0.7\t0.0\n")
+    f.write("217\t0.0\t0.3\t0.7\n")
+    f.close()
+
+
+def test_read_sparse_table(tmp_path):
+    '''only the non-zero values are kept, grouped by sample'''
+    filename = str(tmp_path / "input.tsv")
+    write_table(filename)
+
+    table = read_sparse_table(filename, chunksize=2)
+
+    assert list(table.bins) == [219, 220, 218, 217]
+    assert list(table.samples) == ['Step I', 'Step II', 'Step III']
+    assert list(table.indptr) == [0, 2, 4, 6]
+    assert list(table.indices) == [0, 2, 2, 3, 0, 3]
+
+    report = sparse_report(table)
+    assert report.samples == ['Step I', 'Step II', 'Step III']
+    assert report.totals == approx([1.0, 1.0, 0.9])
+    assert list(report.nans) == [0, 0, 0]
+    assert list(report.negatives) == [0, 0, 0]
+
+
+def test_remove_sparse_zeros(tmp_path):
+    filename = str(tmp_path / "input.tsv")
+    write_table(filename)
+
+    table = remove_sparse_zeros(read_sparse_table(filename))
+
+    assert list(table.bins) == [219, 218, 217]
+    assert list(table.indices) == [0, 1, 1, 2, 0, 2]
+
+
+def test_process_sparse_samples(tmp_path):
+    '''gives the same samples as the dense version, including the zero bins
+    of a sample which never reaches 1'''
+    filename = str(tmp_path / "input.tsv")
+    write_table(filename)
+
+    table = remove_sparse_zeros(read_sparse_table(filename))
+    samples, ginis = process_sparse_samples(table)
+
+    dataframe = remove_zeros(pandas.read_csv(filename, delimiter='\t',
+                                             index_col='Bin'))
+    dense_samples, dense_ginis = process_samples(dataframe)
+
+    assert len(samples[2]) == 3
+    assert ginis == approx(dense_ginis)
+    for sample, dense in zip(samples, dense_samples):
+        pandas.testing.assert_frame_equal(sample, dense)
+
+
+def test_read_long_table(tmp_path):
+    '''long format gives the same table as the wide one, repeated records
+    are added together and zeros are skipped'''
+    filename = str(tmp_path / "input.csv")
+    f = open(filename, "w")
+    f.write("Sample,Bin,Abundance\n")
+    f.write("Step I,219,0.5\n")
+    f.write("Step II,218,0.7\n")
+    f.write("Step I,218,0.5\n")
+    f.write("Step III,219,0.2\n")
+    f.write("Step II,217,0.2\n")
+    f.write("Step I,220,0.0\n")
+    f.write("Step III,217,0.7\n")
+    f.write("Step II,217,0.1\n")
+    f.close()
+
+    table = read_long_table(filename, chunksize=3)
+
+    assert list(table.bins) == ['219', '218', '217']
+    assert list(table.samples) == ['Step I', 'Step II', 'Step III']
+    assert list(table.indptr) == [0, 2, 4, 6]
+    assert list(table.indices) == [0, 1, 1, 2, 0, 2]
+    assert table.data == approx([0.5, 0.5, 0.7, 0.3, 0.2, 0.7])
+
+
+def test_read_long_table_mixed_chunks(tmp_path):
+    '''a numeric looking name is the same in chunks of different types'''
+    filename = str(tmp_path / "input.csv")
+    with open(filename, "w") as f:
+        f.write("Sample,Bin,Abundance\n"
+                "1,219,0.5\n"
+                "1,220,0.5\n"
+                "1,x1,0.25\n"
+                "A,219,0.75\n")
+
+    table = read_long_table(filename, chunksize=2)
+
+    assert list(table.bins) == ['219', '220', 'x1']
+    assert list(table.samples) == ['1', 'A']
+    assert list(table.indptr) == [0, 3, 4]
+    assert list(table.indices) == [0, 1, 2, 0]
+    assert table.data == approx([0.5, 0.5, 0.25, 0.75])
+
+def test_process_sparse_sample_reaches_one(monkeypatch):
+    '''a sample reaching 1 on its last value isn't padded with its zeros'''
+    def no_padding(*args, **kwargs):
+        raise AssertionError("the zero bins were added")
+    monkeypatch.setattr(np, 'setdiff1d', no_padding)
+
+    # ten values of 0.1 only add up to 0.9999999999999999
+    values, rows, cumulative = process_sparse_sample(
+        np.arange(0, 20, 2), np.full(10, 0.1), 10 ** 12)
+
+    assert len(values) == 10
+    assert cumulative[-1] == approx(1)
+    assert sorted(rows) == list(range(0, 20, 2))
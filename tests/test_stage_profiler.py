@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+from pl_curve import run, StageProfiler, _NullProfiler
+import json
+import tracemalloc
+
+
+def test_stage_profiler(tmp_path):
+    '''each stage of run is written as a JSON line'''
+    filename = str(tmp_path / "input.tsv")
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\n")
+    f.write("219\t0.5\t0.3\n")
+    f.write("220\t0.0\t0.0\n")
+    f.write("218\t0.5\t0.7\n")
+    f.close()
+
+    profile = str(tmp_path / "profile.jsonl")
+    profiler = StageProfiler(profile, trace_allocations=True)
+    run(filename, str(tmp_path / "test.png"), str(tmp_path / "test.tsv"),
+        profiler=profiler)
+
+    records = [json.loads(line) for line in open(profile)]
+    assert records == profiler.records
+    assert [r['stage'] for r in records] == [
+        'read_table', 'check_columns', 'remove_zeros', 'process_samples',
+        'make_graph', 'make_gini_file']
+    for record in records:
+        assert record['file'] == filename
+        assert record['wall_time'] >= 0
+        assert record['cpu_time'] >= 0
+        assert 'peak_allocated' in record
+    # tracing is switched off again once the run is over
+    assert not tracemalloc.is_tracing()
+
+    assert records[0]['bins'] == 3
+    assert records[0]['nonzeros'] == 4
+    assert records[1]['bins'] == 3
+    # later stages get the table without the empty bin
+    for record in records[2:]:
+        assert record['bins'] == 2
+        assert record['samples'] == 2
+        assert record['nonzeros'] == 4
+
+
+def test_stage_profiler_sparse(tmp_path):
+    '''the sparse path records its own stages with sizes'''
+    filename = str(tmp_path / "input.tsv")
+    with open(filename, "w") as f:
+        f.write("Bin\tStep I\tStep II\n")
+        f.write("219\t0.5\t0.3\n")
+        f.write("220\t0.0\t0.0\n")
+        f.write("218\t0.5\t0.7\n")
+
+    profiler = StageProfiler(str(tmp_path / "profile.jsonl"))
+    run(filename, None, str(tmp_path / "test.tsv"), sparse=True,
+        profiler=profiler)
+
+    records = profiler.records
+    assert [r['stage'] for r in records] == [
+        'read_table', 'check_columns', 'remove_zeros', 'process_samples',
+        'make_gini_file']
+    assert records[0]['bins'] == 3
+    for record in records:
+        assert record['samples'] == 2
+        assert record['nonzeros'] == 4
+    assert records[-1]['bins'] == 2
+
+
+def test_stage_profiler_streaming(tmp_path):
+    '''the streaming path records a stage for each group of columns'''
+    filename = str(tmp_path / "input.tsv")
+    with open(filename, "w") as f:
+        f.write("Bin\tStep I\tStep II\n")
+        f.write("219\t0.5\t0.3\n")
+        f.write("220\t0.0\t0.0\n")
+        f.write("218\t0.5\t0.7\n")
+
+    profiler = StageProfiler(str(tmp_path / "profile.jsonl"))
+    # only room for one column of two bins at a time
+    run(filename, str(tmp_path / "test.png"), str(tmp_path / "test.tsv"),
+        memory_budget=16, curve_file=str(tmp_path / "curves.tsv"),
+        profiler=profiler)
+
+    records = profiler.records
+    assert [r['stage'] for r in records] == [
+        'read_table', 'process_samples', 'process_samples', 'make_graph',
+        'make_gini_file', 'make_curve_file']
+    assert [r.get('group') for r in records[1:3]] == [0, 1]
+    for record in records[1:3]:
+        assert record['bins'] == 2
+        assert record['samples'] == 1
+        assert record['nonzeros'] == 2
+    for record in records[:1] + records[3:]:
+        assert record['bins'] == 2
+        assert record['samples'] == 2
+
+
+def test_null_profiler_records(tmp_path):
+    '''runs without a profiler don't share a record between them'''
+    filename = str(tmp_path / "input.tsv")
+    with open(filename, "w") as f:
+        f.write("Bin\tStep I\n219\t0.5\n218\t0.5\n")
+    run(filename, None, str(tmp_path / "test.tsv"),
+        result_cache=str(tmp_path / "results"))
+
+    with _NullProfiler().stage('stage') as record:
+        assert record == {}
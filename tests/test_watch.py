@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+'''
+tests for watching a directory for new tables
+'''
+from pl_curve import watch, load_watch_state, WATCH_STATE
+import os
+
+
+def write(filename, text):
+    f = open(filename, "w")
+    f.write(text)
+    f.close()
+
+
+def test_watch(tmp_path):
+    '''only new or changed tables are run, even after restarting'''
+    directory = str(tmp_path)
+    good = os.path.join(directory, "good.tsv")
+    bad = os.path.join(directory, "bad.tsv")
+    write(good, "Bin\tStep I\n219\t0.5\n218\t0.5\n")
+    write(bad, "Bin\tStep I\n219\t0.5\n")
+    write(os.path.join(directory, ".hidden.tsv"), "not a table")
+
+    results = watch(directory, interval=0.01, settle=0, graph=False,
+                    once=True)
+    assert sorted((f, error is None) for f, _, error in results) == [
+        (bad, False), (good, True)]
+    assert os.path.isfile(good + ".output.tsv")
+
+    state = load_watch_state(os.path.join(directory, WATCH_STATE))
+    assert sorted(state) == [bad, good]
+    assert state[bad]['error'].startswith("columns don't sum to 1")
+
+    # touching a file without changing it doesn't run it again
+    os.utime(good, ns=(0, 0))
+    assert watch(directory, interval=0.01, settle=0, graph=False,
+                 once=True) == []
+
+    # fixing a file does, and files which have gone are forgotten
+    write(bad, "Bin\tStep I\n219\t1.0\n")
+    os.remove(good)
+    results = watch(directory, interval=0.01, settle=0, graph=False,
+                    once=True)
+    assert [(f, error) for f, _, error in results] == [(bad, None)]
+    state = load_watch_state(os.path.join(directory, WATCH_STATE))
+    assert sorted(state) == [bad]
+
+
+def test_watch_state_file(tmp_path):
+    '''the state can be kept outside the watched directory'''
+    directory = str(tmp_path / "in")
+    os.mkdir(directory)
+    state_file = str(tmp_path / "state.json")
+    write(os.path.join(directory, "good.tsv"), "Bin\tA\n219\t1.0\n")
+
+    results = watch(directory, state_file, workers=2, interval=0.01,
+                    settle=0, graph=False, once=True)
+    assert len(results) == 1
+    assert os.path.isfile(state_file)
+    assert not os.path.exists(os.path.join(directory, WATCH_STATE))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+'''
+unit tests for saving results and curves in different file formats
+'''
+from pl_curve import (make_gini_dataframe, make_curve_dataframe, write_table,
+                      guess_output_format, run)
+from pytest import approx, importorskip, raises
+import numpy as np
+import pandas
+
+
+def make_samples():
+    df1 = pandas.DataFrame({'Step I': [0.5, 0.5],
+                            'Cum Prop TRFs': [0.5, 1.0],
+                            'Cum Rel Abund': [0.5, 1.0]}, index=['219', '218'])
+    df2 = pandas.DataFrame({'Step II': [0.75, 0.25],
+                            'Cum Prop TRFs': [0.5, 1.0],
+                            'Cum Rel Abund': [0.75, 1.0]},
+                           index=['218', '219'])
+    df3 = pandas.DataFrame({'Step III': [1.0], 'Cum Prop TRFs': [1.0],
+                            'Cum Rel Abund': [1.0]}, index=['219'])
+    return [df1, df2, df3]
+
+
+def test_make_gini_dataframe_types():
+    '''the columns hold numbers rather than formatted strings'''
+    gini_dataframe = make_gini_dataframe(make_samples())
+    assert list(gini_dataframe.index) == ['Step I', 'Step II', 'Step III']
+    assert gini_dataframe.dtypes['Gini'] == np.float64
+    assert gini_dataframe.dtypes['n'] == np.int64
+    assert list(gini_dataframe['Gini']) == approx([0.0, 0.25, 0.0])
+    # a single bin can't be corrected
+    assert list(gini_dataframe['Corrected Gini'][:2]) == approx([0.0, 0.5])
+    assert np.isnan(gini_dataframe.loc['Step III', 'Corrected Gini'])
+
+
+def test_guess_output_format():
+    assert guess_output_format('out.tsv') == 'tsv'
+    assert guess_output_format('out.txt') == 'tsv'
+    assert guess_output_format('out.PARQUET') == 'parquet'
+    assert guess_output_format('out.feather') == 'feather'
+    assert guess_output_format('out.json') == 'jsonl'
+
+
+def test_write_table(tmp_path):
+    '''TSV keeps the old number format, JSON lines keeps full precision'''
+    gini_dataframe = make_gini_dataframe(make_samples()[:2], ginis=[0.1, 1/3])
+
+    write_table(gini_dataframe, str(tmp_path / "out.tsv"), float_format='%f')
+    assert open(str(tmp_path / "out.tsv")).read().split('\n')[:3] == [
+        '\tGini\tCorrected Gini\tn',
+        'Step I\t0.100000\t0.200000\t2',
+        'Step II\t0.333333\t0.666667\t2']
+
+    write_table(gini_dataframe, str(tmp_path / "out.jsonl"))
+    lines = pandas.read_json(str(tmp_path / "out.jsonl"), lines=True)
+    assert list(lines['Sample']) == ['Step I', 'Step II']
+    assert list(lines['Gini']) == approx([0.1, 1/3], abs=1e-15)
+    assert list(lines['n']) == [2, 2]
+
+    with raises(ValueError):
+        write_table(gini_dataframe, str(tmp_path / "out"), 'xml')
+
+
+def test_write_table_parquet(tmp_path):
+    importorskip('pyarrow')
+    gini_dataframe = make_gini_dataframe(make_samples())
+    write_table(gini_dataframe, str(tmp_path / "out.parquet"))
+    read = pandas.read_parquet(str(tmp_path / "out.parquet"))
+    assert list(read['Sample']) == ['Step I', 'Step II', 'Step III']
+    assert read['n'].dtype == np.int64
+
+
+def test_make_curve_dataframe():
+    '''one row per point, with the sample names stored once'''
+    curves = make_curve_dataframe(make_samples())
+    assert list(curves.columns) == ['Sample', 'Cum Prop TRFs',
+                                    'Cum Rel Abund']
+    assert curves['Sample'].dtype == 'category'
+    assert list(curves['Sample']) == ['Step I', 'Step I', 'Step II',
+                                      'Step II', 'Step III']
+    assert list(curves['Cum Rel Abund']) == [0.5, 1.0, 0.75, 1.0, 1.0]
+
+
+def test_run_curve_file(tmp_path):
+    '''every path saves the same curves'''
+    filename = str(tmp_path / "input.tsv")
+    f = open(filename, "w")
+    f.write("Bin\tStep I\tStep II\n")
+    f.write("219\t0.5\t0.3\n")
+    f.write("220\t0.0\t0.0\n")
+    f.write("218\t0.5\t0.7\n")
+    f.close()
+
+    curves = []
+    for options in [{}, {'memory_budget': 100}, {'sparse': True}]:
+        curve_file = str(tmp_path / "curves.tsv")
+        run(filename, None, str(tmp_path / "out.jsonl"), curve_file=curve_file,
+            **options)
+        curves.append(open(curve_file).read())
+        assert len(pandas.read_json(str(tmp_path / "out.jsonl"),
+                                    lines=True)) == 2
+    assert curves[0] == curves[1] == curves[2]
+    assert curves[0].split('\n')[:2] == ['Sample\tCum Prop TRFs\tCum Rel Abund',
+                                         'Step I\t0.5\t0.5']